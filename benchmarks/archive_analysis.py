@@ -0,0 +1,109 @@
+"""
+Archive analysis scaling benchmark.
+
+Writes a synthetic archive of month worksheets exported as CSV, the
+way `run.py analyze` reads them, then times analyze_archives with one
+worker and with pools of increasing size, and checks every run gets
+the same totals as the exact decimal sum of the rows written. Fails if
+a total is wrong.
+
+    python benchmarks/archive_analysis.py --years 10 --rows-per-month 50000
+"""
+
+import os
+import sys
+import csv
+import random
+import argparse
+import tempfile
+from time import monotonic
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable-next=wrong-import-position
+import run  # noqa: E402
+
+HEADER = ["Date", "Details", "Invoice Number", "Total", "VAT 23%",
+          "VAT 13.5%", "VAT 9%", "VAT", "Exempt"]
+
+
+def write_archive(directory, years, rows_per_month, seed=1):
+    """Writes a synthetic archive of both ledgers
+
+    Returns: the exact total of the Total column in cents.
+    """
+
+    generator = random.Random(seed)
+    exact_total = Decimal(0)
+    first_year = 2026 - years
+
+    for sheet, ledger in run.LEDGER_NAMES.items():
+        for year in range(first_year, first_year + years):
+            for month_number, month in enumerate(run.MONTHS, 1):
+                path = os.path.join(directory,
+                                    f"{ledger}_{year} - {month}.csv")
+                with open(path, "w", newline="",
+                          encoding="utf-8") as archive_file:
+                    writer = csv.writer(archive_file)
+                    writer.writerow(HEADER)
+                    for invoice_number in range(1, rows_per_month + 1):
+                        total = Decimal(generator.randint(1, 500000)) / 100
+                        vat = round(total * Decimal("0.23"), 2)
+                        writer.writerow([
+                            f"{month_number:02d}/01/{year}",
+                            f"{sheet} {invoice_number}", invoice_number,
+                            total, vat, 0, 0, vat, 0])
+                        exact_total += total
+
+    return int(exact_total * 100)
+
+
+def main():
+    """Runs the benchmark
+
+    Exits with an error if any run's total is off by a cent or more.
+    """
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--rows-per-month", type=int, default=20000)
+    parser.add_argument("--max-workers", type=int,
+                        default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        exact_total = write_archive(directory, args.years,
+                                    args.rows_per_month)
+        rows = args.years * 12 * args.rows_per_month * len(run.LEDGER_NAMES)
+        print(f"{rows} rows in {args.years * 12 * len(run.LEDGER_NAMES)} " +
+              f"files, {os.cpu_count()} CPUs")
+        print(f"{'workers':<10} {'seconds':>8} {'rows/s':>12} "
+              f"{'speed up':>9}")
+
+        failed = False
+        single_worker = None
+
+        for workers in range(1, args.max_workers + 1):
+            started = monotonic()
+            analysis = run.analyze_archives(directory, workers)
+            elapsed = monotonic() - started
+            single_worker = single_worker or elapsed
+
+            total = sum(totals["cents"][0]
+                        for years in analysis["years"].values()
+                        for totals in years.values())
+            print(f"{workers:<10} {elapsed:>8.2f} {rows / elapsed:>12.0f} "
+                  f"{single_worker / elapsed:>8.2f}x")
+
+            if total != exact_total or analysis["rows"] != rows:
+                print(f"FAIL: {analysis['rows']} rows totalling {total} " +
+                      f"cents, expected {rows} totalling {exact_total}")
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Start up import budget check.
+
+Imports run.py in a fresh interpreter with `-X importtime` a few times
+and fails if the median import takes longer than the budget, or if any
+of the libraries run.py defers until they're needed was imported at
+start up.
+
+    python benchmarks/import_budget.py --budget-ms 50
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# milliseconds `import run` may take, with run.py already compiled
+DEFAULT_BUDGET_MS = 50
+# imported on first use by run.py, so must not be imported at start up
+DEFERRED_MODULES = ["gspread", "google.auth", "google.oauth2", "requests",
+                    "art", "google_client", "fake_sheets", "sqlite3",
+                    "csv", "concurrent.futures"]
+
+
+def measure_import():
+    """Imports run.py in a new interpreter
+
+    Returns: a list of (module, self_us, cumulative_us) tuples for run
+    and every module importing it pulled in, with run last.
+    """
+
+    env = dict(os.environ)
+    # bytecode is cached on a real deployment, only compiling once
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import run"],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split(
+            "|")
+        # modules are listed after everything they import, nested ones
+        # indented, so run's own imports are those since the last
+        # top level module before it
+        if not module.startswith("  "):
+            if module.strip() == "run":
+                imports.append(("run", int(self_us), int(cumulative_us)))
+                return imports
+            imports = []
+            continue
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+
+    raise RuntimeError(result.stderr)
+
+
+def main():
+    """Runs the check
+
+    Exits with an error if the budget is exceeded or a deferred module
+    was imported.
+    """
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # the first run compiles anything out of date
+    measure_import()
+    runs = [measure_import() for _ in range(args.runs)]
+
+    totals = [imports[-1][2] / 1000 for imports in runs]
+    median_ms = statistics.median(totals)
+
+    slowest = sorted(runs[-1], key=lambda item: item[1], reverse=True)[:10]
+    print(f"{'module':<40} {'self ms':>8} {'cumulative ms':>14}")
+    for module, self_us, cumulative_us in slowest:
+        print(f"{module:<40} {self_us / 1000:>8.1f} "
+              f"{cumulative_us / 1000:>14.1f}")
+
+    imported = {module for module, _, _ in runs[-1]}
+    deferred = [module for module in DEFERRED_MODULES if module in imported]
+    failed = False
+
+    print(f"\nimport run: median {median_ms:.1f}ms over {args.runs} runs " +
+          f"(budget {args.budget_ms:.0f}ms)")
+    if median_ms > args.budget_ms:
+        print("FAIL: over budget")
+        failed = True
+
+    if deferred:
+        print(f"FAIL: imported at start up: {', '.join(deferred)}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Money column parsing benchmark.
+
+Times run.sum_money_column against the list comprehension the totals
+used to be worked out with, `sum([float(total) for total in column])`,
+on columns of sheet values, and checks the totals are exact to the
+cent. Fails if a total is wrong.
+
+    python benchmarks/money_columns.py --cells 100000
+"""
+
+import os
+import sys
+import random
+import argparse
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable-next=wrong-import-position
+import run  # noqa: E402
+
+# share of cells in the dirty column that are each kind of awkward value
+DIRTY_VALUES = ["", "€1,234.50", "1.234,50", "n/a", "(12.00)"]
+DIRTY_SHARE = 0.01
+
+
+def get_columns(cells, seed=1):
+    """Builds the columns to parse
+
+    Returns: a tuple of (clean, dirty) lists of sheet values, the clean
+    one plain two decimal amounts as Google formats them.
+    """
+
+    generator = random.Random(seed)
+    clean = [f"{generator.randint(0, 500000) / 100:g}" for _ in range(cells)]
+
+    dirty = list(clean)
+    dirty_cells = int(cells * DIRTY_SHARE * len(DIRTY_VALUES))
+    for index in generator.sample(range(cells), dirty_cells):
+        dirty[index] = generator.choice(DIRTY_VALUES)
+
+    return (clean, dirty)
+
+
+def get_exact_cents(column):
+    """Adds up a column of plain amounts with decimal arithmetic
+
+    Returns: the total in cents.
+    """
+
+    return int(sum(Decimal(value) for value in column) * 100)
+
+
+def time_call(function, repeat):
+    """Times a function, keeping the best of several runs
+
+    Returns: the time in milliseconds, or None if it raised ValueError.
+    """
+
+    try:
+        function()
+    except ValueError:
+        return None
+
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    """Runs the benchmark
+
+    Exits with an error if the parsed total of the clean column is off
+    by a cent or more.
+    """
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--cells", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    clean, dirty = get_columns(args.cells)
+
+    timings = [
+        ("list comprehension, clean",
+         time_call(lambda: sum([float(total) for total in clean]),
+                   args.repeat)),
+        ("list comprehension, dirty",
+         time_call(lambda: sum([float(total) for total in dirty]),
+                   args.repeat)),
+        ("sum_money_column, clean",
+         time_call(lambda: run.sum_money_column(clean), args.repeat)),
+        ("sum_money_column, dirty",
+         time_call(lambda: run.sum_money_column(dirty), args.repeat)),
+    ]
+
+    print(f"{args.cells} cells, best of {args.repeat} runs")
+    print(f"{'approach':<30} {'ms':>8}")
+    for name, milliseconds in timings:
+        result = "ValueError" if milliseconds is None else \
+            f"{milliseconds:.1f}"
+        print(f"{name:<30} {result:>8}")
+
+    total_cents, bad_cells = run.sum_money_column(clean)
+    exact_cents = get_exact_cents(clean)
+    _, dirty_bad_cells = run.sum_money_column(dirty)
+
+    print(f"\nclean total {total_cents} cents, exact {exact_cents} cents")
+    print(f"dirty column: {len(dirty_bad_cells)} cells reported, " +
+          f"e.g. {dirty_bad_cells[:3]}")
+
+    if total_cents != exact_cents or bad_cells:
+        print("FAIL: clean column total is wrong")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Pure function benchmark suite with stored baselines.
+
+Times the functions run.py spends its CPU time in once a ledger is
+local, on synthetic ledgers of increasing size, and measures the peak
+memory each allocates. Results are compared with the baselines kept in
+benchmarks/baselines/pure_functions.json, failing if throughput drops
+or peak memory grows by more than the threshold. Shared machines run
+faster and slower by more than that from one second to the next, so
+each run is timed against a fixed reference loop run just before it,
+and a benchmark that regresses is run again and only fails if it
+regresses a second time. Baselines are machine specific, so record
+them again with --update-baseline after moving to a different machine
+or making something deliberately slower.
+
+    python benchmarks/pure_functions.py
+    python benchmarks/pure_functions.py --max-rows 100000 --threshold 0.5
+    python benchmarks/pure_functions.py --update-baseline
+"""
+
+import os
+import sys
+import json
+import statistics
+import random
+import platform
+import argparse
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable-next=wrong-import-position
+import run  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "baselines", "pure_functions.json")
+SIZES = [100, 10000, 100000, 1000000]
+# allowed drop in throughput and growth in peak memory, as a fraction
+DEFAULT_THRESHOLD = 0.3
+# peak memory differences below this many KiB are never a regression,
+# as small runs are dominated by the interpreter's own allocations
+MEMORY_SLACK_KIB = 64
+# size of the reference loop, about 40ms
+REFERENCE_LOOPS = 200000
+HEADER = ["Date", "Details", "Invoice Number", "Total", "VAT 23%",
+          "VAT 13.5%", "VAT 9%", "VAT", "Exempt"]
+DETAILS = ["Supplies", "Stock", "Fuel", "Rent", "Consulting", "Repairs",
+           "Cleaning", "Electricity", "Catering", "Livestock"]
+RATES = ["23", "13.5", "9", "4.8", "0"]
+
+
+def get_ledger(rows, seed=1):
+    """Builds a synthetic month of a ledger
+
+    Returns: a list of rows as the Sheets API returns them, header
+    first, with the VAT worked out for each.
+    """
+
+    generator = random.Random(seed)
+    ledger = [list(HEADER)]
+
+    for invoice_number in range(1, rows + 1):
+        total = generator.randint(1, 500000) / 100
+        rate = generator.choice(RATES)
+        details = " ".join(generator.sample(DETAILS,
+                                            generator.randint(1, 3)))
+        ledger.append(run.get_sheet_cells(
+            [f"10/{generator.randint(1, 28):02d}/2026", details,
+             invoice_number, total] + run.calculate_vat(total, rate)))
+
+    return ledger
+
+
+def get_month_totals(ledger):
+    """Adds up each summed column of a month, as the totals do"""
+
+    return [run.sum_money_column([row[column - 1] for row in ledger[1:]])
+            for column in run.Columns.summed]
+
+
+def get_benchmarks():
+    """Lists the benchmarks
+
+    Returns: a list of (name, function, prepare) tuples, prepare
+    turning a synthetic ledger into the function's argument.
+    """
+
+    return [
+        ("calculate_vat", run.calculate_vat,
+         lambda ledger: [(row[run.Columns.total - 1], rate)
+                         for row, rate in zip(ledger[1:], get_row_rates(
+                             ledger))]),
+        ("get_length_of_longest_list_item",
+         run.get_length_of_longest_list_item,
+         lambda ledger: [row[run.Columns.details - 1] for row in ledger]),
+        ("format_month_table", run.format_month_table,
+         lambda ledger: ledger),
+        ("month totals (sum_money_column)", get_month_totals,
+         lambda ledger: ledger),
+    ]
+
+
+def get_row_rates(ledger):
+    """Finds the rate each synthetic row was entered at
+
+    Returns: a list of rates, one for each row after the header.
+    """
+
+    rates = run.get_vat_rates()
+
+    return [rates.get(run.get_row_vat_band(row), "0") for row in ledger[1:]]
+
+
+def run_reference():
+    """Runs the reference loop benchmarks are timed against"""
+
+    return sum(len(str(number)) for number in range(REFERENCE_LOOPS))
+
+
+def run_benchmark(function, argument, is_pairs, repeat):
+    """Times a function and measures its peak memory
+
+    Returns: a tuple of (seconds, relative, peak_kib), the median time
+    of several runs, the median of each run's time divided by the
+    reference loop's just before it, and the most memory allocated at
+    once during one run.
+    """
+
+    if is_pairs:
+        def call():
+            for total, rate in argument:
+                function(total, rate)
+    else:
+        def call():
+            function(argument)
+
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    reference_timer = timeit.Timer(run_reference)
+    times = []
+    relative_times = []
+
+    for _ in range(repeat):
+        reference = reference_timer.timeit(number=1)
+        times.append(timer.timeit(number=number) / number)
+        relative_times.append(times[-1] / reference)
+
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (statistics.median(times), statistics.median(relative_times),
+            peak / 1024)
+
+
+def get_result(function, argument, is_pairs, repeat, size):
+    """Benchmarks a function on a ledger of the given size
+
+    Returns: a dict of the rows_per_second, rows_per_reference, the
+    rows done in the time the reference loop takes, and peak_kib, as
+    they are stored in the baselines.
+    """
+
+    seconds, relative, peak_kib = run_benchmark(function, argument,
+                                                is_pairs, repeat)
+
+    return {"rows_per_second": round(size / seconds),
+            "rows_per_reference": round(size / relative, 1),
+            "peak_kib": round(peak_kib, 1)}
+
+
+def load_baselines():
+    """Loads the stored baselines
+
+    Returns: the baselines, with an empty "results" if none are stored.
+    """
+
+    try:
+        with open(BASELINE_FILE, encoding="utf-8") as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {"results": {}}
+
+
+def get_regressions(result, baseline, threshold):
+    """Compares a result with its baseline
+
+    Returns: a list of what regressed, empty if nothing did.
+    """
+
+    regressions = []
+
+    if result["rows_per_reference"] < \
+            baseline["rows_per_reference"] * (1 - threshold):
+        regressions.append("throughput")
+    if result["peak_kib"] > baseline["peak_kib"] * (1 + threshold) + \
+            MEMORY_SLACK_KIB:
+        regressions.append("memory")
+
+    return regressions
+
+
+def main():
+    """Runs the benchmarks
+
+    Exits with an error if any result regressed beyond the threshold
+    from its baseline.
+    """
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--max-rows", type=int, default=SIZES[-1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baselines = load_baselines()
+    machine = f"{platform.machine()} {platform.python_implementation()} " + \
+        platform.python_version()
+    if baselines["results"] and baselines.get("machine") != machine:
+        print(f"Baselines were recorded on {baselines.get('machine')}, " +
+              f"this is {machine}")
+
+    print(f"{'function':<34} {'rows':>8} {'rows/s':>12} {'baseline':>12} "
+          f"{'change':>8} {'peak KiB':>10} {'baseline':>10}  result")
+
+    failed = []
+
+    for size in [size for size in SIZES if size <= args.max_rows]:
+        ledger = get_ledger(size)
+
+        for name, function, prepare in get_benchmarks():
+            argument = prepare(ledger)
+            result = get_result(function, argument, name == "calculate_vat",
+                                args.repeat, size)
+            baseline = baselines["results"].get(name, {}).get(str(size))
+
+            if args.update_baseline:
+                baselines["results"].setdefault(name, {})[str(size)] = result
+                status = "saved"
+            elif baseline is None:
+                status = "no baseline"
+            else:
+                regressions = get_regressions(result, baseline,
+                                              args.threshold)
+                status = "ok"
+                if regressions:
+                    result = get_result(function, argument,
+                                        name == "calculate_vat",
+                                        args.repeat, size)
+                    regressions = get_regressions(result, baseline,
+                                                  args.threshold)
+                    status = "ok on re-run"
+                if regressions:
+                    status = f"FAIL {', '.join(regressions)}"
+                    failed.append(f"{name} at {size} rows")
+
+            # the change in speed relative to the reference loop, as
+            # compared with the threshold
+            change = "-"
+            if baseline:
+                speed = result["rows_per_reference"] / \
+                    baseline["rows_per_reference"]
+                change = f"{speed - 1:+.0%}"
+            print(f"{name:<34} {size:>8} {result['rows_per_second']:>12} "
+                  f"{baseline['rows_per_second'] if baseline else '-':>12} "
+                  f"{change:>8} {result['peak_kib']:>10} "
+                  f"{baseline['peak_kib'] if baseline else '-':>10}  "
+                  f"{status}")
+
+    if args.update_baseline:
+        baselines["machine"] = machine
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as baseline_file:
+            json.dump(baselines, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"\nBaselines saved to {BASELINE_FILE}")
+
+    if failed:
+        print(f"\nFAIL: regressed beyond {args.threshold:.0%}: " +
+              ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,43 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const { spawn } = require('child_process');
+
+// Set VCA_PREFORK to a number of workers to keep run.py pre-imported in
+// a zygote process, sessions then attach to a waiting worker instead of
+// cold-starting Python (see zygote.py)
+const PREFORK_WORKERS = parseInt(process.env.VCA_PREFORK) || 0;
+const ZYGOTE_SOCKET = path.join(os.tmpdir(), `vca-zygote-${process.pid}.sock`);
+
+// Terminal output is held for up to VCA_COALESCE_MS milliseconds, or
+// until COALESCE_BYTES have built up, and sent as one websocket frame
+// rather than a frame per write. 0 sends every write straight away.
+const COALESCE_MS = process.env.VCA_COALESCE_MS != null ? parseInt(process.env.VCA_COALESCE_MS) : 10;
+const COALESCE_BYTES = 32768;
+// run.py buffers its output to match unless VCA_BUFFERED_OUTPUT is 0
+const SESSION_ENV = {
+    ...process.env,
+    VCA_BUFFERED_OUTPUT: process.env.VCA_BUFFERED_OUTPUT || (COALESCE_MS ? '1' : '0')
+};
+
+// bytes of header the server adds to a text frame of a given length
+function getFrameOverhead(length) {
+    return length < 126 ? 2 : length < 65536 ? 4 : 10;
+}
+
+if (PREFORK_WORKERS) {
+    // the zygote exits when its stdin closes, i.e. when this server does
+    const zygote = spawn('python3', ['zygote.py', 'serve', ZYGOTE_SOCKET, '--workers', String(PREFORK_WORKERS)], {
+        cwd: process.env.PWD,
+        env: process.env,
+        stdio: ['pipe', 'inherit', 'inherit']
+    });
+
+    zygote.on('exit', function (code) {
+        console.log("Zygote exited with code " + code + ", sessions will start run.py directly");
+    });
+}
 
 exports.install = function () {
 
@@ -15,28 +53,79 @@ function socket() {
 
     this.on('open', function (client) {
 
-        // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
+        // Spawn terminal, connect mode runs run.py directly if the
+        // zygote isn't listening
+        const command = PREFORK_WORKERS ? ['-S', 'zygote.py', 'connect', ZYGOTE_SOCKET] : ['run.py'];
+
+        client.tty = Pty.spawn('python3', command, {
             name: 'xterm-color',
             cols: 190,
             rows: 64,
             cwd: process.env.PWD,
-            env: process.env
+            env: SESSION_ENV
         });
 
+        // writes from the terminal, the frames they were sent in and
+        // the header bytes each way would have cost
+        const stats = { writes: 0, frames: 0, bytes: 0, overhead: 0, unbatchedOverhead: 0 };
+        let pending = '';
+        let flushTimer = null;
+        let stopped = false;
+
+        function flush() {
+            clearTimeout(flushTimer);
+            flushTimer = null;
+            if (!pending || stopped) {
+                return;
+            }
+            const length = Buffer.byteLength(pending);
+            stats.frames += 1;
+            stats.bytes += length;
+            stats.overhead += getFrameOverhead(length);
+            client.send(pending);
+            pending = '';
+        }
+
+        // called once the socket has closed, output still held or
+        // written after that has nowhere to go
+        client.stopOutput = function () {
+            stopped = true;
+            clearTimeout(flushTimer);
+            flushTimer = null;
+            pending = '';
+        };
+
         client.tty.on('exit', function (code, signal) {
+            flush();
             client.tty = null;
-            client.close();
+            if (!stopped) {
+                client.close();
+            }
             console.log("Process killed");
+            console.log(`Session output: ${stats.writes} terminal writes sent as ${stats.frames} frames, ` +
+                `${stats.bytes} bytes with ${stats.overhead} bytes of frame headers ` +
+                `(${stats.unbatchedOverhead} unbatched)`);
         });
 
         client.tty.on('data', function (data) {
-            client.send(data);
+            if (stopped) {
+                return;
+            }
+            stats.writes += 1;
+            stats.unbatchedOverhead += getFrameOverhead(Buffer.byteLength(data));
+            pending += data;
+
+            if (!COALESCE_MS || Buffer.byteLength(pending) >= COALESCE_BYTES) {
+                flush();
+            } else if (!flushTimer) {
+                flushTimer = setTimeout(flush, COALESCE_MS);
+            }
         });
 
     });
 
     this.on('close', function (client) {
+        client.stopOutput && client.stopOutput();
         if (client.tty) {
             client.tty.kill(9);
             client.tty = null;
@@ -57,4 +146,16 @@ if (process.env.CREDS != null) {
             socket.emit("console_output", "Error saving credentials: " + err);
         }
     });
-}
\ No newline at end of file
+}
+
+// Businesses set up in tenants.json read their credentials from
+// creds_<tenant>.json, e.g. CREDS_ACME is saved as creds_acme.json
+Object.keys(process.env).filter(name => name.startsWith('CREDS_')).forEach(function (name) {
+    const file = 'creds_' + name.slice('CREDS_'.length).toLowerCase() + '.json';
+    console.log("Creating " + file + " file.");
+    fs.writeFile(file, process.env[name], 'utf8', function (err) {
+        if (err) {
+            console.log('Error writing file: ', err);
+        }
+    });
+});
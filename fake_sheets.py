@@ -0,0 +1,491 @@
+"""
+A stand-in for the Google Sheets and Drive APIs kept in a local JSON
+file, so the app can be load and stress tested without touching real
+spreadsheets. Several processes can share one store as every call
+locks the file while it runs.
+
+Enabled in run.py by setting VCA_FAKE_SHEETS to the path of the store,
+VCA_FAKE_LATENCY adds a delay in seconds to every call.
+"""
+
+import os
+import re
+import json
+import fcntl
+import datetime
+from time import sleep
+from contextlib import contextmanager
+import gspread
+
+# seconds added to every call to simulate the round trip to Google
+LATENCY = float(os.environ.get("VCA_FAKE_LATENCY", "0"))
+
+RANGE_PATTERN = re.compile(
+    r"^(?:'?(?P<title>.+?)'?!)?(?P<start_col>[A-Z]+)(?P<start_row>\d*)"
+    r"(?::(?P<end_col>[A-Z]+)(?P<end_row>\d*))?$")
+SUM_PATTERN = re.compile(
+    r"^=SUM\('(?P<title>.+?)'!(?P<col>[A-Z]+)(?P<row>\d+):[A-Z]+\)$")
+
+
+class FakeResponse:
+    """Fake HTTP response class
+
+    Holds the JSON body of a fake API call.
+    """
+
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        """Returns the body of the response"""
+
+        return self.body
+
+
+def get_api_error(message, code=400):
+    """Builds the error gspread raises for a failed API call
+
+    Returns: a gspread APIError.
+    """
+
+    return gspread.exceptions.APIError(FakeResponse(
+        {"error": {"code": code, "message": message,
+                   "status": "INVALID_ARGUMENT"}}, code))
+
+
+def column_to_index(column):
+    """Converts a column letter to a zero based index
+
+    Returns: the index, e.g. 0 for "A" and 26 for "AA".
+    """
+
+    index = 0
+    for letter in column:
+        index = index * 26 + ord(letter) - ord("A") + 1
+
+    return index - 1
+
+
+def parse_range(a1_range):
+    """Splits an A1 range into a worksheet title and grid bounds
+
+    Open ended ranges such as A5:I have no end row.
+
+    Returns: a tuple of (title, first_row, last_row, first_col,
+    last_col) with zero based, inclusive bounds.
+    """
+
+    match = RANGE_PATTERN.match(a1_range)
+    if match is None:
+        raise get_api_error(f"Unable to parse range: {a1_range}")
+
+    first_row = int(match["start_row"] or 1) - 1
+    first_col = column_to_index(match["start_col"])
+
+    if match["end_col"] is None:
+        return (match["title"], first_row, first_row, first_col, first_col)
+
+    last_row = int(match["end_row"]) - 1 if match["end_row"] else None
+
+    return (match["title"], first_row, last_row, first_col,
+            column_to_index(match["end_col"]))
+
+
+def format_value(value):
+    """Formats a cell value the way the Sheets API displays it
+
+    Returns: the value as a string.
+    """
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return str(value)
+
+
+class FakeHTTPClient:
+    """Fake HTTP client class
+
+    Answers the Drive metadata requests run.py makes directly.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, endpoint, params=None, **kwargs):
+        """Returns the revision of a spreadsheet
+
+        Only GET requests for a Drive file are supported.
+        """
+
+        # pylint: disable=unused-argument
+        spreadsheet_id = endpoint.rstrip("/").rsplit("/", 1)[1]
+
+        with self.client.store() as store:
+            file = store["files"][spreadsheet_id]
+            self.client.count_call(store, "drive.files.get")
+
+            return FakeResponse({"modifiedTime": file["modifiedTime"],
+                                 "version": str(file["version"])})
+
+
+class FakeSpreadsheet:
+    """Fake spreadsheet class
+
+    Implements the gspread Spreadsheet methods run.py uses against a
+    spreadsheet in the store.
+    """
+
+    def __init__(self, client, spreadsheet_id):
+        self.client = client
+        self.id = spreadsheet_id
+
+    @contextmanager
+    def file(self, call, changes=False):
+        """Opens the spreadsheet in the store
+
+        Bumps its version if the call changes it.
+        """
+
+        with self.client.store() as store:
+            self.client.count_call(store, call)
+            file = store["files"][self.id]
+            yield file
+
+            if changes:
+                file["version"] += 1
+                file["modifiedTime"] = datetime.datetime.now(
+                    datetime.timezone.utc).isoformat()
+
+    @staticmethod
+    def get_worksheet(file, title=None, sheet_id=None):
+        """Finds a worksheet by title or id
+
+        Returns: the worksheet.
+        """
+
+        for worksheet in file["sheets"]:
+            if worksheet["title"] == title or worksheet["sheetId"] == sheet_id:
+                return worksheet
+
+        raise get_api_error(f"Unable to parse range: {title}")
+
+    def evaluate(self, file, value, unformatted):
+        """Works out the value of a cell
+
+        Only SUM formulas over a column are supported.
+        """
+
+        match = SUM_PATTERN.match(str(value))
+        if match is None:
+            return value if unformatted else format_value(value)
+
+        worksheet = self.get_worksheet(file, match["title"])
+        column = column_to_index(match["col"])
+        total = 0
+
+        for row in worksheet["rows"][int(match["row"]) - 1:]:
+            try:
+                total += float(row[column])
+            except (IndexError, ValueError):
+                pass
+
+        return total if unformatted else format_value(total)
+
+    def read_range(self, file, a1_range, params):
+        """Reads the values of a range
+
+        Returns: the value range as the API returns it, leaving off
+        trailing empty rows and cells.
+        """
+
+        title, first_row, last_row, first_col, last_col = parse_range(
+            a1_range)
+        worksheet = self.get_worksheet(file, title)
+        unformatted = (params or {}).get(
+            "valueRenderOption") == "UNFORMATTED_VALUE"
+        rows = worksheet["rows"][first_row:None if last_row is None
+                                 else last_row + 1]
+        values = []
+
+        for row in rows:
+            cells = [self.evaluate(file, cell, unformatted)
+                     for cell in row[first_col:last_col + 1]]
+            while cells and cells[-1] == "":
+                cells.pop()
+            values.append(cells)
+
+        while values and not values[-1]:
+            values.pop()
+
+        value_range = {"range": a1_range, "majorDimension": "ROWS"}
+        if values:
+            value_range["values"] = values
+
+        return value_range
+
+    def write_range(self, file, a1_range, values):
+        """Writes values starting at the top left of a range"""
+
+        title, first_row, _, first_col, _ = parse_range(a1_range)
+        worksheet = self.get_worksheet(file, title)
+        self.write_cells(worksheet, first_row, first_col, values)
+
+    @staticmethod
+    def write_cells(worksheet, first_row, first_col, values):
+        """Writes rows of values into a worksheet"""
+
+        rows = worksheet["rows"]
+
+        for row_offset, row in enumerate(values):
+            while len(rows) <= first_row + row_offset:
+                rows.append([])
+            target = rows[first_row + row_offset]
+
+            for col_offset, value in enumerate(row):
+                while len(target) <= first_col + col_offset:
+                    target.append("")
+                target[first_col + col_offset] = value
+
+        worksheet["rowCount"] = max(worksheet["rowCount"], len(rows))
+
+    def values_get(self, a1_range, params=None):
+        """Fake Spreadsheet.values_get"""
+
+        with self.file("values.get") as file:
+            return self.read_range(file, a1_range, params)
+
+    def values_batch_get(self, ranges, params=None):
+        """Fake Spreadsheet.values_batch_get"""
+
+        with self.file("values.batchGet") as file:
+            return {"valueRanges": [self.read_range(file, a1_range, params)
+                                    for a1_range in ranges]}
+
+    def values_update(self, a1_range, params=None, body=None):
+        """Fake Spreadsheet.values_update"""
+
+        # pylint: disable=unused-argument
+        with self.file("values.update", changes=True) as file:
+            self.write_range(file, a1_range, body["values"])
+
+        return {"updatedRange": a1_range}
+
+    def values_batch_update(self, body=None):
+        """Fake Spreadsheet.values_batch_update"""
+
+        with self.file("values.batchUpdate", changes=True) as file:
+            for value_range in body["data"]:
+                self.write_range(file, value_range["range"],
+                                 value_range["values"])
+
+        return {"totalUpdatedCells": sum(
+            len(row) for value_range in body["data"]
+            for row in value_range["values"])}
+
+    def values_append(self, a1_range, params=None, body=None):
+        """Fake Spreadsheet.values_append
+
+        Rows are added after the last row with a value in it, growing
+        the worksheet if there's no room left, as the API does.
+        """
+
+        # pylint: disable=unused-argument
+        with self.file("values.append", changes=True) as file:
+            title = parse_range(a1_range)[0]
+            worksheet = self.get_worksheet(file, title)
+            rows = worksheet["rows"]
+
+            while rows and not any(cell != "" for cell in rows[-1]):
+                rows.pop()
+
+            first_row = len(rows)
+            self.write_cells(worksheet, first_row, 0, body["values"])
+
+        return {"updates": {
+            "updatedRange": f"'{title}'!A{first_row + 1}",
+            "updatedRows": len(body["values"])
+        }}
+
+    def fetch_sheet_metadata(self, params=None):
+        """Fake Spreadsheet.fetch_sheet_metadata"""
+
+        # pylint: disable=unused-argument
+        with self.file("spreadsheets.get") as file:
+            return {"sheets": [{"properties": {
+                "sheetId": worksheet["sheetId"],
+                "title": worksheet["title"],
+                "gridProperties": {"rowCount": worksheet["rowCount"]}
+            }, "developerMetadata": worksheet.get("developerMetadata", [])}
+                for worksheet in file["sheets"]]}
+
+    def batch_update(self, body):
+        """Fake Spreadsheet.batch_update
+
+        Supports the addSheet, updateCells, appendDimension,
+        addProtectedRange and createDeveloperMetadata requests, the
+        last two on whole worksheets.
+        """
+
+        with self.file("spreadsheets.batchUpdate", changes=True) as file:
+            for request in body["requests"]:
+                if "addSheet" in request:
+                    properties = request["addSheet"]["properties"]
+                    worksheet = {
+                        "sheetId": properties["sheetId"],
+                        "title": properties["title"],
+                        "rowCount": properties["gridProperties"]["rowCount"],
+                        "rows": []
+                    }
+                    file["sheets"].insert(
+                        properties.get("index", len(file["sheets"])),
+                        worksheet)
+
+                elif "updateCells" in request:
+                    update = request["updateCells"]
+                    worksheet = self.get_worksheet(
+                        file, sheet_id=update["start"]["sheetId"])
+                    values = [[list(cell["userEnteredValue"].values())[0]
+                               for cell in row["values"]]
+                              for row in update["rows"]]
+                    self.write_cells(worksheet, update["start"]["rowIndex"],
+                                     update["start"]["columnIndex"], values)
+
+                elif "appendDimension" in request:
+                    worksheet = self.get_worksheet(
+                        file, sheet_id=request["appendDimension"]["sheetId"])
+                    worksheet["rowCount"] += \
+                        request["appendDimension"]["length"]
+
+                elif "addProtectedRange" in request:
+                    protected_range = request["addProtectedRange"][
+                        "protectedRange"]
+                    worksheet = self.get_worksheet(
+                        file, sheet_id=protected_range["range"]["sheetId"])
+                    worksheet.setdefault("protectedRanges", []).append(
+                        protected_range)
+
+                elif "createDeveloperMetadata" in request:
+                    metadata = request["createDeveloperMetadata"][
+                        "developerMetadata"]
+                    worksheet = self.get_worksheet(
+                        file, sheet_id=metadata["location"]["sheetId"])
+                    worksheet.setdefault("developerMetadata", []).append(
+                        {"metadataKey": metadata["metadataKey"],
+                         "metadataValue": metadata["metadataValue"]})
+
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def list_permissions(self):
+        """Fake Spreadsheet.list_permissions"""
+
+        with self.file("permissions.list") as file:
+            return list(file["permissions"])
+
+    def share(self, email_address, perm_type, role, notify=True, **kwargs):
+        """Fake Spreadsheet.share"""
+
+        # pylint: disable=unused-argument
+        with self.file("permissions.create") as file:
+            file["permissions"].append({"emailAddress": email_address,
+                                        "type": perm_type, "role": role})
+
+
+class FakeClient:
+    """Fake gspread client class
+
+    Implements the gspread Client methods run.py uses against a store
+    kept in a JSON file.
+    """
+
+    def __init__(self, path, on_request=None):
+        self.path = path
+        self.on_request = on_request
+        self.http_client = FakeHTTPClient(self)
+
+        if not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as store_file:
+                json.dump({"files": {}, "calls": {}}, store_file)
+
+    @contextmanager
+    def store(self):
+        """Opens the store, saving any changes made to it
+
+        The file stays locked until the call is over so concurrent
+        processes see every change in order. Calls on_request first, as
+        every request to Google would.
+        """
+
+        if self.on_request is not None:
+            self.on_request()
+
+        sleep(LATENCY)
+
+        with open(self.path, "r+", encoding="utf-8") as store_file:
+            fcntl.flock(store_file, fcntl.LOCK_EX)
+            store = json.load(store_file)
+            yield store
+            store_file.seek(0)
+            json.dump(store, store_file)
+            store_file.truncate()
+
+    @staticmethod
+    def count_call(store, call):
+        """Counts the calls of each kind made against the store"""
+
+        store["calls"][call] = store["calls"].get(call, 0) + 1
+
+    def list_spreadsheet_files(self, title=None, folder_id=None):
+        """Fake Client.list_spreadsheet_files"""
+
+        # pylint: disable=unused-argument
+        with self.store() as store:
+            self.count_call(store, "drive.files.list")
+
+            return [{"id": spreadsheet_id, "name": file["name"],
+                     "createdTime": file["createdTime"],
+                     "modifiedTime": file["modifiedTime"]}
+                    for spreadsheet_id, file in store["files"].items()]
+
+    def open_by_key(self, key):
+        """Fake Client.open_by_key"""
+
+        with self.store() as store:
+            self.count_call(store, "spreadsheets.get")
+            if key not in store["files"]:
+                raise gspread.SpreadsheetNotFound(key)
+
+        return FakeSpreadsheet(self, key)
+
+    def create(self, title, folder_id=None):
+        """Fake Client.create"""
+
+        # pylint: disable=unused-argument
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        with self.store() as store:
+            self.count_call(store, "drive.files.create")
+            spreadsheet_id = f"fake-{len(store['files']) + 1:04d}-" + \
+                re.sub(r"\W", "-", title)
+            store["files"][spreadsheet_id] = {
+                "name": title,
+                "createdTime": now,
+                "modifiedTime": now,
+                "version": 1,
+                "permissions": [{"emailAddress": "owner@example.com",
+                                 "type": "user", "role": "owner"}],
+                "sheets": [{"sheetId": 0, "title": "Sheet1",
+                            "rowCount": 1000, "rows": []}]
+            }
+
+        return FakeSpreadsheet(self, spreadsheet_id)
+
+    def get_call_counts(self):
+        """Retrieves how many calls of each kind have been made
+
+        Returns: a dict of {call: count}.
+        """
+
+        with open(self.path, encoding="utf-8") as store_file:
+            return json.load(store_file)["calls"]
@@ -0,0 +1,157 @@
+"""
+Connects the app to Google Sheets and Drive.
+
+Builds the gspread client with an HTTP session that keeps connections
+open and asks for gzipped responses, and records the timing of every
+API request. Kept apart from run.py as gspread and google-auth take
+most of the app's start up time to import, so run.py only imports this
+module once the sheets are first needed.
+"""
+
+import os
+import re
+import datetime
+from time import monotonic
+from urllib.parse import urlparse
+import gspread
+from gspread.exceptions import APIError
+from gspread.http_client import BackOffHTTPClient, HTTPClient
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+SCOPE = [
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive",
+    "https://www.googleapis.com/auth/spreadsheets"
+    ]
+
+# connections kept open to Google, the Sheets and Drive APIs share a host
+HTTP_POOL_SIZE = 4
+# Google only gzips responses for clients that ask in both headers
+HTTP_HEADERS = {
+    "Accept-Encoding": "gzip",
+    "User-Agent": "vat-calculator-app (gzip)"
+}
+# {"GET /v4/spreadsheets/{id}/values:batchGet": {"count": int, "ms": float,
+#                                                "bytes": int}}
+REQUEST_STATS = {}
+# set to a file path to log the timing of every API request
+REQUEST_LOG = os.environ.get("VCA_REQUEST_LOG")
+
+
+def get_request_label(method, endpoint):
+    """Builds a label for an API request
+
+    Returns the method and URL path of a request with spreadsheet ids
+    and ranges replaced by placeholders, so calls of the same kind are
+    grouped together.
+    """
+
+    path = urlparse(endpoint).path
+    path = re.sub(r"/values/.+?(:append|:clear)?$", r"/values/{range}\1",
+                  path)
+    path = re.sub(r"/[A-Za-z0-9_-]{25,}", "/{id}", path)
+
+    return f"{method.upper()} {path}"
+
+
+def record_request(method, endpoint, response, started):
+    """Records the timing of an API request in REQUEST_STATS
+
+    Function to add a request that started at the monotonic time
+    started to the stats of its label, and to REQUEST_LOG if it's set.
+    """
+
+    elapsed = (monotonic() - started) * 1000
+    # the compressed size if the response was gzipped
+    size = int(response.headers.get("Content-Length", len(response.content)))
+
+    label = get_request_label(method, endpoint)
+    stats = REQUEST_STATS.setdefault(label,
+                                     {"count": 0, "ms": 0.0, "bytes": 0})
+    stats["count"] += 1
+    stats["ms"] += elapsed
+    stats["bytes"] += size
+
+    if REQUEST_LOG:
+        with open(REQUEST_LOG, "a", encoding="utf-8") as log_file:
+            log_file.write(f"{datetime.datetime.now().isoformat()}\t" +
+                           f"{label}\t{response.status_code}\t" +
+                           f"{elapsed:.1f}\t{size}\n")
+
+
+class TimedAttemptHTTPClient(HTTPClient):
+    """Timed attempt HTTP client class
+
+    gspread HTTP client that records how long each attempt at an API
+    request takes and how many bytes come back, failed ones included.
+    """
+
+    # called before every attempt, e.g. to account for a business's quota
+    on_request = None
+
+    def request(self, *args, **kwargs):
+        """Sends an API request once, recording its timing
+
+        gspread passes the method and endpoint as the first two
+        arguments.
+        """
+
+        if self.on_request is not None:
+            self.on_request()
+
+        started = monotonic()
+
+        try:
+            response = super().request(*args, **kwargs)
+        except APIError as error:
+            record_request(args[0], args[1], error.response, started)
+            raise
+
+        record_request(args[0], args[1], response, started)
+
+        return response
+
+
+class TimedHTTPClient(BackOffHTTPClient, TimedAttemptHTTPClient):
+    """Timed HTTP client class
+
+    gspread HTTP client retrying on quota errors. Each retry goes
+    through TimedAttemptHTTPClient on its own, so the stats count and
+    time every attempt once, leaving out the wait between them.
+    """
+
+
+def get_authorized_session(credentials):
+    """Creates the HTTP session shared by every API call
+
+    Returns an authorized session that keeps a pool of connections
+    alive between requests and asks for gzipped responses.
+    """
+
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                          pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.headers.update(HTTP_HEADERS)
+
+    return session
+
+
+def authorize(credentials_file, on_request=None):
+    """Connects to Google with a service account
+
+    The optional on_request function is called before every request.
+
+    Returns: a gspread client using the shared, timed HTTP session.
+    """
+
+    credentials = Credentials.from_service_account_file(
+        credentials_file).with_scopes(SCOPE)
+
+    client = gspread.authorize(credentials, http_client=TimedHTTPClient,
+                               session=get_authorized_session(credentials))
+    client.http_client.on_request = on_request
+
+    return client
@@ -0,0 +1,37 @@
+"""
+Creates a fake_sheets.py store ready for load testing.
+
+Sets up the current month for both ledgers with an opening transaction
+each, so new transactions are numbered from there.
+
+    python loadtest/seed_fake_sheets.py /tmp/sheets.json
+"""
+
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed_store(store_path):
+    """Sets up the current month of both ledgers in a fake store
+
+    Function to import run.py against the store, create the current
+    month's worksheets and add an opening transaction to each.
+    """
+
+    os.environ["VCA_FAKE_SHEETS"] = store_path
+    sys.path.insert(0, REPO_DIR)
+    # pylint: disable-next=import-outside-toplevel
+    import run
+
+    for sheet in run.LEDGER_NAMES:
+        run.provision_sheets(sheet, [run.get_month()])
+        run.append_transaction(sheet, [
+            run.get_current_date_and_time()[0], f"Opening {sheet}", None,
+            12.3, 2.3, 0, 0, 2.3, 0
+        ], fallback_invoice_number=1)
+
+
+if __name__ == "__main__":
+    seed_store(os.path.abspath(sys.argv[1]))
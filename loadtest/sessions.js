@@ -0,0 +1,378 @@
+// ===================================================
+// Load test for concurrent terminal sessions
+//
+// Opens N websocket sessions against the Node server, each of which
+// spawns its own run.py, and drives them through a scripted tour of the
+// menus against a fake_sheets.py store. Reports spawn latency, time to
+// first menu, run.py memory, per-action latency and the websocket frames
+// each session received for each level.
+//
+//   node loadtest/sessions.js --start --sessions 1,10,50,100
+//   node loadtest/sessions.js --url ws://localhost:8000/ --sessions 10
+//
+// --start runs index.js on a free port against a freshly seeded store,
+// otherwise the server at --url is used as it is.
+// ===================================================
+
+const { spawn, spawnSync } = require('child_process');
+const { parseArgs } = require('util');
+const fs = require('fs');
+const net = require('net');
+const os = require('os');
+const path = require('path');
+
+// Node 20 only has a WebSocket client behind a flag
+if (typeof WebSocket === 'undefined') {
+    const child = spawn(process.execPath,
+        ['--experimental-websocket', '--no-warnings', ...process.argv.slice(1)],
+        { stdio: 'inherit' });
+    child.on('exit', code => process.exit(code));
+    return;
+}
+
+const REPO_DIR = path.join(__dirname, '..');
+const CURRENT_MONTH = new Date().toLocaleString('en', { month: 'long' });
+const ANSI_PATTERN = /\x1b\[[0-9;?]*[A-Za-z]|\x1b[()][A-Za-z0-9]/g;
+
+// Each step sends keystrokes (if any) and waits for the output to match
+const SCRIPT = [
+    { name: 'first menu', expect: /Choose an option/ },
+    { name: 'open sales', send: '1\r', expect: /Add a new transaction[\s\S]*Choose an option/ },
+    { name: 'view month', send: '2\r', expect: /Press Enter to continue/ },
+    { name: 'back to menu', send: '\r', expect: /Choose an option/ },
+    { name: 'add: details', send: '1\r', expect: /Details/ },
+    { name: 'add: total', send: 'Load test\r', expect: /Total including VAT/ },
+    { name: 'add: rate', send: '12.30\r', expect: /Which VAT rate/ },
+    { name: 'add: write', send: '23\r', expect: /Sheet updated successfully/ },
+    { name: 'totals menu', send: '6\r', expect: /Year-to-date[\s\S]*Choose an option/ },
+    { name: 'month totals', send: '1\r', expect: /Please enter a month/ },
+    { name: 'month totals: read', send: `${CURRENT_MONTH}\r`, expect: /Press Enter to continue/ },
+    { name: 'exit', send: null, expect: null }
+];
+
+const { values: options } = parseArgs({
+    options: {
+        url: { type: 'string' },
+        start: { type: 'boolean', default: false },
+        sessions: { type: 'string', default: '1,10,50,100' },
+        latency: { type: 'string', default: '0.05' },
+        ramp: { type: 'string', default: '0' },
+        timeout: { type: 'string', default: '300' },
+        python: { type: 'string', default: 'python3' },
+        out: { type: 'string' }
+    }
+});
+
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+function percentile(values, fraction) {
+    if (!values.length) {
+        return null;
+    }
+    const sorted = [...values].sort((a, b) => a - b);
+    return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * fraction))];
+}
+
+function getFreePort() {
+    return new Promise(resolve => {
+        const server = net.createServer();
+        server.listen(0, () => {
+            const port = server.address().port;
+            server.close(() => resolve(port));
+        });
+    });
+}
+
+async function waitForPort(port, timeoutMs) {
+    const started = Date.now();
+    while (Date.now() - started < timeoutMs) {
+        const open = await new Promise(resolve => {
+            const socket = net.connect(port, '127.0.0.1', () => {
+                socket.end();
+                resolve(true);
+            });
+            socket.on('error', () => resolve(false));
+        });
+        if (open) {
+            return;
+        }
+        await sleep(200);
+    }
+    throw new Error(`Server didn't start listening on ${port}`);
+}
+
+async function startServer(store) {
+    const port = await getFreePort();
+    const server = spawn(process.execPath, ['index.js'], {
+        cwd: REPO_DIR,
+        env: {
+            ...process.env,
+            PORT: String(port),
+            PWD: REPO_DIR,
+            VCA_FAKE_SHEETS: store,
+            VCA_FAKE_LATENCY: options.latency
+        },
+        stdio: ['ignore', 'ignore', 'inherit']
+    });
+    await waitForPort(port, 30000);
+    return { server, url: `ws://127.0.0.1:${port}/` };
+}
+
+// RSS and PSS in kB of every app process (run.py, or zygote.py and its
+// workers when sessions are pre-forked) and RSS of a given process. PSS
+// splits pages shared between processes, e.g. by forking, between them.
+function sampleMemory(serverPid) {
+    const sample = { app: {}, server: null };
+    for (const pid of fs.readdirSync('/proc').filter(name => /^\d+$/.test(name))) {
+        try {
+            const cmdline = fs.readFileSync(`/proc/${pid}/cmdline`, 'utf8').split('\0');
+            const status = fs.readFileSync(`/proc/${pid}/status`, 'utf8');
+            const rss = Number((status.match(/VmRSS:\s+(\d+)/) || [0, 0])[1]);
+            if (cmdline.includes('run.py') || cmdline.includes('zygote.py')) {
+                let pss = null;
+                try {
+                    const rollup = fs.readFileSync(`/proc/${pid}/smaps_rollup`, 'utf8');
+                    pss = Number(rollup.match(/Pss:\s+(\d+)/)[1]);
+                } catch (err) {
+                    // not available on every kernel
+                }
+                sample.app[pid] = { rss, pss, runPy: cmdline.includes('run.py') };
+            }
+            if (Number(pid) === serverPid) {
+                sample.server = rss;
+            }
+        } catch (err) {
+            // the process exited while being read
+        }
+    }
+    return sample;
+}
+
+function runSession(url, timeoutMs) {
+    return new Promise(resolve => {
+        const result = { steps: {}, connectMs: null, firstByteMs: null, error: null, frames: 0, bytes: 0, overhead: 0 };
+        const decoder = new TextDecoder();
+        const started = performance.now();
+        const ws = new WebSocket(url);
+        ws.binaryType = 'arraybuffer';
+
+        let output = '';
+        let stepIndex = 0;
+        let stepStarted = started;
+        let done = false;
+
+        const timer = setTimeout(() => finish(`timed out at "${SCRIPT[stepIndex].name}"`), timeoutMs);
+
+        function finish(error) {
+            if (done) {
+                return;
+            }
+            done = true;
+            clearTimeout(timer);
+            result.error = error || null;
+            result.totalMs = performance.now() - started;
+            try {
+                ws.close();
+            } catch (err) {
+                // already closed
+            }
+            resolve(result);
+        }
+
+        function nextStep() {
+            const step = SCRIPT[stepIndex];
+            output = '';
+            stepStarted = performance.now();
+            if (step.name === 'exit') {
+                // back out through the menus and exit, the server then
+                // closes the socket
+                ws.send('\r');
+                const backOut = setInterval(() => done ? clearInterval(backOut) : ws.send('x\r'), 500);
+                return;
+            }
+            if (step.send !== undefined) {
+                ws.send(step.send);
+            }
+        }
+
+        ws.onopen = () => {
+            result.connectMs = performance.now() - started;
+            nextStep();
+        };
+
+        ws.onmessage = event => {
+            if (result.firstByteMs === null) {
+                result.firstByteMs = performance.now() - started;
+            }
+            const data = typeof event.data === 'string' ? event.data : decoder.decode(event.data, { stream: true });
+            const length = typeof event.data === 'string' ? Buffer.byteLength(event.data) : event.data.byteLength;
+            result.frames += 1;
+            result.bytes += length;
+            // server to client frames are unmasked, so just the header
+            result.overhead += length < 126 ? 2 : length < 65536 ? 4 : 10;
+            output += data.replace(ANSI_PATTERN, '');
+
+            const step = SCRIPT[stepIndex];
+            if (step.expect && step.expect.test(output)) {
+                result.steps[step.name] = performance.now() - (step.name === 'first menu' ? started : stepStarted);
+                stepIndex += 1;
+                nextStep();
+            }
+        };
+
+        ws.onerror = () => finish(`websocket error at "${SCRIPT[stepIndex].name}"`);
+
+        ws.onclose = () => {
+            if (SCRIPT[stepIndex].name === 'exit') {
+                result.steps.exit = performance.now() - stepStarted;
+                finish();
+            } else {
+                finish(`closed at "${SCRIPT[stepIndex].name}"`);
+            }
+        };
+    });
+}
+
+async function runLevel(url, sessions, serverPid) {
+    const peakRss = {};
+    const peakPss = {};
+    // sessions still exiting from the previous level, a zygote and its
+    // idle workers are counted at every level
+    const earlierPids = new Set(Object.entries(sampleMemory(serverPid).app)
+        .filter(([, memory]) => memory.runPy).map(([pid]) => pid));
+    let peakServerRss = 0;
+    let minAvailable = Infinity;
+
+    const sampler = setInterval(() => {
+        const sample = sampleMemory(serverPid);
+        for (const [pid, memory] of Object.entries(sample.app)) {
+            if (!earlierPids.has(pid)) {
+                peakRss[pid] = Math.max(peakRss[pid] || 0, memory.rss);
+                peakPss[pid] = Math.max(peakPss[pid] || 0, memory.pss || 0);
+            }
+        }
+        peakServerRss = Math.max(peakServerRss, sample.server || 0);
+        const meminfo = fs.readFileSync('/proc/meminfo', 'utf8');
+        minAvailable = Math.min(minAvailable, Number(meminfo.match(/MemAvailable:\s+(\d+)/)[1]));
+    }, 250);
+
+    const started = performance.now();
+    const pending = [];
+    for (let i = 0; i < sessions; i++) {
+        pending.push(runSession(url, Number(options.timeout) * 1000));
+        if (Number(options.ramp)) {
+            await sleep(Number(options.ramp));
+        }
+    }
+    const results = await Promise.all(pending);
+    clearInterval(sampler);
+
+    const ok = results.filter(result => !result.error);
+    const rss = Object.values(peakRss);
+    const summarise = values => ({
+        p50: percentile(values, 0.5),
+        p95: percentile(values, 0.95),
+        max: values.length ? Math.max(...values) : null
+    });
+
+    const report = {
+        sessions,
+        completed: ok.length,
+        errors: results.filter(result => result.error).map(result => result.error),
+        wallSeconds: (performance.now() - started) / 1000,
+        connectMs: summarise(results.map(result => result.connectMs).filter(ms => ms !== null)),
+        firstByteMs: summarise(results.map(result => result.firstByteMs).filter(ms => ms !== null)),
+        steps: {},
+        appProcesses: rss.length,
+        appRssKb: { ...summarise(rss), total: rss.reduce((a, b) => a + b, 0) },
+        appPssKb: Object.values(peakPss).reduce((a, b) => a + b, 0) || null,
+        serverRssKb: peakServerRss || null,
+        frames: summarise(ok.map(result => result.frames)),
+        bytes: summarise(ok.map(result => result.bytes)),
+        overhead: summarise(ok.map(result => result.overhead)),
+        minMemAvailableKb: minAvailable
+    };
+    for (const step of SCRIPT) {
+        // sessions that failed still count for the steps they got through
+        report.steps[step.name] = summarise(results.map(result => result.steps[step.name]).filter(ms => ms !== undefined));
+    }
+    return report;
+}
+
+function format(value, digits = 0, scale = 1) {
+    return value === null || value === undefined ? '-' : (value / scale).toFixed(digits);
+}
+
+function printReport(report) {
+    console.log(`\n${report.sessions} session(s): ${report.completed} completed in ${format(report.wallSeconds, 1)}s`);
+    for (const error of new Set(report.errors)) {
+        console.log(`  error x${report.errors.filter(e => e === error).length}: ${error}`);
+    }
+    const rows = [
+        ['connect', report.connectMs],
+        ['spawn (first byte)', report.firstByteMs],
+        ...Object.entries(report.steps)
+    ];
+    console.log(`  ${'ms'.padEnd(20)} ${'p50'.padStart(8)} ${'p95'.padStart(8)} ${'max'.padStart(8)}`);
+    for (const [name, stats] of rows) {
+        console.log(`  ${name.padEnd(20)} ${format(stats.p50).padStart(8)} ${format(stats.p95).padStart(8)} ${format(stats.max).padStart(8)}`);
+    }
+    const rss = report.appRssKb;
+    console.log(`  ${report.appProcesses} app processes, RSS MB: p50 ${format(rss.p50, 1, 1024)}, ` +
+        `max ${format(rss.max, 1, 1024)}, total ${format(rss.total, 1, 1024)}; ` +
+        `PSS MB total ${format(report.appPssKb, 1, 1024)} ` +
+        `(${format(report.appPssKb && report.appPssKb / report.sessions, 1, 1024)} per session)`);
+    console.log(`  per session: ${format(report.frames.p50)} frames, ${format(report.bytes.p50, 1, 1024)} KB ` +
+        `with ${format(report.overhead.p50)} bytes of frame headers (p50)`);
+    console.log(`  server RSS MB: ${format(report.serverRssKb, 1, 1024)}; ` +
+        `lowest MemAvailable MB: ${format(report.minMemAvailableKb, 0, 1024)}`);
+}
+
+async function main() {
+    const levels = options.sessions.split(',').map(Number);
+    let url = options.url;
+    let server = null;
+
+    if (options.start) {
+        const store = path.join(fs.mkdtempSync(path.join(os.tmpdir(), 'vca-load-')), 'sheets.json');
+        const seeded = spawnSync(options.python, [path.join(__dirname, 'seed_fake_sheets.py'), store],
+            { cwd: REPO_DIR, stdio: 'inherit' });
+        if (seeded.status !== 0) {
+            throw new Error('Seeding the fake store failed');
+        }
+        ({ server, url } = await startServer(store));
+    } else if (!url) {
+        throw new Error('Pass --url of a running server or --start to start one');
+    }
+
+    const reports = [];
+    try {
+        for (const sessions of levels) {
+            const report = await runLevel(url, sessions, server ? server.pid : null);
+            printReport(report);
+            reports.push(report);
+        }
+    } finally {
+        if (server) {
+            server.kill();
+        }
+    }
+
+    if (options.out) {
+        fs.writeFileSync(options.out, JSON.stringify({
+            date: new Date().toISOString(),
+            host: { cpus: os.cpus().length, memoryMb: Math.round(os.totalmem() / 1048576) },
+            latency: Number(options.latency),
+            reports
+        }, null, 2));
+    }
+
+    process.exitCode = reports.every(report => report.completed === report.sessions) ? 0 : 1;
+}
+
+main().catch(err => {
+    console.error(err.message);
+    process.exit(1);
+});
@@ -0,0 +1,163 @@
+"""
+Concurrency stress test for adding transactions from many terminals.
+
+Starts N processes, one per simulated terminal, that all add sales to
+the current month at the same time against a fake_sheets.py store, then
+checks every row got its own invoice number and reports the throughput
+at each level of concurrency.
+
+    python loadtest/stress_invoices.py --terminals 1 2 4 8 --rows 10
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import multiprocessing
+from time import monotonic
+from seed_fake_sheets import seed_store
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_terminal(terminal, rows, barrier, results):
+    """Adds rows from one simulated terminal
+
+    Function to run in a separate process, importing run.py against
+    the fake store and adding rows as fast as it can once every
+    terminal is ready.
+    """
+
+    sys.path.insert(0, REPO_DIR)
+    # pylint: disable-next=import-outside-toplevel
+    import run
+
+    barrier.wait()
+    latencies = []
+    invoice_numbers = []
+
+    for row_number in range(rows):
+        started = monotonic()
+        invoice_numbers.append(run.append_transaction("sales", [
+            run.get_current_date_and_time()[0],
+            f"Terminal {terminal} sale {row_number}", None,
+            12.3, 2.3, 0, 0, 2.3, 0
+        ]))
+        latencies.append(monotonic() - started)
+
+    results.put({"invoice_numbers": invoice_numbers,
+                 "latencies": latencies})
+
+
+def read_sheet_invoice_numbers(store_path):
+    """Reads back every invoice number written to the store
+
+    Returns: a tuple of (invoice numbers in row order, call counts).
+    """
+
+    with open(store_path, encoding="utf-8") as store_file:
+        store = json.load(store_file)
+
+    invoice_numbers = []
+    for file in store["files"].values():
+        if not file["name"].startswith("vat_sales"):
+            continue
+        for worksheet in file["sheets"]:
+            for row in worksheet["rows"][1:]:
+                if worksheet["title"] != "Summary" and len(row) > 2:
+                    invoice_numbers.append(row[2])
+
+    return invoice_numbers, store["calls"]
+
+
+def run_level(context, terminals, rows, latency):
+    """Runs the stress test with a number of terminals
+
+    Returns: a dict of results for the report.
+    """
+
+    work_dir = tempfile.mkdtemp(prefix="vca-stress-")
+    store_path = os.path.join(work_dir, "sheets.json")
+    os.environ["VCA_FAKE_SHEETS"] = store_path
+    os.environ["VCA_FAKE_LATENCY"] = str(latency)
+
+    seeder = context.Process(target=seed_store, args=(store_path,))
+    seeder.start()
+    seeder.join()
+
+    barrier = context.Barrier(terminals + 1)
+    results = context.Queue()
+    processes = [context.Process(target=run_terminal,
+                                 args=(terminal, rows, barrier, results))
+                 for terminal in range(terminals)]
+
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    started = monotonic()
+    outcomes = [results.get() for _ in processes]
+    elapsed = monotonic() - started
+
+    for process in processes:
+        process.join()
+
+    returned = [number for outcome in outcomes
+                for number in outcome["invoice_numbers"]]
+    written, calls = read_sheet_invoice_numbers(store_path)
+    latencies = sorted(latency for outcome in outcomes
+                       for latency in outcome["latencies"])
+
+    return {
+        "terminals": terminals,
+        "rows": len(returned),
+        "seconds": elapsed,
+        "rows_per_second": len(returned) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "appends": calls.get("values.append", 0),
+        "duplicates": len(written) - len(set(written)),
+        "in_order": written == sorted(written),
+        "complete": sorted(written) == list(range(1, len(returned) + 2))
+    }
+
+
+def main():
+    """Runs the stress test at each level of concurrency
+
+    Exits with an error if any invoice number was handed out twice.
+    """
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--terminals", type=int, nargs="+",
+                        default=[1, 2, 4, 8])
+    parser.add_argument("--rows", type=int, default=10,
+                        help="rows added by each terminal")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every fake API call")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    failed = False
+
+    print(f"{'terminals':>9} {'rows':>5} {'rows/s':>7} {'p50 ms':>7} "
+          f"{'p95 ms':>7} {'appends':>7} {'dupes':>5}  ok")
+
+    for terminals in args.terminals:
+        result = run_level(context, terminals, args.rows, args.latency)
+        ok = result["duplicates"] == 0 and result["complete"] and \
+            result["in_order"]
+        failed = failed or not ok
+
+        print(f"{result['terminals']:>9} {result['rows']:>5} "
+              f"{result['rows_per_second']:>7.1f} {result['p50_ms']:>7.0f} "
+              f"{result['p95_ms']:>7.0f} {result['appends']:>7} "
+              f"{result['duplicates']:>5}  {'yes' if ok else 'NO'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
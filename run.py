@@ -7,24 +7,279 @@ the point of sale
 
 import sys
 import os
-from time import sleep
+import re
+import json
+import fcntl
+import importlib
+import linecache
+import math
+import mmap
+import select
+import textwrap
+import threading
+import uuid
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from itertools import zip_longest
+from time import sleep, monotonic
 import datetime
-from art import text2art
-import gspread
-from google.oauth2.service_account import Credentials
+import zlib
 from colorama import Fore, init
 
-SCOPE = [
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive",
-    "https://www.googleapis.com/auth/spreadsheets"
-    ]
+# set to the path of a local store to run against fake_sheets.py instead
+# of Google, e.g. for load and stress testing
+FAKE_SHEETS = os.environ.get("VCA_FAKE_SHEETS")
+
+# one deployment keeps the books for several businesses (tenants), each
+# with its own credentials and spreadsheets, described in this file
+TENANTS_FILE = os.environ.get("VCA_TENANTS", "tenants.json")
+# the business used unless another is chosen, always available with
+# creds.json and the original spreadsheet names
+DEFAULT_TENANT = "default"
+# {tenant: {"credentials": path, "ledgers": {sheet: name},
+#           "requests_per_minute": int or None}}
+TENANTS = {}
+# {tenant: {"client", "catalog", "partitions", "search_index",
+#           "search_lookups"}}, least recently used first
+TENANT_POOL = {}
+# businesses kept connected at once, the least recently used one is
+# disconnected when another is needed
+TENANT_POOL_SIZE = max(1, int(os.environ.get("VCA_TENANT_POOL_SIZE", "4")))
+# seconds a business's requests_per_minute is counted over
+QUOTA_WINDOW = 60
+# {tenant: {"requests": int, "throttled": int, "waited": float,
+#           "recent": [float, ...]}}
+TENANT_QUOTAS = {}
+
+
+class LazyModule:
+    """Lazy module class
+
+    Stands in for a module that is slow to import, importing it the
+    first time one of its attributes is used.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(importlib.import_module(self.name), attribute)
+
 
-CREDS = Credentials.from_service_account_file('creds.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-PURCHASES_SHEET = GSPREAD_CLIENT.open('vat_purchases')
-SALES_SHEET = GSPREAD_CLIENT.open('vat_sales')
+# gspread takes most of the app's start up time to import and isn't
+# needed until the sheets are, e.g. not for the welcome page or menus
+# pylint: disable-next=invalid-name
+gspread = LazyModule("gspread")
+
+# Each ledger is partitioned by year: the original spreadsheet holds the
+# year it was created in and later years get their own "<name>_<year>"
+# file. Holds the names of the business being worked on
+LEDGER_NAMES = {
+    "purchases": "vat_purchases",
+    "sales": "vat_sales"
+}
+
+MONTHS = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+]
+
+# month worksheets are created with, and grown by, this many rows
+SHEET_ROW_CHUNK = 150
+
+# worksheet holding a SUM formula per month for each column below, so
+# Google works out every total and they can be read in a single call
+SUMMARY_SHEET = "Summary"
+
+# {"sales": {"2024": spreadsheet_id, ...}, "purchases": {...}}, swapped
+# for the business's own with the rest of its TENANT_POOL entry
+PARTITION_CATALOG = {}
+# {spreadsheet_id: gspread.Spreadsheet} so partitions are only opened once
+OPEN_PARTITIONS = {}
+# years after the current one whose spreadsheets can be created early
+PROVISION_YEARS_AHEAD = 1
+
+# seconds a revision check is trusted before Drive is asked again
+REVISION_CHECK_INTERVAL = 5
+# {spreadsheet_id: {"revision": (modifiedTime, version), "checked": float}}
+LEDGER_REVISIONS = {}
+# {spreadsheet_id: [month, ...]}
+SHEET_TITLES_CACHE = {}
+# {spreadsheet_id: {month: {column: total}}}
+SUMMARY_CACHE = {}
+# {(spreadsheet_id, month): {"rows": [...], "anchor": crc32,
+#                            "deltas": int, "stale": bool}}
+# a mirror restored from a snapshot has "rows" None and a "snapshot"
+# to read them from until first used, then "snapshot_totals" until its
+# rows are rewritten
+MONTH_MIRRORS = {}
+# closed months are archived in CACHE_DIR as
+# "closed/<spreadsheet_id>/<month>.json", written once and never
+# replaced, and aren't read from the sheets again
+CLOSED_MONTHS_DIR = "closed"
+# developer metadata key marking a month worksheet as closed, so other
+# deployments archive it too
+CLOSED_MONTH_KEY = "vca_closed_month"
+# {spreadsheet_id: {month: archive}} of the archives loaded
+CLOSED_MONTHS = {}
+# a mirror is fully re-read after this many delta refreshes, catching
+# edits to earlier rows that leave the last synced row untouched
+MIRROR_FULL_RESYNC_EVERY = 20
+
+# compact copy of the fetched ledger data kept between sessions, in
+# CACHE_DIR and memory-mapped on start up
+SNAPSHOT_FILE = "ledgers.snapshot"
+SNAPSHOT_MAGIC = b"VCASNAP1"
+# seconds between saving the snapshot while the app is in use
+SNAPSHOT_INTERVAL = 60
+# {tenant: {"restored": [spreadsheet_id, ...], "saved": monotonic}}
+SNAPSHOTS = {}
+
+# ASCII art for the welcome page, rendered by text2art ahead of time
+BANNER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "assets", "banners")
+WELCOME_BANNERS = ["VAT", "CALCULATOR"]
+
+# local files kept between sessions, e.g. the search index, kept next to
+# the store when running against fake_sheets.py so the two never mix.
+# Businesses other than the default one get a folder of their own in it
+CACHE_DIR = os.environ.get(
+    "VCA_CACHE_DIR", f"{FAKE_SHEETS}.cache" if FAKE_SHEETS else ".vca_cache")
+SEARCH_INDEX_FILE = "search_index.json"
+# year-end reports are saved in CACHE_DIR as
+# "reports/<year>/<version>/report.{json,csv,html}", the version
+# worked out from the revisions of the year's spreadsheets
+REPORTS_DIR = "reports"
+REPORT_FORMATS = ["json", "csv", "html"]
+# versions of a year's report kept besides the newest
+REPORT_VERSIONS_KEPT = 3
+# seconds after a report is built before a session builds it again in
+# the background, if the ledgers have changed
+REPORT_REFRESH = 300
+# every terminal on the dyno is its own run.py process, so new rows are
+# coordinated through files shared by all of them: the next invoice
+# number to hand out and a queue of rows waiting to be appended
+INVOICE_COUNTER_FILE = "{ledger}.invoice"
+APPEND_QUEUE_FILE = "{ledger}.queue"
+# months a terminal has rewritten a row in, one per line, so the others
+# re-read them rather than trusting rows they've already synced
+EDIT_LOG_FILE = "{spreadsheet_id}.edits"
+# {spreadsheet_id: bytes of its edit log this process has applied}
+EDIT_LOG_OFFSETS = {}
+# persisted as {"revisions": {spreadsheet_id: revision},
+#               "months": {"<spreadsheet_id>|<month>": {...}}}
+SEARCH_INDEX = {}
+# in-memory lookups built from SEARCH_INDEX, records are
+# (sheet, year, month, row_number, date_ordinal, cents, row) and
+# duplicates maps a row's duplicate key to the record ids sharing it
+SEARCH_LOOKUPS = {"records": [], "terms": {}, "vocabulary": [],
+                  "dates": [], "amounts": [], "invoices": {},
+                  "duplicates": {}}
+
+# set to a file path to profile where a session's time goes, "{pid}" in
+# it is replaced by the process id so each session gets its own file
+PROFILE_FILE = os.environ.get("VCA_PROFILE")
+# seconds between samples of what the app is doing
+PROFILE_INTERVAL = 0.01
+# seconds between saves of the profile, as browser sessions are usually
+# killed rather than exited
+PROFILE_SAVE_INTERVAL = 5
+# {"main;main_menu;sub_menu(sales);...;[category]": seconds}
+PROFILE_STACKS = {}
+# frames from these files mean the app is waiting on Google (or the
+# fake store), including gspread's back off and quota waits
+API_FILE_PATTERN = re.compile(
+    r"(google_client|fake_sheets|ssl|socket)\.py$|" +
+    r"[/\\](gspread|google|requests|urllib3|http)[/\\]")
+PROFILE_CATEGORIES = ["input", "delay", "api", "cpu"]
+
+# text that can surround an amount typed into a sheet, e.g. "€ 12.50"
+CURRENCY_SYMBOLS = "€$£"
+CURRENCY_CODES = ["EUR", "GBP", "USD"]
+# characters grouping thousands, e.g. "1,234.50", "1.234,50", "1'234.50"
+THOUSANDS_SEPARATORS = ",.' \u00a0\u202f"
+
+# the VAT rate of each band and the dates they took effect
+VAT_RATES_FILE = os.environ.get(
+    "VCA_VAT_RATES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 "vat_rates.json"))
+# the rate table, each band's effective dates as ordinals to bisect
+VAT_RATE_TABLE = {}
+
+# characters typewriter_print writes at once when output is buffered,
+# for every this many seconds of typing
+OUTPUT_FRAME = 0.1
+# what `clear` prints for the xterm terminals sessions run in
+CLEAR_SCREEN = "\033[H\033[2J\033[3J"
+
+# columns of the analytics table for each Columns attribute, amounts
+# held as integer cents
+ANALYTICS_COLUMNS = {
+    "date": "TEXT", "details": "TEXT", "invoice_number": "TEXT",
+    "total": "INTEGER", "vat_23": "INTEGER", "vat_13_5": "INTEGER",
+    "vat_9": "INTEGER", "vat": "INTEGER", "exempt": "INTEGER"
+}
+# the in-memory database analytics queries run against, with the
+# business, year and ledger revisions it was loaded at
+ANALYTICS_DATABASE = {}
+# saved analytics queries as (title, sql), amounts converted to euro
+ANALYTICS_QUERIES = [
+    ("Totals by week", """
+        SELECT date(date, 'weekday 0', '-6 days') AS week_starting, ledger,
+               COUNT(*) AS transactions, SUM(total) / 100.0 AS total,
+               SUM(vat) / 100.0 AS vat
+        FROM transactions
+        GROUP BY week_starting, ledger
+        ORDER BY week_starting, ledger"""),
+    ("VAT by rate", """
+        SELECT ledger, SUM(vat_23) / 100.0 AS "23%",
+               SUM(vat_13_5) / 100.0 AS "13.5%", SUM(vat_9) / 100.0 AS "9%",
+               SUM(vat) / 100.0 AS vat,
+               SUM(exempt) / 100.0 AS "exempt/intra-EU"
+        FROM transactions
+        GROUP BY ledger"""),
+    ("Top suppliers", """
+        SELECT details AS supplier, COUNT(*) AS purchases,
+               SUM(total) / 100.0 AS total, SUM(vat) / 100.0 AS vat
+        FROM transactions
+        WHERE ledger = 'purchases'
+        GROUP BY lower(trim(details))
+        ORDER BY SUM(total) DESC
+        LIMIT 10"""),
+    ("Top sales by details", """
+        SELECT details, COUNT(*) AS sales, SUM(total) / 100.0 AS total,
+               SUM(vat) / 100.0 AS vat
+        FROM transactions
+        WHERE ledger = 'sales'
+        GROUP BY lower(trim(details))
+        ORDER BY SUM(total) DESC
+        LIMIT 10"""),
+    ("Sales vs purchases margin by month", """
+        SELECT month,
+               SUM(IIF(ledger = 'sales', total, 0)) / 100.0 AS sales,
+               SUM(IIF(ledger = 'purchases', total, 0)) / 100.0 AS purchases,
+               SUM(IIF(ledger = 'sales', total, -total)) / 100.0 AS margin,
+               SUM(IIF(ledger = 'sales', vat, -vat)) / 100.0 AS vat_due
+        FROM transactions
+        GROUP BY month_number
+        ORDER BY month_number""")
+]
+
+# archived month worksheets, named the way Google Sheets names a CSV
+# download, "<spreadsheet> - <worksheet>.csv", e.g. "vat_sales_2021 -
+# March.csv", the year taken from the rows for an unsuffixed spreadsheet
+ARCHIVE_FILE_PATTERN = re.compile(
+    r"^(?P<ledger>.+?)(?:_(?P<year>\d{4}))? - (?P<month>[A-Za-z]+)\.csv$")
+# archive files are handed to each worker in about this many batches
+ARCHIVE_BATCHES_PER_WORKER = 4
+
+# seconds between refreshes of the totals dashboard
+DASHBOARD_REFRESH = 5
+# dashboard refreshes between re-reading the earlier months' totals
+DASHBOARD_SUMMARY_EVERY = 12
 
 # pylint: disable-next=invalid-name
 vat_rate = None
@@ -32,6 +287,12 @@ vat_rate = None
 total_price_including_vat = None
 # pylint: disable-next=invalid-name
 choice = None
+# pylint: disable-next=invalid-name
+selected_year = None
+# pylint: disable-next=invalid-name
+current_tenant = DEFAULT_TENANT
+# pylint: disable-next=invalid-name
+buffered_output = False
 
 init()
 init(autoreset=True)
@@ -69,6 +330,9 @@ class Columns:
     vat = 8
     exempt = 9
 
+    # columns that are totalled, in the order totals are displayed
+    summed = [total, vat_23, vat_13_5, vat_9, vat, exempt]
+
 
 def display_welcome_page():
     """Displays the Welcome page
@@ -83,13 +347,50 @@ def display_welcome_page():
         "self-assessment\n"
         )
     print('\n' + f'{Colors.blue}*'*80)
-    print(f"\n\t{Colors.magenta}{text2art("VAT")}")
-    print(f"\n\t{Colors.magenta}{text2art("CALCULATOR")}")
+    print(f"\n\t{Colors.magenta}{get_banner_art("VAT")}")
+    print(f"\n\t{Colors.magenta}{get_banner_art("CALCULATOR")}")
     print('\n' + f'{Colors.blue}*'*80)
     print("\n")
     typewriter_print(welcome_message)
     print('\n' + f'{Colors.blue}*'*80)
-    sleep(3)
+    pause(3)
+
+
+def render_banner_art(text):
+    """Renders ASCII art for a banner
+
+    Function to render text with the art package, which is only
+    imported when a banner needs rendering, and save it to BANNER_DIR.
+
+    Returns: the ASCII art.
+    """
+
+    banner_art = importlib.import_module("art").text2art(text)
+
+    try:
+        os.makedirs(BANNER_DIR, exist_ok=True)
+        with open(os.path.join(BANNER_DIR, f"{text.lower()}.txt"), "w",
+                  encoding="utf-8") as banner_file:
+            banner_file.write(banner_art)
+    except OSError:
+        pass
+
+    return banner_art
+
+
+def get_banner_art(text):
+    """Retrieves the ASCII art for a banner
+
+    Returns the art pre-rendered in BANNER_DIR, only rendering it if
+    it's missing.
+    """
+
+    try:
+        with open(os.path.join(BANNER_DIR, f"{text.lower()}.txt"),
+                  encoding="utf-8") as banner_file:
+            return banner_file.read()
+    except FileNotFoundError:
+        return render_banner_art(text)
 
 
 def clear_screen():
@@ -99,16 +400,56 @@ def clear_screen():
     be more easily read.
     """
 
-    os.system('clear')
+    if buffered_output:
+        sys.stdout.write(CLEAR_SCREEN)
+    else:
+        os.system('clear')
+
+
+def pause(seconds):
+    """Pauses the app
+
+    Function to show everything printed so far, even if output is
+    buffered, and then wait.
+    """
+
+    sys.stdout.flush()
+    sleep(seconds)
+
+
+def use_buffered_output():
+    """Buffers output until the app waits
+
+    Function to stop the terminal being written to for every line, or
+    every character typewriter_print prints, so the web terminal
+    receives a screen in a few large writes. Output is written when
+    the app pauses or asks for input.
+    """
+    # pylint: disable-next=global-statement
+    global buffered_output
+
+    buffered_output = True
+    sys.stdout.reconfigure(line_buffering=False)
 
 
 def typewriter_print(print_statement, sleep_time=0.03):
     """Enumlate typewriter output
 
     Function to output text to mimic typewriter output speeds
-    uses a default sleep_time which can be overridden.
+    uses a default sleep_time which can be overridden. With buffered
+    output the text is written OUTPUT_FRAME seconds' worth at a time,
+    taking as long overall.
     """
 
+    if buffered_output:
+        chunk_size = max(1, int(OUTPUT_FRAME / sleep_time))
+        for start in range(0, len(print_statement), chunk_size):
+            chunk = print_statement[start:start + chunk_size]
+            pause(sleep_time * len(chunk))
+            sys.stdout.write(chunk)
+        print()
+        return
+
     for char in print_statement:
         sleep(sleep_time)
         sys.stdout.write(char)
@@ -166,54 +507,33 @@ def print_selected_menu(heading, menu_options, choice_made=None):
     while choice not in menu_options:
         print(f"{Colors.red}\nYou have selected an option that \
             does not exist, please try again...\n")
-        sleep(2)
+        pause(2)
         print_selected_menu(heading, menu_options, choice_made=None)
 
     return choice
 
 
-def show_details_on_vat():
+def show_details_on_vat(on_date=None):
     """Displays VAT info
 
-    Display details on VAT in Ireland.
-    """
-
-    irish_vat_rates = {
-        23: """
-        This is the standard VAT rate in Ireland, which applies to most goods
-        and services, including electronics, household appliances, clothing,
-        and professional services.
-        """,
-        13.5: """
-        This reduced VAT rate applies to certain goods and services, including
-        electricity, gas, restaurant services, and building services (e.g.,
-        renovation and repair of residential property).
-        """,
-        9: """
-        This lower VAT rate is primarily for tourism and hospitality sectors.
-        It applies to services such as hotel accommodation, restaurant meals,
-        and admission to cinemas, theaters, museums, and certain sports
-        facilities.
-        """,
-        4.8: """
-        This special VAT rate applies exclusively to the supply of
-        livestock (cattle, sheep, etc.).
-        """,
-        0: """
-        This zero rate applies to certain essential goods and services,
-        such as most food items (except for those subject to the 13.5% rate),
-        children's clothing and footwear, oral medicines, and exports.
-        """
-    }
+    Display details on the VAT rates in Ireland on a date, today by
+    default.
+    """
+
+    bands = load_vat_rates()["bands"]
 
     clear_screen()
 
     typewriter_print("\n\tPlease check which tax rate applies \
         if you are unsure\n")
-    for k, v in irish_vat_rates.items():
+    for band, rate in get_vat_rates(on_date).items():
+        description = textwrap.fill(bands[band]["description"], 70,
+                                    initial_indent="\t",
+                                    subsequent_indent="\t")
         print("\t" + "*"*72)
-        print(f"{Fore.LIGHTWHITE_EX}\t{k}%" + f"{Fore.BLUE}{v}")
-        sleep(1.5)
+        print(f"{Fore.LIGHTWHITE_EX}\t{rate}%\n" +
+              f"{Fore.BLUE}{description}\n")
+        pause(1.5)
 
     click_to_continue()
 
@@ -233,7 +553,7 @@ def display_message(message, wait_time=None, is_warning=True):
         print("\n\n\t" + f"{Colors.green}{message}\n")
 
     if wait_time:
-        sleep(wait_time)
+        pause(wait_time)
     else:
         click_to_continue()
 
@@ -249,462 +569,3458 @@ def display_wait_message(wait_message):
     typewriter_print(f"{wait_message}...\n\n")
 
 
-def get_selected_worksheet(sheet):
-    """Assigns a 'sheet' variable between purchases and sales
+def load_tenants():
+    """Reads the businesses the app keeps the books for
+
+    Function to read TENANTS_FILE if there is one, e.g.
+    {"acme": {"credentials": "creds_acme.json",
+              "ledgers": {"purchases": "acme_purchases",
+                          "sales": "acme_sales"},
+              "requests_per_minute": 50}}
+    Every setting is optional, a business's credentials default to
+    "creds_<tenant>.json" and its ledgers to "<tenant>_purchases" and
+    "<tenant>_sales".
 
-    Returns either purchases/sales worksheet so code is mostly
-    reusable for both.
+    Returns: the tenants.
     """
 
-    if sheet == "purchases":
-        sheet = PURCHASES_SHEET
-    else:
-        sheet = SALES_SHEET
+    if TENANTS:
+        return TENANTS
+
+    TENANTS[DEFAULT_TENANT] = {
+        "credentials": "creds.json",
+        "ledgers": {"purchases": "vat_purchases", "sales": "vat_sales"},
+        "requests_per_minute": None
+    }
+
+    try:
+        with open(TENANTS_FILE, encoding="utf-8") as tenants_file:
+            configured = json.load(tenants_file)
+    except FileNotFoundError:
+        configured = {}
+
+    for tenant, settings in configured.items():
+        defaults = TENANTS.get(tenant, {
+            "credentials": f"creds_{tenant}.json",
+            "ledgers": {sheet: f"{tenant}_{sheet}"
+                        for sheet in ["purchases", "sales"]},
+            "requests_per_minute": None
+        })
+        TENANTS[tenant] = {
+            "credentials": settings.get("credentials",
+                                        defaults["credentials"]),
+            "ledgers": {**defaults["ledgers"], **settings.get("ledgers", {})},
+            "requests_per_minute": settings.get(
+                "requests_per_minute", defaults["requests_per_minute"])
+        }
+
+    return TENANTS
+
+
+def get_cache_path(filename):
+    """Builds the path of a local file for the current business
+
+    Returns: the path in CACHE_DIR, or in the business's folder in it
+    for businesses other than the default one.
+    """
 
-    return sheet
+    cache_dir = CACHE_DIR
+    if current_tenant != DEFAULT_TENANT:
+        cache_dir = os.path.join(CACHE_DIR, "tenants", current_tenant)
 
+    os.makedirs(cache_dir, exist_ok=True)
 
-def get_current_date_and_time():
-    """Retrieves current date & time
+    return os.path.join(cache_dir, filename)
 
-    Returns the current date and time (formatted) to accurately
-    log a transaction. Format of date is compatible with
-    google-sheets (mm/dd/YYYY).
+
+def count_tenant_request(tenant):
+    """Accounts for an API request made for a business
+
+    Function called by a business's client before every request it
+    makes. If the business has a requests_per_minute limit and has
+    used it in the last QUOTA_WINDOW seconds it waits first, so one
+    busy business can't use up the quota of a shared Google project.
+    Requests are counted per process.
     """
 
-    now = datetime.datetime.now()
+    quota = TENANT_QUOTAS.setdefault(
+        tenant, {"requests": 0, "throttled": 0, "waited": 0.0, "recent": []})
+    limit = load_tenants()[tenant]["requests_per_minute"]
 
-    # using (month/day/year) format for better google sheets integraton
-    date = now.strftime("%m/%d/%Y")
-    time = now.strftime("%H:%M:%S")
-    return (date, time)
+    now = monotonic()
+    quota["recent"] = [sent for sent in quota["recent"]
+                       if now - sent < QUOTA_WINDOW]
 
+    if limit and len(quota["recent"]) >= limit:
+        wait_time = quota["recent"][-limit] + QUOTA_WINDOW - now
+        quota["throttled"] += 1
+        quota["waited"] += wait_time
+        sleep(wait_time)
+        now = monotonic()
 
-def get_month():
-    """Retieves current month
+    quota["recent"].append(now)
+    quota["requests"] += 1
 
-    Returns the current month so the correct spreadsheet can be updated.
+
+def connect_tenant(tenant):
+    """Connects to Google Sheets as a business
+
+    Returns the gspread client for the business's credentials, or a
+    fake_sheets.py client if VCA_FAKE_SHEETS is set, where businesses
+    other than the default one get a store of their own next to it.
     """
 
-    now = datetime.datetime.now()
+    def on_request():
+        count_tenant_request(tenant)
 
-    month = now.strftime("%B")
+    if FAKE_SHEETS:
+        store = FAKE_SHEETS
+        if tenant != DEFAULT_TENANT:
+            root, extension = os.path.splitext(FAKE_SHEETS)
+            store = f"{root}.{tenant}{extension}"
+        return importlib.import_module("fake_sheets").FakeClient(
+            store, on_request=on_request)
 
-    return month
+    return importlib.import_module("google_client").authorize(
+        load_tenants()[tenant]["credentials"], on_request=on_request)
 
 
-def request_input_from_user():
-    """Request input from a user
+def disconnect_tenant(tenant):
+    """Disconnects a business
 
-    Ask the user to make a selection, broken out to a function
-    for consistent behaviour across the application
+    Function to remove a business from TENANT_POOL, closing its HTTP
+    connections and forgetting everything cached for its spreadsheets.
+    """
 
-    Returns: user_choice in lowercase, and stripped of whitespace.
+    connection = TENANT_POOL.pop(tenant)
+    spreadsheet_ids = set(connection["partitions"])
+    for years in connection["catalog"].values():
+        spreadsheet_ids.update(years.values())
+
+    for spreadsheet_id in spreadsheet_ids:
+        LEDGER_REVISIONS.pop(spreadsheet_id, None)
+        SHEET_TITLES_CACHE.pop(spreadsheet_id, None)
+        SUMMARY_CACHE.pop(spreadsheet_id, None)
+    for key in [key for key in MONTH_MIRRORS if key[0] in spreadsheet_ids]:
+        del MONTH_MIRRORS[key]
+
+    session = getattr(getattr(connection["client"], "http_client", None),
+                      "session", None)
+    if session is not None:
+        session.close()
+
+
+def get_tenant_connection(tenant):
+    """Retrieves a business's entry in the connection pool
+
+    Function to mark the business as the most recently used, adding it
+    if needed and disconnecting the least recently used business if
+    that makes more than TENANT_POOL_SIZE. The current business's
+    entry holds the module's PARTITION_CATALOG, OPEN_PARTITIONS and
+    search index.
+
+    Returns: the pool entry.
     """
 
-    typewriter_print("\nChoose an option:\n")
-    user_choice = input().lower().strip()
+    if tenant in TENANT_POOL:
+        TENANT_POOL[tenant] = TENANT_POOL.pop(tenant)
+        return TENANT_POOL[tenant]
 
-    return user_choice
+    if tenant == current_tenant:
+        TENANT_POOL[tenant] = {
+            "client": None, "catalog": PARTITION_CATALOG,
+            "partitions": OPEN_PARTITIONS, "search_index": SEARCH_INDEX,
+            "search_lookups": SEARCH_LOOKUPS
+        }
+    else:
+        TENANT_POOL[tenant] = {
+            "client": None, "catalog": {}, "partitions": {},
+            "search_index": {},
+            "search_lookups": {"records": [], "terms": {}, "vocabulary": [],
+                               "dates": [], "amounts": [], "invoices": {},
+                               "duplicates": {}}
+        }
 
+    while len(TENANT_POOL) > TENANT_POOL_SIZE:
+        disconnect_tenant(next(iter(TENANT_POOL)))
 
-def request_user_select_a_month(sheet):
-    """Request a user select from available months/sheets
+    return TENANT_POOL[tenant]
 
-    Function to request a user selects a month from available months
 
-    Returns: a tuple of (month, available_months).
+def use_tenant(tenant):
+    """Switches the app to another business
+
+    Function to point the module's ledger names, partitions and search
+    index at the business's own, connecting to it on first use and
+    restoring its last snapshot. Switching back to a business still in
+    the pool doesn't re-authenticate or re-open its spreadsheets.
     """
+    # pylint: disable-next=global-statement
+    global current_tenant, selected_year
+    # pylint: disable-next=global-statement
+    global PARTITION_CATALOG, OPEN_PARTITIONS, SEARCH_INDEX, SEARCH_LOOKUPS
 
-    month = input("\nPlease select a month to review " + f"{Colors.green}\
-        (Press L to list available months): \n")
-    month = month.strip().lower().capitalize()
+    if tenant not in load_tenants():
+        raise ValueError(f"No business called {tenant} in {TENANTS_FILE}")
 
-    available_months = get_list_of_all_sheet_titles(sheet)
+    connection = get_tenant_connection(tenant)
 
-    if month.startswith("L"):
-        print(available_months)
-        month = input("\nPlease make a selection: \n")
-        month = month.strip().lower().capitalize()
+    current_tenant = tenant
+    selected_year = None
+    PARTITION_CATALOG = connection["catalog"]
+    OPEN_PARTITIONS = connection["partitions"]
+    SEARCH_INDEX = connection["search_index"]
+    SEARCH_LOOKUPS = connection["search_lookups"]
 
-    if month in available_months:
-        display_wait_message("This might take a few seconds")
+    LEDGER_NAMES.clear()
+    LEDGER_NAMES.update(TENANTS[tenant]["ledgers"])
 
-    return (month, available_months)
+    if not PARTITION_CATALOG:
+        restore_snapshot()
 
 
-def get_length_of_longest_list_item(list_to_check):
-    """Finds longest list item
+def get_gspread_client():
+    """Connects to Google Sheets
 
-    Returns the longest string in a list of strings,
-    useful for formatting output and improving readability.
+    Returns the current business's gspread client, or fake_sheets.py
+    client if VCA_FAKE_SHEETS is set, importing the libraries it needs
+    and loading the credentials the first time it's called.
     """
 
-    return len(sorted(list_to_check, key=len, reverse=True)[0])
+    connection = get_tenant_connection(current_tenant)
 
+    if connection["client"] is None:
+        connection["client"] = connect_tenant(current_tenant)
 
-def request_new_transaction(sheet, details=None,
-                            price_including_vat=None, rate=None):
-    """Requests transaction info from a user
+    return connection["client"]
 
-    Function to collect the info needed to add a new transaction t
-    o a google sheet
 
-    Returns: a tuple of (details, total_price_including_vat, vat_rate).
+def preload_libraries():
+    """Imports the libraries used to reach Google ahead of time
+
+    Function to run in a background thread while the welcome page is
+    showing, so the user's first choice doesn't wait for them.
     """
-    # pylint: disable-next=global-statement
-    global total_price_including_vat
-    # pylint: disable-next=global-statement
-    global vat_rate
 
-    clear_screen()
-    print_banner(f"Add {sheet}")
+    importlib.import_module("fake_sheets" if FAKE_SHEETS
+                            else "google_client")
 
-    print(f"Please provide details of the new {sheet} transaction here:\n\n")
 
-    # Questions as variables so size can be determined to neatly display output
-    details_q = "Details"
-    totals_q = "Total including VAT:"
-    vat_rate_q = "Which VAT rate applies? (Press Enter for more details)"
+def load_partition_catalog(refresh=False):
+    """Builds the catalog of yearly ledger partitions
 
-    width = get_length_of_longest_list_item([details_q, totals_q, vat_rate_q])
+    Lists every spreadsheet available to the app in a single Drive
+    call and maps each purchases/sales spreadsheet to the year it
+    holds. The original un-suffixed spreadsheet is assigned the year
+    it was created in unless a suffixed partition already claims it.
 
-    space = "  \n"
-    formatted_details_q = f"{details_q}" + "."*(width - len(details_q)) + space
-    formatted_price_q = f"{totals_q}" + "."*(width - len(totals_q)) + space + \
-        "€"
-    formatted_vat_rate_q = f"{vat_rate_q}" + "."*(width - len(vat_rate_q)) \
-        + space
+    Returns: the partition catalog.
+    """
 
-    vat_rate = rate
-    total_price_including_vat = price_including_vat
+    if PARTITION_CATALOG and not refresh:
+        return PARTITION_CATALOG
 
-    if details is None:
-        details = input(formatted_details_q).strip()
-    else:
-        print(formatted_details_q + f"{details}")
+    files = get_gspread_client().list_spreadsheet_files()
+    catalog = {sheet: {} for sheet in LEDGER_NAMES}
+    legacy_files = {}
 
-    if total_price_including_vat is None:
-        total_price_including_vat = input(formatted_price_q).strip()
+    for file in files:
+        for sheet, name in LEDGER_NAMES.items():
+            if file["name"] == name:
+                legacy_files[sheet] = file
+            elif file["name"].startswith(f"{name}_"):
+                year = file["name"][len(name) + 1:]
+                if year.isdigit():
+                    catalog[sheet][year] = file["id"]
 
-        try:
-            total_price_including_vat = float(total_price_including_vat)
+    for sheet, file in legacy_files.items():
+        catalog[sheet].setdefault(file["createdTime"][:4], file["id"])
 
-        except ValueError:
-            display_message("Please check that the total price is a number", 0)
-            request_new_transaction(sheet=sheet, details=details)
+    PARTITION_CATALOG.clear()
+    PARTITION_CATALOG.update(catalog)
 
-    else:
-        print(formatted_price_q + str(total_price_including_vat))
+    return PARTITION_CATALOG
 
-    if vat_rate is None:
-        vat_rate = input(formatted_vat_rate_q).strip()
 
-        if "%" in vat_rate:
-            vat_rate = vat_rate.replace("%", "")
+def get_ledger_years(sheet):
+    """Lists the years available for a ledger
 
-        if vat_rate in ["23", "13.5", "9", "4.8", "0"]:
-            pass
-        elif vat_rate is None or vat_rate == "":
-            show_details_on_vat()
-            request_new_transaction(
-                sheet=sheet,
-                details=details,
-                price_including_vat=total_price_including_vat
-            )
-        else:
-            display_message("Please check this is a valid tax rate", 2)
-            show_details_on_vat()
-            request_new_transaction(
-                sheet=sheet,
-                details=details,
-                price_including_vat=total_price_including_vat
-            )
+    Returns a sorted list of years that have a partition for the
+    purchases/sales ledger.
+    """
 
-    return (details, total_price_including_vat, vat_rate)
+    return sorted(load_partition_catalog()[sheet])
 
 
-def calculate_vat(total_including_vat, rate):
-    """Calculate and formats VAT for updating sheets
+def get_selected_year():
+    """Retrieves the year being reviewed
 
-    Calculate appropriate vat and returns a comma separated string for
-    updating the google sheet.
+    Returns the year a user selected from the sub menu, or the current
+    year if they haven't picked one.
     """
 
-    vat_applicable = round(
-        ((float(total_including_vat) * float(rate)) / 100), 2
-    )
+    if selected_year is None:
+        return get_year()
 
-    # return [vat 23%, vat 13.5%, vat 9%, total vat, exempt]
-    if rate == "23":
-        return [vat_applicable, 0, 0, vat_applicable, 0]
+    return selected_year
 
-    if rate == "13.5":
-        return [0, vat_applicable, 0, vat_applicable, 0]
 
-    if rate == "9":
-        return [0, 0, vat_applicable, vat_applicable, 0]
+def create_partition(sheet, year):
+    """Creates the spreadsheet for a new year
 
-    if rate == "0":
-        return [0, 0, 0, 0, total_including_vat]
+    Function to create a "<ledger>_<year>" spreadsheet and share it with
+    everyone who can access the most recent partition, so a new year
+    appears alongside the old ones in Google Drive.
 
+    Returns: the new spreadsheet.
+    """
 
-def generate_next_invoice_number(sheet):
-    """Generates next invoice number based on last used
+    ledger = get_gspread_client().create(f"{LEDGER_NAMES[sheet]}_{year}")
+    years = get_ledger_years(sheet)
 
-    Function to get the last available invoice number on a google sheet
-    and iterates it by 1.
+    if years:
+        previous_ledger = get_selected_worksheet(sheet, years[-1])
+        for permission in previous_ledger.list_permissions():
+            if permission.get("emailAddress") and permission["role"] in [
+                    "owner", "writer"]:
+                ledger.share(permission["emailAddress"],
+                             perm_type=permission["type"],
+                             role="writer", notify=False)
+
+    PARTITION_CATALOG[sheet][year] = ledger.id
+    OPEN_PARTITIONS[ledger.id] = ledger
+
+    return ledger
+
+
+def get_exempt_heading(sheet):
+    """Retrieves the heading of the last column
+
+    Returns "Exempt" for sales, or "Intra-EU" for purchases.
     """
 
-    ledger = get_selected_worksheet(sheet)
+    if sheet == "sales":
+        return "Exempt"
 
-    all_months = get_list_of_all_sheet_titles(sheet)
-    all_months = reversed(all_months)
+    return "Intra-EU"
 
-    for month in all_months:
-        all_data = ledger.worksheet(month).get_all_values()
 
-        last_row = all_data[-1]
+def get_selected_worksheet(sheet, year=None):
+    """Assigns a 'sheet' variable between purchases and sales
 
-        # subtracting 1 below to account for gspread column v list numbering
-        last_invoice_number = last_row[Columns.invoice_number - 1]
+    Returns either purchases/sales spreadsheet for the given year
+    (defaulting to the selected year) so code is mostly reusable for
+    both. The current year's spreadsheet is created if it's missing.
+    """
 
-        try:
-            # pylint: disable-next=using-constant-test
-            if str(last_invoice_number).isnumeric:
-                # return last invoice number + 1 (next available)
-                return int(last_invoice_number) + 1
-        except ValueError:
-            # using try/except to determine whether values are numeric or
-            # not safely. No error reporting is needed here so choosing
-            # to pass
-            pass
+    if year is None:
+        year = get_selected_year()
 
+    partitions = load_partition_catalog()[sheet]
 
-def create_sheet_if_not_available(sheet, dont_provide_option=False):
-    """Creates a new sheet if a unavailable
+    if year not in partitions:
+        if year != get_year():
+            raise gspread.SpreadsheetNotFound(
+                f"No {sheet} ledger found for {year}")
+        return create_partition(sheet, year)
 
-    Function to check if a sheet for a particular month is
-    available, and direct a user to create one if necessary.
-    Accepting a dont_provide_option to pass through to
-    create_new_sheet function and ignoring asking a user which
-    month they wish to create a sheet for.
+    spreadsheet_id = partitions[year]
+    if spreadsheet_id not in OPEN_PARTITIONS:
+        OPEN_PARTITIONS[spreadsheet_id] = get_gspread_client().open_by_key(
+            spreadsheet_id)
+
+    return OPEN_PARTITIONS[spreadsheet_id]
+
+
+def get_partitions_for_range(sheet, start_date, end_date):
+    """Finds the worksheets covering a date range
+
+    Function to prune the ledger down to the yearly partitions and
+    month worksheets that can hold transactions between two dates,
+    only fetching worksheet titles for the years in range.
+
+    Returns: a list of (year, month) tuples in date order.
     """
 
-    month = get_month()
-    available_months = get_list_of_all_sheet_titles(sheet)
+    partitions = []
 
-    if month not in available_months:
-        display_message(f"No sheet available for {month}", 1)
-        create_new_sheet(sheet, dont_provide_option)
+    for year in get_ledger_years(sheet):
+        if not start_date.year <= int(year) <= end_date.year:
+            continue
 
+        first_month = start_date.month if int(year) == start_date.year else 1
+        last_month = end_date.month if int(year) == end_date.year else 12
+        months_in_range = MONTHS[first_month - 1:last_month]
+        available_months = get_list_of_all_sheet_titles(sheet, year)
 
-def add_new_transaction(sheet):
-    """Allows a user add a sales/purchases transaction
+        for month in months_in_range:
+            if month in available_months:
+                partitions.append((year, month))
 
-    Function to add a new transaction to a worksheet.
-    This function checks if a sheet for the current month is available
-    & generates it if necessary.
+    return partitions
+
+
+def ensure_sheet_capacity(ledger, properties, used_rows, new_rows=1):
+    """Grows a worksheet before it runs out of rows
+
+    Function to add another chunk of rows to a month worksheet, given
+    its properties, when the rows about to be appended wouldn't fit in
+    its grid.
     """
 
-    ledger = get_selected_worksheet(sheet)
+    row_count = properties["gridProperties"]["rowCount"]
 
-    create_sheet_if_not_available(sheet)
+    if used_rows + new_rows > row_count:
+        chunks = (used_rows + new_rows - row_count) // SHEET_ROW_CHUNK + 1
+        ledger.batch_update({"requests": [{"appendDimension": {
+            "sheetId": properties["sheetId"],
+            "dimension": "ROWS",
+            "length": chunks * SHEET_ROW_CHUNK
+        }}]})
 
-    details, total_including_vat, rate = request_new_transaction(sheet=sheet)
-    date, _ = get_current_date_and_time()
-    invoice_number = generate_next_invoice_number(sheet)
-    if invoice_number is None or invoice_number == "":
-        invoice_number = input(f"{Colors.red}\n\tNo invoice number available, \
-            please manually enter one: {Colors.white}\n")
-    formatted_vat_details = calculate_vat(total_including_vat, rate)
 
-    formatted_row = [date, details, invoice_number,
-                     total_including_vat] + formatted_vat_details
+def get_ledger_revision(ledger):
+    """Retrieves the revision of a spreadsheet
 
-    try:
-        month = get_month()
-        ledger.worksheet(month).append_row(formatted_row)
-        display_message("Sheet updated successfully", 2, False)
+    Asks Drive for just the modifiedTime and version of a spreadsheet,
+    a single small metadata call that changes whenever anyone edits it.
 
-    except FileNotFoundError as e:
-        display_message(f"Can't find file: {e}", 3)
+    Returns: a tuple of (modified_time, version).
+    """
 
-    sub_menu(sheet)
+    response = get_gspread_client().http_client.request(
+        "get",
+        f"{gspread.urls.DRIVE_FILES_API_V3_URL}/{ledger.id}",
+        params={"fields": "modifiedTime,version", "supportsAllDrives": True}
+    )
+    metadata = response.json()
 
+    return (metadata["modifiedTime"], metadata["version"])
 
-def display_all_transactions_for_month(sheet, month=None):
-    """Displays all transactions for a particular month
 
-    Function to display google worksheet to the terminal for
-    inspection purposes. This function tracks the largest item
-    in each column to provide a correctly formatted table.
+def invalidate_ledger_cache(ledger, month=None):
+    """Marks cached data for a spreadsheet as out of date
+
+    Function to forget the cached worksheet titles of a spreadsheet and
+    flag its month mirrors (or only one month if a month is given) for
+    a refresh. Mirrored rows are kept so the refresh can fetch just the
+    rows appended since.
     """
 
-    ledger = get_selected_worksheet(sheet)
-    if month is None:
-        create_sheet_if_not_available(sheet, dont_provide_option=True)
-        month = get_month()
+    if month is not None:
+        if (ledger.id, month) in MONTH_MIRRORS:
+            MONTH_MIRRORS[(ledger.id, month)]["stale"] = True
+        return
 
-    num_of_rows = len(ledger.worksheet(month).col_values(1))
-    num_of_cols = len(ledger.worksheet(month).row_values(1))
+    SHEET_TITLES_CACHE.pop(ledger.id, None)
+    SUMMARY_CACHE.pop(ledger.id, None)
+    for key, mirror in MONTH_MIRRORS.items():
+        if key[0] == ledger.id:
+            mirror["stale"] = True
 
-    columns_list = []
 
-    for i in range(num_of_cols):
-        new_list = ledger.worksheet(month).col_values(i + 1)
-        columns_list.insert(i, new_list)
+def validate_ledger_cache(ledger):
+    """Checks cached data for a spreadsheet is still current
 
-    print(f"\n{Colors.magenta}{month} {sheet}")
-    print(f"{Colors.blue}-" * 80)
+    Function to compare the spreadsheet's revision with the one the
+    cache was filled at, invalidating the cache if someone has edited
+    it since. Checks are skipped if one was made in the last
+    REVISION_CHECK_INTERVAL seconds.
+    """
 
-    dont_color = True
+    cached = LEDGER_REVISIONS.get(ledger.id)
+    if cached and monotonic() - cached["checked"] < REVISION_CHECK_INTERVAL:
+        return
 
-    for idx, i in enumerate(range(num_of_rows)):
-        # enumerating of rows and only colouring the first row of headings
-        # for greater readability
-        dont_color = idx >= 1
-        for y in range(num_of_cols):
-            width = get_length_of_longest_list_item(columns_list[y])
-            column_width = width - len(columns_list[y][i])
-            if not dont_color:
-                print(
-                    f"{Colors.blue}{columns_list[y][i]}" + " "*column_width,
-                    end=" | ")
+    revision = get_ledger_revision(ledger)
 
-            else:
-                print(f"{columns_list[y][i]}" + " "*column_width, end=" | ")
-        print()
+    if cached is None or cached["revision"] != revision:
+        invalidate_ledger_cache(ledger)
+        for month in read_edit_log(ledger):
+            forget_synced_rows(ledger, month)
 
-    click_to_continue()
+    LEDGER_REVISIONS[ledger.id] = {"revision": revision,
+                                   "checked": monotonic()}
 
 
-def get_list_of_all_sheet_titles(sheet):
-    """Creates a list of sheet titles/months
+def record_ledger_write(ledger, month=None):
+    """Marks a spreadsheet as changed by this app
 
-    Returns a list of all sheet titles, i.e: available months.
+    Function to call after writing to a spreadsheet so the next read
+    re-validates it. The written month is refreshed straight away and
+    the next revision check refreshes the rest, as there is no way to
+    tell our own edit apart from someone else's.
     """
 
-    ledger = get_selected_worksheet(sheet)
-    all_sheets = ledger.worksheets()
-    months = []
+    if month is None:
+        SHEET_TITLES_CACHE.pop(ledger.id, None)
+    else:
+        invalidate_ledger_cache(ledger, month)
 
-    for sheet in all_sheets:
-        months.append(sheet.title)
+    SUMMARY_CACHE.pop(ledger.id, None)
+    expire_revision_check(ledger)
 
-    return months
 
+def read_edit_log(ledger):
+    """Lists the months edited by other terminals
 
-def display_all_transactions_for_a_selected_month(sheet):
-    """Display all transactions for a provided month
+    Returns the months logged in the spreadsheet's edit log since this
+    process last read it, or none the first time it's read.
+    """
 
-    Function to request a user to select a month to view details of
-    in the terminal.
+    log_path = get_cache_path(EDIT_LOG_FILE.format(spreadsheet_id=ledger.id))
+    first_read = ledger.id not in EDIT_LOG_OFFSETS
+
+    try:
+        with open(log_path, encoding="utf-8") as log_file:
+            log_file.seek(EDIT_LOG_OFFSETS.get(ledger.id, 0))
+            months = log_file.read().splitlines()
+            EDIT_LOG_OFFSETS[ledger.id] = log_file.tell()
+    except FileNotFoundError:
+        EDIT_LOG_OFFSETS[ledger.id] = 0
+        return []
+
+    return [] if first_read else months
+
+
+def forget_synced_rows(ledger, month):
+    """Makes the next sync of a month re-read it in full
+
+    Function to clear the checksum of the last synced row in the
+    month's mirror and search index, as a row above it has changed.
+    """
+
+    if (ledger.id, month) in MONTH_MIRRORS:
+        MONTH_MIRRORS[(ledger.id, month)]["anchor"] = None
+        MONTH_MIRRORS[(ledger.id, month)]["stale"] = True
+
+    if SEARCH_INDEX and f"{ledger.id}|{month}" in SEARCH_INDEX["months"]:
+        SEARCH_INDEX["months"][f"{ledger.id}|{month}"]["anchor"] = None
+
+
+def expire_revision_check(ledger):
+    """Forces the next read of a spreadsheet to check its revision
+
+    Function to stop a recent revision check being trusted, so the
+    next read picks up changes made from anywhere else straight away.
     """
 
-    month, months = request_user_select_a_month(sheet)
+    if ledger.id in LEDGER_REVISIONS:
+        LEDGER_REVISIONS[ledger.id]["checked"] = 0
+
+
+def get_row_checksum(row):
+    """Checksums a sheet row
+
+    Returns a CRC32 of a row's cell values, used to tell whether a
+    mirrored row still matches the sheet.
+    """
+
+    return zlib.crc32("\x1f".join(row).encode("utf-8"))
+
+
+def pad_row(row):
+    """Pads a sheet row to the full width of a month worksheet
+
+    The Sheets API leaves trailing empty cells off the rows it returns,
+    so rows are padded out to the Exempt/Intra-EU column.
+    """
+
+    return list(row) + [""] * (Columns.exempt - len(row))
+
+
+def fetch_month_rows(ledger, months, positions):
+    """Fetches new rows for several month worksheets at once
+
+    Function to bring a set of months up to date given the number of
+    rows already synced and the checksum of the last of them for each.
+    The tails of every known month are fetched in one batch call and
+    any month that is new, or whose last synced row has changed, is
+    re-read in full in a second batch call.
+
+    Returns: a dict of {month: (is_full_read, rows)} where rows are the
+    appended rows for a delta or every row for a full read.
+    """
+
+    results = {}
+    tail_months = [month for month in months
+                   if positions.get(month) and positions[month][0] > 0]
+    full_months = [month for month in months if month not in tail_months]
+
+    if tail_months:
+        response = ledger.values_batch_get(
+            [f"'{month}'!A{positions[month][0]}:I" for month in tail_months],
+            params={"fields": "valueRanges.values"})
+
+        for month, value_range in zip(tail_months,
+                                      response.get("valueRanges", [])):
+            fetched_rows = [pad_row(row)
+                            for row in value_range.get("values", [])]
+
+            if fetched_rows and \
+                    get_row_checksum(fetched_rows[0]) == positions[month][1]:
+                results[month] = (False, fetched_rows[1:])
+            else:
+                full_months.append(month)
+
+    if full_months:
+        response = ledger.values_batch_get(
+            [f"'{month}'!A1:I" for month in full_months],
+            params={"fields": "valueRanges.values"})
+
+        for month, value_range in zip(full_months,
+                                      response.get("valueRanges", [])):
+            results[month] = (True, [pad_row(row)
+                                     for row in value_range.get("values", [])])
+
+    return results
+
+
+def sync_month_mirror(ledger, month):
+    """Brings the local mirror of a month worksheet up to date
+
+    Function to keep a local copy of a month's rows along with the
+    number of rows synced. As rows are only ever appended, a refresh
+    fetches from the last synced row down: if that row still matches
+    its checksum the new rows are appended to the mirror, otherwise
+    rows above it were edited or removed and the whole month is
+    re-read, as it is every MIRROR_FULL_RESYNC_EVERY refreshes.
+
+    Returns: the mirror.
+    """
+
+    key = (ledger.id, month)
+    mirror = MONTH_MIRRORS.get(key)
+
+    if mirror is not None and "snapshot" in mirror:
+        read_snapshot_month(mirror)
+
+    if mirror is not None and not mirror["stale"]:
+        return mirror
+
+    positions = {}
+    if mirror is not None and mirror["rows"] and \
+            mirror["deltas"] < MIRROR_FULL_RESYNC_EVERY:
+        positions[month] = (len(mirror["rows"]), mirror["anchor"])
+
+    is_full_read, rows = fetch_month_rows(ledger, [month], positions)[month]
+
+    if is_full_read:
+        mirror = {"rows": rows, "deltas": 0}
+        MONTH_MIRRORS[key] = mirror
+    else:
+        mirror["rows"].extend(rows)
+        mirror["deltas"] += 1
+
+    mirror["anchor"] = get_row_checksum(mirror["rows"][-1]) \
+        if mirror["rows"] else None
+    mirror["stale"] = False
+
+    return mirror
+
+
+def get_month_values(sheet, month, year=None):
+    """Retrieves every row of a month worksheet
+
+    Returns the rows of a month, header included, from the local
+    mirror, fetching only rows appended since the last sync if the
+    spreadsheet has changed.
+    """
+
+    ledger = get_selected_worksheet(sheet, year)
+
+    archive = get_closed_months(ledger.id).get(month)
+    if archive is not None:
+        return archive["rows"]
+
+    validate_ledger_cache(ledger)
+
+    return sync_month_mirror(ledger, month)["rows"]
+
+
+def get_rows_checksum(rows):
+    """Checksums the rows of a month
+
+    Returns a CRC32 of every cell value, used to tell a closed month's
+    archive hasn't been damaged.
+    """
+
+    return zlib.crc32("\x1e".join("\x1f".join(row)
+                                  for row in rows).encode("utf-8"))
+
+
+def get_closed_months(spreadsheet_id, reload=False):
+    """Loads the archives of a spreadsheet's closed months
+
+    Function to read the archives once per process, or again if
+    reload is set, e.g. as another terminal may have closed a month
+    since. An archive whose checksum doesn't match is left out, so the
+    month is read from the sheet instead.
+
+    Returns: a dict of {month: archive}.
+    """
+
+    if spreadsheet_id in CLOSED_MONTHS and not reload:
+        return CLOSED_MONTHS[spreadsheet_id]
+
+    folder = get_cache_path(os.path.join(CLOSED_MONTHS_DIR, spreadsheet_id))
+    archives = {}
+
+    try:
+        file_names = sorted(os.listdir(folder))
+    except FileNotFoundError:
+        file_names = []
+
+    for file_name in file_names:
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(folder, file_name),
+                      encoding="utf-8") as archive_file:
+                archive = json.load(archive_file)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if archive.get("checksum") == get_rows_checksum(archive["rows"]):
+            archives[archive["month"]] = archive
+
+    CLOSED_MONTHS[spreadsheet_id] = archives
+
+    return archives
+
+
+def get_closed_year_titles(sheet, year):
+    """Finds the months of a year that is closed
+
+    A year before the current one is closed once every month it had
+    when its last month was closed is closed, and is never read from
+    the sheets again.
+
+    Returns: the year's months, or None if it isn't closed.
+    """
+
+    spreadsheet_id = load_partition_catalog()[sheet].get(year)
+
+    if spreadsheet_id is None or int(year) >= int(get_year()):
+        return None
+
+    archives = get_closed_months(spreadsheet_id)
+    if not archives:
+        return None
+
+    titles = max(archives.values(),
+                 key=lambda archive: archive["closed_at"])["titles"]
+    if any(month not in archives for month in titles):
+        return None
+
+    return titles
+
+
+def write_month_archive(ledger, sheet, year, month, rows, titles):
+    """Archives the rows and totals of a closed month
+
+    Function to save the month's rows, its totals in cents for each of
+    Columns.summed and the months the spreadsheet had. The archive is
+    linked into place in one step and only if there isn't one yet, so
+    it's never replaced once written, even by another terminal closing
+    the same month.
+
+    Returns: the month's archive.
+    """
+
+    cents = []
+    bad_cells = 0
+    for column in Columns.summed:
+        column_cents, bad_column_cells = sum_money_column(
+            [row[column - 1] for row in rows[1:]])
+        cents.append(column_cents)
+        bad_cells += len(bad_column_cells)
+
+    archive = {
+        "sheet": sheet, "year": year, "month": month,
+        "closed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "titles": titles, "rows": rows, "cents": cents,
+        "bad_cells": bad_cells, "checksum": get_rows_checksum(rows)
+    }
+
+    folder = get_cache_path(os.path.join(CLOSED_MONTHS_DIR, ledger.id))
+    os.makedirs(folder, exist_ok=True)
+    archive_path = os.path.join(folder, f"{month}.json")
+    temporary_file = f"{archive_path}.{os.getpid()}.tmp"
+
+    with open(temporary_file, "w", encoding="utf-8") as archive_file:
+        json.dump(archive, archive_file)
+    os.chmod(temporary_file, 0o444)
+
+    try:
+        os.link(temporary_file, archive_path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temporary_file)
+
+    MONTH_MIRRORS.pop((ledger.id, month), None)
+
+    return get_closed_months(ledger.id, reload=True).get(month, archive)
+
+
+def archive_marked_months(ledger, sheet, year, properties):
+    """Archives months closed by another deployment
+
+    Function to read every month worksheet marked closed that hasn't
+    been archived here yet, in one batch call, and archive it.
+    """
+
+    titles = sorted([title for title in properties if title in MONTHS],
+                    key=MONTHS.index)
+    marked_months = [month for month in titles if properties[month]["closed"]]
+
+    if all(month in get_closed_months(ledger.id) for month in marked_months):
+        return
+
+    # another terminal here may have archived them already
+    archives = get_closed_months(ledger.id, reload=True)
+    missing_months = [month for month in marked_months
+                      if month not in archives]
+
+    if missing_months:
+        for month, (_, rows) in fetch_month_rows(ledger, missing_months,
+                                                 {}).items():
+            write_month_archive(ledger, sheet, year, month, rows, titles)
+
+
+def close_month(sheet, year, month):
+    """Closes a finished month of a ledger
+
+    Function to protect the month worksheet from edits and mark it
+    closed in one batch call, then read it a last time and archive its
+    rows and totals locally. From then on the month is only read from
+    the archive, and once every month of a past year is closed the
+    year's titles and totals come from the archives too.
+
+    Returns: the month's archive. Raises ValueError if the month
+    hasn't finished yet or has no worksheet.
+    """
+
+    if (int(year), MONTHS.index(month)) >= \
+            (int(get_year()), MONTHS.index(get_month())):
+        raise ValueError(f"{month} {year} hasn't finished yet")
+
+    ledger = get_selected_worksheet(sheet, year)
+    archive = get_closed_months(ledger.id, reload=True).get(month)
+    if archive is not None:
+        return archive
+
+    properties = get_sheet_properties(ledger)
+    if month not in properties:
+        raise ValueError(f"There's no {sheet} worksheet for {month} {year}")
+
+    if not properties[month]["closed"]:
+        sheet_id = properties[month]["sheetId"]
+        ledger.batch_update({"requests": [
+            {"addProtectedRange": {"protectedRange": {
+                "range": {"sheetId": sheet_id},
+                "description": "Closed, VAT filed",
+                "warningOnly": False
+            }}},
+            {"createDeveloperMetadata": {"developerMetadata": {
+                "metadataKey": CLOSED_MONTH_KEY,
+                "metadataValue": get_current_date_and_time()[0],
+                "location": {"sheetId": sheet_id},
+                "visibility": "DOCUMENT"
+            }}}
+        ]})
+        record_ledger_write(ledger)
+
+    _, rows = fetch_month_rows(ledger, [month], {})[month]
+    titles = sorted([title for title in properties if title in MONTHS],
+                    key=MONTHS.index)
+
+    return write_month_archive(ledger, sheet, year, month, rows, titles)
+
+
+def close_month_menu(sheet):
+    """Request a month to close from a user and close it
+
+    Function to list the open months of the selected year and close
+    the one chosen once the user confirms its VAT has been filed.
+    """
+
+    year = get_selected_year()
+    months = [month for month in get_list_of_all_sheet_titles(sheet, year)
+              if not is_month_closed(sheet, year, month)]
+
+    print(f"\nOpen months: {Colors.green}{months}")
+    month = input("\nWhich month's VAT has been filed? \n")
+    month = month.strip().lower().capitalize()
+
+    if month not in months:
+        display_message("Please check the value you entered!", 2)
+        return
+
+    confirm = input(f"\nClose {month} {year}? Its {sheet} can't be changed " +
+                    "afterwards (y/n): \n")
+    if confirm.strip().lower() != "y":
+        return
+
+    display_wait_message("Closing the month")
+
+    try:
+        archive = close_month(sheet, year, month)
+    except ValueError as e:
+        display_message(str(e), 3)
+        return
+    except gspread.exceptions.APIError as e:
+        display_message(f"The month couldn't be closed: {e}", 3)
+        return
+
+    display_message(f"{month} {year} closed, {len(archive['rows']) - 1} " +
+                    "transactions archived", 2, False)
+
+
+def is_month_closed(sheet, year, month):
+    """Checks whether a month of a ledger is closed
+
+    Returns: True if the month has been archived.
+    """
+
+    spreadsheet_id = load_partition_catalog()[sheet].get(year)
+
+    return spreadsheet_id is not None and \
+        month in get_closed_months(spreadsheet_id)
+
+
+def encode_snapshot_month(rows):
+    """Encodes a month's rows for a snapshot
+
+    The rows are stored a column at a time: a table of the character
+    offset each cell ends at, the cells' text as UTF-8 and, for each
+    summed column, the cells in cents as 64 bit integers (0 for a cell
+    that isn't an amount). Every part is padded to 8 bytes.
+
+    Returns: a tuple of (data, layout), layout giving the start of
+    each part within data and the cells that aren't amounts in each
+    summed column.
+    """
+
+    columns = [[row[column] for row in rows]
+               for column in range(Columns.exempt)]
+
+    offsets = array("I", [0])
+    for column in columns:
+        for cell in column:
+            offsets.append(offsets[-1] + len(cell))
+
+    text = "".join("".join(column) for column in columns).encode("utf-8")
+
+    cents = array("q")
+    bad_cells = []
+    for column in Columns.summed:
+        # the header row isn't an amount
+        amounts = [parse_money(cell) for cell in columns[column - 1][1:]]
+        cents.extend([0] + [amount or 0 for amount in amounts])
+        bad_cells.append(amounts.count(None))
+
+    data = bytearray()
+    layout = {"rows": len(rows), "bad_cells": bad_cells}
+
+    for part, chunk in [("offsets", offsets.tobytes()), ("text", text),
+                        ("cents", cents.tobytes())]:
+        layout[part] = (len(data), len(chunk))
+        data += chunk + bytes(-len(chunk) % 8)
+
+    return (bytes(data), layout)
+
+
+def save_snapshot():
+    """Saves the fetched ledger data of the current business
+
+    Function to write the partition catalog, worksheet titles, Summary
+    totals, revisions and month mirrors to SNAPSHOT_FILE: the magic
+    bytes, the length of a JSON header describing everything, the
+    header and then each month encoded by encode_snapshot_month. The
+    file is replaced in one go so a crash never leaves half of one,
+    and other processes keep reading the copy they mapped.
+    """
+
+    spreadsheet_ids = {spreadsheet_id for years in PARTITION_CATALOG.values()
+                       for spreadsheet_id in years.values()}
+    if not spreadsheet_ids:
+        return
+
+    header = {
+        "ledgers": dict(LEDGER_NAMES),
+        "catalog": PARTITION_CATALOG,
+        "titles": {}, "summaries": {}, "revisions": {}, "edit_logs": {},
+        "months": []
+    }
+
+    for spreadsheet_id in spreadsheet_ids:
+        if spreadsheet_id in SHEET_TITLES_CACHE:
+            header["titles"][spreadsheet_id] = \
+                SHEET_TITLES_CACHE[spreadsheet_id]
+        if spreadsheet_id in SUMMARY_CACHE:
+            header["summaries"][spreadsheet_id] = \
+                SUMMARY_CACHE[spreadsheet_id]
+        if spreadsheet_id in LEDGER_REVISIONS:
+            header["revisions"][spreadsheet_id] = \
+                LEDGER_REVISIONS[spreadsheet_id]["revision"]
+        if spreadsheet_id in EDIT_LOG_OFFSETS:
+            header["edit_logs"][spreadsheet_id] = \
+                EDIT_LOG_OFFSETS[spreadsheet_id]
+
+    data = bytearray()
+
+    for (spreadsheet_id, month), mirror in list(MONTH_MIRRORS.items()):
+        if spreadsheet_id not in spreadsheet_ids:
+            continue
+        if "snapshot" in mirror:
+            read_snapshot_month(mirror)
+
+        month_data, layout = encode_snapshot_month(mirror["rows"])
+        layout.update({
+            "spreadsheet_id": spreadsheet_id, "month": month,
+            "start": len(data), "anchor": mirror["anchor"],
+            "deltas": mirror["deltas"], "stale": mirror["stale"]
+        })
+        header["months"].append(layout)
+        data += month_data
+
+    encoded_header = json.dumps(header).encode("utf-8")
+    path = get_cache_path(SNAPSHOT_FILE)
+    temporary_path = f"{path}.{os.getpid()}"
+
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(SNAPSHOT_MAGIC)
+        snapshot_file.write(len(encoded_header).to_bytes(4, "little"))
+        snapshot_file.write(encoded_header)
+        snapshot_file.write(bytes(-snapshot_file.tell() % 8))
+        snapshot_file.write(data)
+    os.replace(temporary_path, path)
+
+    SNAPSHOTS.setdefault(current_tenant, {})["saved"] = monotonic()
+
+
+def save_snapshot_if_due():
+    """Saves the snapshot if it hasn't been for SNAPSHOT_INTERVAL
+
+    Function to call while the app is in use, so a crash loses at most
+    a few minutes of fetched data.
+    """
+
+    snapshot = SNAPSHOTS.setdefault(current_tenant, {})
+    snapshot.setdefault("saved", monotonic())
+
+    if monotonic() - snapshot["saved"] >= SNAPSHOT_INTERVAL:
+        save_snapshot()
+
+
+def restore_snapshot():
+    """Restores the fetched ledger data of the current business
+
+    Function to memory-map SNAPSHOT_FILE and fill the caches from its
+    header. Month mirrors are only read from the mapping when first
+    used. Restored spreadsheets must have their revision checked
+    before they're used, as they might have changed since. A snapshot
+    for other ledgers, or without the current year's partitions, is
+    ignored.
+
+    Returns: a list of the spreadsheet ids restored.
+    """
+
+    try:
+        with open(get_cache_path(SNAPSHOT_FILE), "rb") as snapshot_file:
+            snapshot = mmap.mmap(snapshot_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return []
+
+    if snapshot[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        return []
+
+    header_start = len(SNAPSHOT_MAGIC) + 4
+    header_end = header_start + int.from_bytes(
+        snapshot[len(SNAPSHOT_MAGIC):header_start], "little")
+    header = json.loads(snapshot[header_start:header_end])
+    data_start = header_end + -header_end % 8
+
+    if header["ledgers"] != LEDGER_NAMES or any(
+            get_year() not in header["catalog"].get(sheet, {})
+            for sheet in LEDGER_NAMES):
+        return []
+
+    PARTITION_CATALOG.update(header["catalog"])
+    SHEET_TITLES_CACHE.update(header["titles"])
+    EDIT_LOG_OFFSETS.update(header["edit_logs"])
+
+    for spreadsheet_id, totals in header["summaries"].items():
+        SUMMARY_CACHE[spreadsheet_id] = {
+            month: {int(column): total for column, total in columns.items()}
+            for month, columns in totals.items()}
+
+    for spreadsheet_id, revision in header["revisions"].items():
+        LEDGER_REVISIONS[spreadsheet_id] = {"revision": tuple(revision),
+                                            "checked": 0}
+
+    for layout in header["months"]:
+        MONTH_MIRRORS[(layout["spreadsheet_id"], layout["month"])] = {
+            "rows": None, "anchor": layout["anchor"],
+            "deltas": layout["deltas"], "stale": layout["stale"],
+            "snapshot": (snapshot, data_start + layout["start"], layout)
+        }
+
+    restored = list(header["revisions"])
+    SNAPSHOTS[current_tenant] = {"restored": restored, "saved": monotonic()}
+
+    return restored
+
+
+def read_snapshot_month(mirror):
+    """Reads a restored month mirror's rows from its snapshot
+
+    Function to rebuild the rows from the mapped text and offsets, and
+    keep the month's cents columns, still in the mapping, as the
+    mirror's snapshot totals.
+    """
+
+    snapshot, start, layout = mirror.pop("snapshot")
+    view = memoryview(snapshot)
+    row_count = layout["rows"]
+
+    def get_part(part):
+        offset, length = layout[part]
+        return view[start + offset:start + offset + length]
+
+    offsets = get_part("offsets").cast("I").tolist()
+    text = str(get_part("text"), "utf-8")
+    columns = [[text[offsets[cell]:offsets[cell + 1]]
+                for cell in range(column * row_count,
+                                  (column + 1) * row_count)]
+               for column in range(Columns.exempt)]
+    mirror["rows"] = [list(row) for row in zip(*columns)]
+
+    cents = get_part("cents").cast("q")
+    mirror["snapshot_totals"] = {
+        "rows": row_count,
+        "cents": {column: cents[index * row_count:(index + 1) * row_count]
+                  for index, column in enumerate(Columns.summed)},
+        "bad_cells": dict(zip(Columns.summed, layout["bad_cells"]))
+    }
+
+
+def validate_snapshot(spreadsheet_ids):
+    """Checks restored ledger data against the sheets
+
+    Function to run in a background thread at start up, opening each
+    restored spreadsheet and checking its revision while the welcome
+    page shows, so by the time a user picks something its data is
+    known to be current, or only the rows added since need fetching.
+    """
+
+    try:
+        for sheet, years in list(PARTITION_CATALOG.items()):
+            for year, spreadsheet_id in list(years.items()):
+                if spreadsheet_id in spreadsheet_ids:
+                    validate_ledger_cache(get_selected_worksheet(sheet, year))
+    except Exception:  # pylint: disable=broad-exception-caught
+        # each spreadsheet is checked again before it's used anyway
+        pass
+
+
+def get_summary_row(month):
+    """Builds a Summary worksheet row for a month
+
+    Returns the month name followed by a SUM formula for each totalled
+    column of that month's worksheet, e.g. =SUM('May'!D2:D).
+    """
+
+    row = [month]
+
+    for column in Columns.summed:
+        column_letter = chr(ord("A") + column - 1)
+        row.append(f"=SUM('{month}'!{column_letter}2:{column_letter})")
+
+    return row
+
+
+def write_summary_rows(ledger, months):
+    """Adds months to a Summary worksheet
+
+    Function to write the SUM formulas for each month in a single call.
+    Every month has a fixed row (January is row 2) so rows can be
+    added in any order.
+    """
+
+    data = []
+
+    for month in months:
+        row_number = MONTHS.index(month) + 2
+        data.append({
+            "range": f"'{SUMMARY_SHEET}'!A{row_number}:G{row_number}",
+            "values": [get_summary_row(month)]
+        })
+
+    ledger.values_batch_update(
+        {"valueInputOption": "USER_ENTERED", "data": data})
+    record_ledger_write(ledger)
+
+
+def get_sheet_properties(ledger):
+    """Retrieves the worksheets in a spreadsheet
+
+    Fetches only the title, id and row count of each worksheet, and
+    whether it's marked closed, rather than the full spreadsheet
+    metadata.
+
+    Returns: a dict of {title: properties}, with "closed" added.
+    """
+
+    metadata = ledger.fetch_sheet_metadata(params={
+        "fields": "sheets(properties(sheetId,title,gridProperties.rowCount)," +
+                  "developerMetadata.metadataKey)"
+    })
+
+    properties = {}
+    for worksheet in metadata.get("sheets", []):
+        worksheet["properties"]["closed"] = any(
+            marker.get("metadataKey") == CLOSED_MONTH_KEY
+            for marker in worksheet.get("developerMetadata", []))
+        properties[worksheet["properties"]["title"]] = worksheet["properties"]
+
+    return properties
+
+
+def get_month_headings(sheet):
+    """Retrieves the heading row of a month worksheet
+
+    Returns the column headings for a purchases/sales month.
+    """
+
+    return ["Date", "Details", "Inv", "Total", "23%", "13.5%", "9%", "VAT",
+            get_exempt_heading(sheet)]
+
+
+def get_update_cells_request(sheet_id, row_index, values, color=None):
+    """Builds a batch_update request writing one row of cells
+
+    Values starting with "=" are written as formulas, anything else as
+    text. A background color is applied to the cells if given.
+
+    Returns: the request.
+    """
+
+    cells = []
+    fields = "userEnteredValue"
+
+    for value in values:
+        if str(value).startswith("="):
+            cell = {"userEnteredValue": {"formulaValue": value}}
+        else:
+            cell = {"userEnteredValue": {"stringValue": value}}
+
+        if color:
+            cell["userEnteredFormat"] = {"backgroundColor": color}
+
+        cells.append(cell)
+
+    if color:
+        fields += ",userEnteredFormat.backgroundColor"
+
+    return {"updateCells": {
+        "start": {"sheetId": sheet_id, "rowIndex": row_index,
+                  "columnIndex": 0},
+        "rows": [{"values": cells}],
+        "fields": fields
+    }}
+
+
+def get_add_sheet_request(sheet_id, title, rows, cols, index=None):
+    """Builds a batch_update request adding a worksheet
+
+    Returns: the request.
+    """
+
+    properties = {
+        "sheetId": sheet_id,
+        "title": title,
+        "gridProperties": {"rowCount": rows, "columnCount": cols}
+    }
+
+    if index is not None:
+        properties["index"] = index
+
+    return {"addSheet": {"properties": properties}}
+
+
+def provision_sheets(sheet, months, year=None):
+    """Creates month worksheets in a single request
+
+    Function to add any of the given months missing from a spreadsheet
+    along with their formatted heading rows and Summary formulas,
+    creating the Summary worksheet too if there isn't one, all in one
+    Spreadsheet.batch_update. Finding which months exist takes one
+    small metadata call beforehand.
+
+    Returns: the list of months created.
+    """
+
+    ledger = get_selected_worksheet(sheet, year)
+    properties = get_sheet_properties(ledger)
+    missing_months = [month for month in MONTHS
+                      if month in months and month not in properties]
+
+    if not missing_months and SUMMARY_SHEET in properties:
+        return []
+
+    requests = []
+    next_sheet_id = max([worksheet["sheetId"]
+                         for worksheet in properties.values()],
+                        default=0) + 1
+
+    if SUMMARY_SHEET in properties:
+        summary_id = properties[SUMMARY_SHEET]["sheetId"]
+        summary_months = missing_months
+    else:
+        summary_id = next_sheet_id
+        next_sheet_id += 1
+        summary_months = [month for month in MONTHS
+                          if month in properties or month in missing_months]
+        requests.append(get_add_sheet_request(
+            summary_id, SUMMARY_SHEET, len(MONTHS) + 1,
+            len(Columns.summed) + 1, index=0))
+        requests.append(get_update_cells_request(
+            summary_id, 0, ["Month", sheet.capitalize(), "23%", "13.5%",
+                            "9%", "VAT", get_exempt_heading(sheet)]))
+
+    for month in missing_months:
+        requests.append(get_add_sheet_request(
+            next_sheet_id, month, SHEET_ROW_CHUNK, 10))
+        requests.append(get_update_cells_request(
+            next_sheet_id, 0, get_month_headings(sheet), color={
+                'blue': 0.65882355,
+                'green': 0.84313726,
+                'red': 0.7137255
+            }))
+        next_sheet_id += 1
+
+    # formulas go last so the worksheets they refer to exist by then
+    for month in summary_months:
+        requests.append(get_update_cells_request(
+            summary_id, MONTHS.index(month) + 1, get_summary_row(month)))
+
+    ledger.batch_update({"requests": requests})
+    record_ledger_write(ledger)
+
+    return missing_months
+
+
+def provision_whole_year(year):
+    """Creates every missing month of a year for both ledgers
+
+    Function to set up a whole year in advance with one request per
+    spreadsheet, creating the year's spreadsheets if need be. Only the
+    current year and the next PROVISION_YEARS_AHEAD can be created, so
+    a mistyped year doesn't become a partition shared with everyone.
+
+    Returns: a dict of {sheet: months created}.
+    Raises ValueError if a spreadsheet is missing for a year outside
+    that window.
+    """
+
+    created = {}
+    first_year = int(get_year())
+    last_year = first_year + PROVISION_YEARS_AHEAD
+
+    if not first_year <= int(year) <= last_year and any(
+            year not in get_ledger_years(sheet) for sheet in LEDGER_NAMES):
+        raise ValueError(f"Spreadsheets can only be created for {first_year}" +
+                         f" to {last_year}, not {year}")
+
+    for sheet in LEDGER_NAMES:
+        if year not in get_ledger_years(sheet):
+            create_partition(sheet, year)
+        created[sheet] = provision_sheets(sheet, MONTHS, year)
+
+    return created
+
+
+def parse_money(value):
+    """Converts a sheet value to cents
+
+    Reads numbers as well as amounts typed as text, e.g. "€1,234.50",
+    "1.234,50", "EUR 12", "-€5" or "(12.00)" for a negative amount. A
+    lone comma is read as thousands if three digits follow it and as
+    decimals otherwise. Thousands must be grouped in threes.
+
+    Returns: the amount in cents, 0 for a blank cell, or None if the
+    value isn't an amount.
+    """
+
+    try:
+        return round(float(value) * 100)
+    except (TypeError, ValueError, OverflowError):
+        pass
+
+    if value is None or not str(value).strip():
+        return 0
+
+    text = str(value).strip()
+
+    negative = text.startswith("(") and text.endswith(")")
+    if negative:
+        text = text[1:-1].strip()
+
+    for code in CURRENCY_CODES:
+        text = text.removeprefix(code).removesuffix(code)
+    text = text.strip().strip(CURRENCY_SYMBOLS).strip()
+    if text.startswith("-"):
+        negative = not negative
+        text = text[1:].strip().strip(CURRENCY_SYMBOLS).strip()
+
+    if not text or not text[0].isdigit() or \
+            text.strip("0123456789" + THOUSANDS_SEPARATORS):
+        return None
+
+    # the decimal separator is the last "." or "," if it's only used once
+    decimal_index = max(text.rfind("."), text.rfind(","))
+    if decimal_index >= 0:
+        separator = text[decimal_index]
+        fraction = text[decimal_index + 1:]
+        if text.count(separator) > 1 or \
+                (separator == "," and "." not in text and len(fraction) == 3):
+            decimal_index = -1
+
+    if decimal_index >= 0:
+        whole, fraction = text[:decimal_index], text[decimal_index + 1:]
+    else:
+        whole, fraction = text, ""
+
+    # thousands are only grouped in threes, so "12.5.3" is a typo
+    groups = re.split(f"[{re.escape(THOUSANDS_SEPARATORS)}]", whole)
+    if any(len(group) != 3 for group in groups[1:]) or \
+            not fraction.isdigit() and fraction:
+        return None
+
+    whole = "".join(groups)
+
+    cents = round(float(f"{whole or 0}.{fraction or 0}") * 100)
+
+    return -cents if negative else cents
+
+
+def sum_money_column(values, row_numbers=None):
+    """Adds up a column of sheet values in cents
+
+    Function to total a whole column at once, converting it in a single
+    pass when every cell is a plain number and falling back to
+    parse_money for each cell otherwise. Cells that aren't amounts are
+    left out of the total and reported. Rows are numbered from 2,
+    after the header, unless their row numbers are given.
+
+    Returns: a tuple of (total_cents, bad_cells), bad_cells being a
+    list of (row_number, value) tuples.
+    """
+
+    try:
+        # exact to the cent for any realistic column, as fsum doesn't
+        # accumulate rounding errors
+        total = math.fsum(map(float, filter(None, values)))
+        if math.isfinite(total):
+            return (round(total * 100), [])
+    except (TypeError, ValueError):
+        pass
+
+    if row_numbers is None:
+        row_numbers = range(2, len(values) + 2)
+
+    total_cents = 0
+    bad_cells = []
+
+    for row_number, value in zip(row_numbers, values):
+        cents = parse_money(value)
+        if cents is None:
+            bad_cells.append((row_number, value))
+        else:
+            total_cents += cents
+
+    return (total_cents, bad_cells)
+
+
+def get_summary_totals(sheet, year=None):
+    """Retrieves every monthly total from the Summary worksheet
+
+    Reads the whole Summary worksheet in one call, creating it or
+    adding any months it is missing first. Totals are cached until the
+    spreadsheet changes. A closed year's totals come from the archives
+    of its months. A month still missing once its row has been added
+    counts as zero.
+
+    Returns: a dict of {month: {column: total}}.
+    """
+
+    if year is None:
+        year = get_selected_year()
+
+    closed_titles = get_closed_year_titles(sheet, year)
+    if closed_titles is not None:
+        archives = get_closed_months(
+            load_partition_catalog()[sheet][year])
+        return {month: {column: cents / 100 for column, cents
+                        in zip(Columns.summed, archives[month]["cents"])}
+                for month in closed_titles}
+
+    ledger = get_selected_worksheet(sheet, year)
+    validate_ledger_cache(ledger)
+
+    if ledger.id in SUMMARY_CACHE:
+        return SUMMARY_CACHE[ledger.id]
+
+    months = get_list_of_all_sheet_titles(sheet, year)
+    summary_range = f"'{SUMMARY_SHEET}'!A2:G{len(MONTHS) + 1}"
+    params = {"valueRenderOption": "UNFORMATTED_VALUE", "fields": "values"}
+
+    try:
+        response = ledger.values_get(summary_range, params=params)
+    except gspread.exceptions.APIError:
+        # the range can't be parsed if the worksheet doesn't exist yet
+        provision_sheets(sheet, [], year)
+        response = ledger.values_get(summary_range, params=params)
+
+    # the rows of missing months are added and the range read once more
+    for is_reread in [False, True]:
+        totals = {}
+
+        for row in response.get("values", []):
+            if row and row[0] in months:
+                values = list(row[1:]) + \
+                    [0] * (len(Columns.summed) + 1 - len(row))
+                # a formula error such as "#REF!" counts as nothing
+                totals[row[0]] = {
+                    column: (parse_money(value) or 0) / 100
+                    for column, value in zip(Columns.summed, values)
+                }
+
+        missing_months = [month for month in months if month not in totals]
+        if not missing_months or is_reread:
+            break
+
+        write_summary_rows(ledger, missing_months)
+        response = ledger.values_get(summary_range, params=params)
+
+    if missing_months:
+        # e.g. the read lagging the write, so not cached to try again
+        return {**totals, **{month: dict.fromkeys(Columns.summed, 0)
+                             for month in missing_months}}
+
+    SUMMARY_CACHE[ledger.id] = totals
+
+    return totals
+
+
+def get_current_date_and_time():
+    """Retrieves current date & time
+
+    Returns the current date and time (formatted) to accurately
+    log a transaction. Format of date is compatible with
+    google-sheets (mm/dd/YYYY).
+    """
+
+    now = datetime.datetime.now()
+
+    # using (month/day/year) format for better google sheets integraton
+    date = now.strftime("%m/%d/%Y")
+    time = now.strftime("%H:%M:%S")
+    return (date, time)
+
+
+def get_month():
+    """Retieves current month
+
+    Returns the current month so the correct spreadsheet can be updated.
+    """
+
+    now = datetime.datetime.now()
+
+    month = now.strftime("%B")
+
+    return month
+
+
+def get_year():
+    """Retrieves current year
+
+    Returns the current year so the correct ledger partition can be updated.
+    """
+
+    now = datetime.datetime.now()
+
+    year = now.strftime("%Y")
+
+    return year
+
+
+def request_date_from_user(prompt, allow_blank=False):
+    """Request a date from a user
+
+    Function to ask a user for a date in dd/mm/yyyy format, asking
+    again until a valid date is entered. If allow_blank is set a user
+    can press Enter to skip the date.
+
+    Returns: a datetime.date, or None if skipped.
+    """
+
+    while True:
+        response = input(f"\n{prompt} " + f"{Colors.green}(dd/mm/yyyy): \n")
+
+        if allow_blank and not response.strip():
+            return None
+
+        try:
+            return datetime.datetime.strptime(
+                response.strip(), "%d/%m/%Y").date()
+        except ValueError:
+            print(f"{Colors.red}\nPlease enter a date like 31/01/2024")
+
+
+def request_input_from_user():
+    """Request input from a user
+
+    Ask the user to make a selection, broken out to a function
+    for consistent behaviour across the application
+
+    Returns: user_choice in lowercase, and stripped of whitespace.
+    """
+
+    typewriter_print("\nChoose an option:\n")
+    user_choice = input().lower().strip()
+
+    return user_choice
+
+
+def request_user_select_a_month(sheet):
+    """Request a user select from available months/sheets
+
+    Function to request a user selects a month from available months
+
+    Returns: a tuple of (month, available_months).
+    """
+
+    month = input("\nPlease select a month to review " + f"{Colors.green}\
+        (Press L to list available months): \n")
+    month = month.strip().lower().capitalize()
+
+    available_months = get_list_of_all_sheet_titles(sheet)
+
+    if month.startswith("L"):
+        print(available_months)
+        month = input("\nPlease make a selection: \n")
+        month = month.strip().lower().capitalize()
+
+    if month in available_months:
+        display_wait_message("This might take a few seconds")
+
+    return (month, available_months)
+
+
+def get_length_of_longest_list_item(list_to_check):
+    """Finds longest list item
+
+    Returns the longest string in a list of strings,
+    useful for formatting output and improving readability.
+    """
+
+    return max(map(len, list_to_check))
+
+
+def request_new_transaction(sheet, details=None,
+                            price_including_vat=None, rate=None,
+                            heading=None, on_date=None):
+    """Requests transaction info from a user
+
+    Function to collect the info needed to add a new transaction t
+    o a google sheet, or edit one if given a heading. The VAT rate must
+    be one in effect on the transaction's date, today by default.
+
+    Returns: a tuple of (details, total_price_including_vat, vat_rate).
+    """
+    # pylint: disable-next=global-statement
+    global total_price_including_vat
+    # pylint: disable-next=global-statement
+    global vat_rate
+
+    if heading is None:
+        heading = f"Add {sheet}"
+
+    clear_screen()
+    print_banner(heading)
+
+    print(f"Please provide details of the new {sheet} transaction here:\n\n")
+
+    # Questions as variables so size can be determined to neatly display output
+    details_q = "Details"
+    totals_q = "Total including VAT:"
+    vat_rate_q = "Which VAT rate applies? (Press Enter for more details)"
+
+    width = get_length_of_longest_list_item([details_q, totals_q, vat_rate_q])
+
+    space = "  \n"
+    formatted_details_q = f"{details_q}" + "."*(width - len(details_q)) + space
+    formatted_price_q = f"{totals_q}" + "."*(width - len(totals_q)) + space + \
+        "€"
+    formatted_vat_rate_q = f"{vat_rate_q}" + "."*(width - len(vat_rate_q)) \
+        + space
+
+    vat_rate = rate
+    total_price_including_vat = price_including_vat
+
+    if details is None:
+        details = input(formatted_details_q).strip()
+    else:
+        print(formatted_details_q + f"{details}")
+
+    if total_price_including_vat is None:
+        total_price_including_vat = input(formatted_price_q).strip()
+
+        try:
+            total_price_including_vat = float(total_price_including_vat)
+
+        except ValueError:
+            display_message("Please check that the total price is a number", 0)
+            request_new_transaction(sheet=sheet, details=details,
+                                    heading=heading, on_date=on_date)
+
+    else:
+        print(formatted_price_q + str(total_price_including_vat))
+
+    if vat_rate is None:
+        vat_rate = input(formatted_vat_rate_q).strip()
+
+        if "%" in vat_rate:
+            vat_rate = vat_rate.replace("%", "")
+
+        if get_vat_band(vat_rate, on_date) is not None:
+            pass
+        elif vat_rate is None or vat_rate == "":
+            show_details_on_vat(on_date)
+            request_new_transaction(
+                sheet=sheet,
+                details=details,
+                price_including_vat=total_price_including_vat,
+                heading=heading,
+                on_date=on_date
+            )
+        else:
+            display_message("Please check this is a valid tax rate", 2)
+            show_details_on_vat(on_date)
+            request_new_transaction(
+                sheet=sheet,
+                details=details,
+                price_including_vat=total_price_including_vat,
+                heading=heading,
+                on_date=on_date
+            )
+
+    return (details, total_price_including_vat, vat_rate)
+
+
+def load_vat_rates():
+    """Reads the VAT rate table
+
+    Function to read VAT_RATES_FILE once, e.g.
+    {"version": "2026.1",
+     "bands": {"standard": {"column": "vat_23", "description": "...",
+                            "rates": [["2012-01-01", "23"],
+                                      ["2020-09-01", "21"],
+                                      ["2021-03-01", "23"]]}}}
+    Each band's rates are listed with the date they took effect, a
+    null rate meaning the band stopped applying, and its column is the
+    Columns attribute its VAT is entered in.
+
+    Returns: the table, each band's effective dates as ordinals.
+    """
+
+    if VAT_RATE_TABLE:
+        return VAT_RATE_TABLE
+
+    with open(VAT_RATES_FILE, encoding="utf-8") as rates_file:
+        configured = json.load(rates_file)
+
+    bands = {}
+
+    for band, settings in configured["bands"].items():
+        rates = sorted(settings["rates"])
+        bands[band] = {
+            "column": getattr(Columns, settings["column"]),
+            "description": settings.get("description", ""),
+            "starts": [datetime.date.fromisoformat(start).toordinal()
+                       for start, _ in rates],
+            "rates": [rate for _, rate in rates]
+        }
+
+    VAT_RATE_TABLE.update({"version": configured["version"],
+                           "bands": bands})
+
+    return VAT_RATE_TABLE
+
+
+def get_vat_rates(on_date=None):
+    """Looks up the VAT rates in effect on a date
+
+    Returns: a dict of {band: rate} for every band in effect on the
+    date, today by default.
+    """
+
+    ordinal = (on_date or datetime.date.today()).toordinal()
+    rates = {}
+
+    for band, settings in load_vat_rates()["bands"].items():
+        index = bisect_right(settings["starts"], ordinal) - 1
+        if index >= 0 and settings["rates"][index] is not None:
+            rates[band] = settings["rates"][index]
+
+    return rates
+
+
+def get_vat_band(rate, on_date=None):
+    """Finds the band a VAT rate belongs to on a date
+
+    Returns: the band, or None if no band has that rate on the date.
+    """
+
+    try:
+        rate = float(str(rate).replace("%", ""))
+    except ValueError:
+        return None
+
+    for band, band_rate in get_vat_rates(on_date).items():
+        if float(band_rate) == rate:
+            return band
+
+    return None
+
+
+def get_vat_columns(total_including_vat, band, rate):
+    """Works out the VAT columns of a transaction
+
+    The VAT goes in the band's column and the VAT total, or only the
+    total for a band without a column of its own. The whole amount goes
+    in the exempt column for a band entered there.
+
+    Returns: a list of [vat 23%, vat 13.5%, vat 9%, total vat, exempt].
+    """
+
+    column = load_vat_rates()["bands"][band]["column"]
+    vat_columns = dict.fromkeys(Columns.summed[1:], 0)
+
+    if column == Columns.exempt:
+        vat_columns[Columns.exempt] = total_including_vat
+    else:
+        vat_applicable = round(
+            ((float(total_including_vat) * float(rate)) / 100), 2
+        )
+        vat_columns[column] = vat_applicable
+        vat_columns[Columns.vat] = vat_applicable
+
+    return list(vat_columns.values())
+
+
+def calculate_vat(total_including_vat, rate, on_date=None):
+    """Calculate and formats VAT for updating sheets
+
+    Calculate appropriate vat at a rate in effect on a date, today by
+    default, and returns the VAT columns for updating the google sheet.
+
+    Returns: a list of [vat 23%, vat 13.5%, vat 9%, total vat, exempt].
+    Raises ValueError if no band has that rate on the date.
+    """
+
+    band = get_vat_band(rate, on_date)
+
+    if band is None:
+        raise ValueError(f"{rate}% isn't a VAT rate on " +
+                         f"{on_date or datetime.date.today()}")
+
+    return get_vat_columns(total_including_vat, band,
+                           get_vat_rates(on_date)[band])
+
+
+def get_row_vat_band(row):
+    """Works out the VAT band a sheet row was entered at
+
+    A band with a column of its own is matched before one entered only
+    in the VAT total.
+
+    Returns: the band whose column holds the row's VAT, or None for a
+    row with no VAT or exempt amount, e.g. a voided one.
+    """
+
+    bands = load_vat_rates()["bands"]
+
+    for band, settings in sorted(
+            bands.items(), key=lambda item: item[1]["column"] == Columns.vat):
+        if parse_money(row[settings["column"] - 1]):
+            return band
+
+    return None
+
+
+def recalculate_vat(sheet, year, since=None, dry_run=False):
+    """Recalculates the VAT of a year's transactions
+
+    Function to re-read the ledger's open months for a year, only those
+    from the month of since on if it's given, in one batch call and
+    work out each row's VAT again at the rate its band had on the
+    row's date. The rows that changed are corrected with one batch
+    call per month writing just their VAT columns, unless it's a dry
+    run. Rows without a readable date, total or band are left alone,
+    and a row stays in the band its VAT column puts it in, as the
+    ledgers don't record the kind of supply to move it to another.
+
+    Returns: a dict of {month: number of rows corrected}.
+    """
+
+    ledger = get_selected_worksheet(sheet, year)
+    months = [month for month in get_list_of_all_sheet_titles(sheet, year)
+              if (since is None or (int(year), MONTHS.index(month) + 1) >=
+                  (since.year, since.month)) and
+              not is_month_closed(sheet, year, month)]
+
+    first_column = chr(ord("A") + Columns.vat_23 - 1)
+    last_column = chr(ord("A") + Columns.exempt - 1)
+    corrections = {}
+
+    for month, (_, rows) in fetch_month_rows(ledger, months, {}).items():
+        corrected_rows = {}
+
+        for row_number, row in enumerate(rows[1:], 2):
+            date = parse_sheet_date(row[Columns.date - 1])
+            total = parse_money(row[Columns.total - 1])
+            band = get_row_vat_band(row)
+            rate = get_vat_rates(date).get(band) if date else None
+
+            if total is None or rate is None:
+                continue
+
+            vat_columns = get_vat_columns(total / 100, band, rate)
+            if [parse_money(value) for value in vat_columns] != \
+                    [parse_money(value) for value in row[Columns.vat_23 - 1:]]:
+                corrected_rows[row_number] = \
+                    row[:Columns.vat_23 - 1] + vat_columns
+
+        if corrected_rows and not dry_run:
+            ledger.values_batch_update({"valueInputOption": "RAW", "data": [
+                {"range": f"'{month}'!{first_column}{row_number}:" +
+                 f"{last_column}{row_number}",
+                 "values": [row[Columns.vat_23 - 1:]]}
+                for row_number, row in corrected_rows.items()]})
+            record_ledger_write(ledger, month)
+
+            with ledger_lock(sheet, "edit"):
+                update_cached_rows(ledger, month, {
+                    row_number: pad_row(get_sheet_cells(row))
+                    for row_number, row in corrected_rows.items()})
+
+        if corrected_rows:
+            corrections[month] = len(corrected_rows)
+
+    return corrections
+
+
+def generate_next_invoice_number(sheet):
+    """Generates next invoice number based on last used
+
+    Function to get the last available invoice number on a google sheet
+    and iterates it by 1.
+    """
+
+    # newest partitions first so the search stops at the latest year in use
+    for year in reversed(get_ledger_years(sheet)):
+        all_months = get_list_of_all_sheet_titles(sheet, year)
+        all_months = reversed(all_months)
+
+        for month in all_months:
+            all_data = get_month_values(sheet, month, year)
+
+            last_row = all_data[-1]
+
+            # subtracting 1 below to account for gspread column v list
+            # numbering
+            last_invoice_number = last_row[Columns.invoice_number - 1]
+
+            try:
+                # pylint: disable-next=using-constant-test
+                if str(last_invoice_number).isnumeric:
+                    # return last invoice number + 1 (next available)
+                    return int(last_invoice_number) + 1
+            except ValueError:
+                # using try/except to determine whether values are numeric
+                # or not safely. No error reporting is needed here so
+                # choosing to pass
+                pass
+
+    return None
+
+
+@contextmanager
+def ledger_lock(sheet, name):
+    """Locks a ledger against the other terminals
+
+    Function to hold an exclusive lock on a file in CACHE_DIR for the
+    duration of a with block. The lock is released when the file is
+    closed, even if the process dies while holding it.
+    """
+
+    lock_path = get_cache_path(f"{LEDGER_NAMES[sheet]}.{name}.lock")
+
+    with open(lock_path, "w", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def read_invoice_counter(sheet):
+    """Retrieves the next invoice number recorded on this machine
+
+    Returns: the invoice number, or None if none have been handed out.
+    """
+
+    counter_path = get_cache_path(
+        INVOICE_COUNTER_FILE.format(ledger=LEDGER_NAMES[sheet]))
+
+    try:
+        with open(counter_path, encoding="utf-8") as counter_file:
+            return int(counter_file.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def allocate_invoice_number(sheet, fallback=None):
+    """Hands out the next invoice number
+
+    Function to take the higher of the next invoice number on the
+    sheet and the next one recorded on this machine, which accounts
+    for rows other terminals have queued but not yet written. Must be
+    called holding the ledger's "queue" lock so no two terminals get
+    the same number. Numbers added from elsewhere are picked up at the
+    next revision check.
+
+    Returns: the invoice number, or the fallback if the ledger doesn't
+    have any yet.
+    """
+
+    candidates = [number for number in [read_invoice_counter(sheet),
+                                        generate_next_invoice_number(sheet)]
+                  if number is not None]
+
+    if not candidates:
+        if not str(fallback).isdigit():
+            return fallback
+        candidates.append(int(fallback))
+
+    invoice_number = max(candidates)
+
+    counter_path = get_cache_path(
+        INVOICE_COUNTER_FILE.format(ledger=LEDGER_NAMES[sheet]))
+    with open(counter_path, "w", encoding="utf-8") as counter_file:
+        counter_file.write(str(invoice_number + 1))
+
+    return invoice_number
+
+
+def read_append_queue(sheet):
+    """Retrieves the rows waiting to be appended to a ledger
+
+    Returns: a list of {"id", "year", "month", "row"} entries in the
+    order they were queued.
+    """
+
+    queue_path = get_cache_path(
+        APPEND_QUEUE_FILE.format(ledger=LEDGER_NAMES[sheet]))
+
+    try:
+        with open(queue_path, encoding="utf-8") as queue_file:
+            return [json.loads(line) for line in queue_file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def write_append_queue(sheet, entries, mode="w"):
+    """Saves rows waiting to be appended to a ledger
+
+    Function to replace the queue with the given entries, or add them
+    to the end of it if the mode is "a".
+    """
+
+    queue_path = get_cache_path(
+        APPEND_QUEUE_FILE.format(ledger=LEDGER_NAMES[sheet]))
+
+    with open(queue_path, mode, encoding="utf-8") as queue_file:
+        for entry in entries:
+            queue_file.write(json.dumps(entry) + "\n")
+
+
+def write_queued_rows(sheet, entries):
+    """Appends queued rows to their month worksheets
+
+    Function to write the queued rows with one values_append per
+    month, normally just the current one, growing the worksheet first
+    if they won't fit. Entries are removed from the list as they're
+    written so only unwritten rows are left if a call fails.
+    """
+
+    while entries:
+        year, month = entries[0]["year"], entries[0]["month"]
+        batch = [entry for entry in entries
+                 if (entry["year"], entry["month"]) == (year, month)]
+
+        ledger = get_selected_worksheet(sheet, year)
+        expire_revision_check(ledger)
+        ensure_sheet_capacity(ledger, get_sheet_properties(ledger)[month],
+                              len(get_month_values(sheet, month, year)),
+                              len(batch))
+        ledger.values_append(f"'{month}'!A1",
+                             params={"valueInputOption": "RAW"},
+                             body={"values": [entry["row"]
+                                              for entry in batch]})
+        record_ledger_write(ledger, month)
+
+        entries[:] = [entry for entry in entries if entry not in batch]
+
+
+def flush_append_queue(sheet, entry_id):
+    """Writes a queued row, along with any others waiting
+
+    Function to wait for the ledger's "flush" lock and then, if the
+    entry hasn't already been written by whoever held it, take every
+    row in the queue and write them together. Terminals adding rows at
+    the same time are written in a single call instead of racing each
+    other. Rows are put back at the front of the queue if writing them
+    fails.
+    """
+
+    with ledger_lock(sheet, "flush"):
+        with ledger_lock(sheet, "queue"):
+            entries = read_append_queue(sheet)
+            if entry_id not in [entry["id"] for entry in entries]:
+                return
+            write_append_queue(sheet, [])
+
+        try:
+            write_queued_rows(sheet, entries)
+        finally:
+            if entries:
+                with ledger_lock(sheet, "queue"):
+                    write_append_queue(sheet,
+                                       entries + read_append_queue(sheet))
+
+
+def append_transaction(sheet, row, fallback_invoice_number=None):
+    """Adds a row to the current month of a ledger
+
+    Function to give a new row the next invoice number and queue it
+    for writing in one step, so rows are numbered and written in the
+    same order by every terminal, then write it along with any other
+    queued rows. The fallback invoice number is used if the ledger has
+    none yet.
+
+    Returns: the invoice number given to the row.
+    """
+
+    with ledger_lock(sheet, "queue"):
+        row[Columns.invoice_number - 1] = allocate_invoice_number(
+            sheet, fallback_invoice_number)
+        entry = {"id": uuid.uuid4().hex, "year": get_year(),
+                 "month": get_month(), "row": row}
+        write_append_queue(sheet, [entry], mode="a")
+
+    flush_append_queue(sheet, entry["id"])
+
+    return row[Columns.invoice_number - 1]
+
+
+def create_sheet_if_not_available(sheet, dont_provide_option=False):
+    """Creates a new sheet if a unavailable
+
+    Function to check if a sheet for a particular month is
+    available, and direct a user to create one if necessary.
+    Accepting a dont_provide_option to pass through to
+    create_new_sheet function and ignoring asking a user which
+    month they wish to create a sheet for.
+    """
+
+    month = get_month()
+    available_months = get_list_of_all_sheet_titles(sheet, get_year())
+
+    if month not in available_months:
+        display_message(f"No sheet available for {month}", 1)
+        create_new_sheet(sheet, dont_provide_option)
+
+
+def add_new_transaction(sheet):
+    """Allows a user add a sales/purchases transaction
+
+    Function to add a new transaction to a worksheet.
+    This function checks if a sheet for the current month is available
+    & generates it if necessary.
+    """
+
+    create_sheet_if_not_available(sheet)
+
+    details, total_including_vat, rate = request_new_transaction(sheet=sheet)
+    date, _ = get_current_date_and_time()
+    manual_invoice_number = None
+    if read_invoice_counter(sheet) is None and \
+            generate_next_invoice_number(sheet) is None:
+        manual_invoice_number = input(f"{Colors.red}\n\tNo invoice number \
+            available, please manually enter one: {Colors.white}\n")
+    formatted_vat_details = calculate_vat(total_including_vat, rate)
+
+    # the invoice number is filled in when the row is queued
+    formatted_row = [date, details, None,
+                     total_including_vat] + formatted_vat_details
+
+    duplicates = find_possible_duplicates(sheet, formatted_row)
+    if duplicates:
+        print(f"\n{Colors.yellow}This looks like a transaction already " +
+              "entered:\n")
+        print_search_results(duplicates)
+        confirm = input(f"\n{Colors.white}Add it anyway? (y/n): \n")
+        if not confirm.strip().lower().startswith("y"):
+            display_message("Transaction not added", 2, False)
+            sub_menu(sheet)
+            return
+
+    try:
+        invoice_number = append_transaction(sheet, formatted_row,
+                                            manual_invoice_number)
+        display_message(f"Sheet updated successfully, invoice number \
+{invoice_number}", 2, False)
+
+    except FileNotFoundError as e:
+        display_message(f"Can't find file: {e}", 3)
+
+    except gspread.exceptions.APIError as e:
+        display_message(f"The sheet couldn't be updated, the transaction \
+will be added with the next one: {e}", 3)
+
+    sub_menu(sheet)
+
+
+def find_transaction(sheet, invoice_number):
+    """Finds the row holding an invoice number
+
+    Function to look the invoice number up in the search index, which
+    knows the month and row of every indexed invoice, and read just
+    that row to check it still holds the invoice. If it doesn't, or
+    isn't indexed, the index is brought up to date and checked again,
+    so a lookup costs the same however many months there are.
+
+    Returns: a tuple of (year, month, row_number, row), or None if no
+    transaction has the invoice number.
+    """
+
+    load_search_index()
+
+    for attempt in range(2):
+        record_id = SEARCH_LOOKUPS["invoices"].get((sheet, invoice_number))
+
+        if record_id is not None:
+            _, year, month, row_number, _, _, _ = \
+                SEARCH_LOOKUPS["records"][record_id]
+            ledger = get_selected_worksheet(sheet, year)
+            response = ledger.values_get(
+                f"'{month}'!A{row_number}:I{row_number}",
+                params={"fields": "values"})
+            rows = response.get("values", [])
+
+            if rows and pad_row(rows[0])[Columns.invoice_number - 1] == \
+                    invoice_number:
+                return (year, month, row_number, pad_row(rows[0]))
+
+        if attempt == 0:
+            update_search_index([sheet])
+
+    return None
+
+
+def update_cached_rows(ledger, month, rows):
+    """Puts rewritten rows into the local copies of their month
+
+    Function to replace the rows, given as {row_number: row}, in the
+    month's mirror and the search index, so neither has to re-read the
+    month, and log the month so other terminals re-read it instead.
+    """
+
+    log_path = get_cache_path(EDIT_LOG_FILE.format(spreadsheet_id=ledger.id))
+    for edited_month in read_edit_log(ledger):
+        forget_synced_rows(ledger, edited_month)
+    with open(log_path, "a", encoding="utf-8") as log_file:
+        log_file.write(f"{month}\n")
+        EDIT_LOG_OFFSETS[ledger.id] = log_file.tell()
+
+    mirror = MONTH_MIRRORS.get((ledger.id, month))
+    if mirror is not None and "snapshot" in mirror:
+        read_snapshot_month(mirror)
+    if mirror is not None:
+        mirror.pop("snapshot_totals", None)
+
+    synced_copies = [mirror]
+    if SEARCH_INDEX:
+        synced_copies.append(
+            SEARCH_INDEX["months"].get(f"{ledger.id}|{month}"))
+
+    for synced in synced_copies:
+        for row_number, row in rows.items():
+            if synced is None or len(synced["rows"]) < row_number:
+                continue
+            synced["rows"][row_number - 1] = row
+            if len(synced["rows"]) == row_number:
+                synced["anchor"] = get_row_checksum(row)
+
+    if SEARCH_INDEX:
+        rebuild_search_lookups()
+        save_search_index()
+
+
+def rewrite_transaction(sheet, year, month, row_number, row):
+    """Replaces a transaction in its month worksheet
+
+    Function to overwrite just the transaction's row with a single
+    update call and keep the cached copies of the month current. The
+    month's totals are worked out again by the Summary worksheet's
+    formulas.
+    """
+
+    ledger = get_selected_worksheet(sheet, year)
+
+    ledger.values_update(f"'{month}'!A{row_number}:I{row_number}",
+                         params={"valueInputOption": "RAW"},
+                         body={"values": [row]})
+
+    record_ledger_write(ledger, month)
+
+    with ledger_lock(sheet, "edit"):
+        update_cached_rows(ledger, month,
+                           {row_number: pad_row(get_sheet_cells(row))})
+
+
+def get_sheet_cells(row):
+    """Formats a written row as the sheet returns it
+
+    Returns: the row's values as text, e.g. 100.0 as "100".
+    """
+
+    return [str(int(value)) if isinstance(value, float) and
+            value.is_integer() else str(value) for value in row]
+
+
+def request_transaction_to_change(sheet, action):
+    """Request the invoice number of a transaction to change
+
+    Function to find the transaction a user wants to edit or void and
+    show it to them.
+
+    Returns: a tuple of (year, month, row_number, row), or None if it
+    wasn't found.
+    """
+
+    clear_screen()
+    print_banner(f"{action} {sheet}")
+
+    invoice_number = input("Invoice number: \n").strip()
+    display_wait_message("Looking it up")
+    transaction = find_transaction(sheet, invoice_number)
+
+    if transaction is None:
+        display_message(f"No {sheet} transaction has invoice number \
+{invoice_number}", 3)
+        return None
+
+    year, month, row_number, row = transaction
+    print_search_results([(sheet, year, month, row_number, row)])
+
+    if is_month_closed(sheet, year, month):
+        display_message(f"{month} {year} is closed, its transactions can't \
+be changed", 3)
+        return None
+
+    return transaction
+
+
+def edit_transaction(sheet):
+    """Allows a user to correct a sales/purchases transaction
+
+    Function to replace the details, total and VAT rate of a
+    transaction found by its invoice number, keeping its date and
+    invoice number, and work its VAT out again.
+    """
+
+    transaction = request_transaction_to_change(sheet, "Edit")
+
+    if transaction is not None:
+        year, month, row_number, row = transaction
+        click_to_continue()
+
+        invoice_number = row[Columns.invoice_number - 1]
+        date = parse_sheet_date(row[Columns.date - 1])
+        details, total_including_vat, rate = request_new_transaction(
+            sheet=sheet, heading=f"Edit invoice {invoice_number}",
+            on_date=date)
+        edited_row = [row[Columns.date - 1], details,
+                      int(invoice_number) if invoice_number.isdigit()
+                      else invoice_number,
+                      total_including_vat] + calculate_vat(
+                          total_including_vat, rate, date)
+
+        try:
+            rewrite_transaction(sheet, year, month, row_number, edited_row)
+            display_message(f"Invoice {invoice_number} updated", 2, False)
+        except gspread.exceptions.APIError as e:
+            display_message(f"The sheet couldn't be updated: {e}", 3)
+
+    sub_menu(sheet)
+
+
+def void_transaction(sheet):
+    """Allows a user to void a sales/purchases transaction
+
+    Function to zero a transaction found by its invoice number, marking
+    its details as void. The row and invoice number are kept so the
+    invoice numbers carry on without a gap.
+    """
+
+    transaction = request_transaction_to_change(sheet, "Void")
+
+    if transaction is not None:
+        year, month, row_number, row = transaction
+        invoice_number = row[Columns.invoice_number - 1]
+
+        confirm = input(f"\nVoid invoice {invoice_number}? (y/n): \n")
+
+        if confirm.strip().lower() == "y":
+            voided_row = [row[Columns.date - 1],
+                          f"VOID {row[Columns.details - 1]}",
+                          int(invoice_number) if invoice_number.isdigit()
+                          else invoice_number, 0, 0, 0, 0, 0, 0]
+
+            try:
+                rewrite_transaction(sheet, year, month, row_number,
+                                    voided_row)
+                display_message(f"Invoice {invoice_number} voided", 2,
+                                False)
+            except gspread.exceptions.APIError as e:
+                display_message(f"The sheet couldn't be updated: {e}", 3)
+
+    sub_menu(sheet)
+
+
+def display_all_transactions_for_month(sheet, month=None):
+    """Displays all transactions for a particular month
+
+    Function to display google worksheet to the terminal for
+    inspection purposes. This function tracks the largest item
+    in each column to provide a correctly formatted table.
+    """
+
+    year = None
+    if month is None:
+        create_sheet_if_not_available(sheet, dont_provide_option=True)
+        month = get_month()
+        year = get_year()
+
+    rows = get_month_values(sheet, month, year)
+
+    print(f"\n{Colors.magenta}{month} {sheet}")
+    print(f"{Colors.blue}-" * 80)
+
+    for line in format_month_table(rows):
+        print(line)
+
+    click_to_continue()
+
+
+def format_month_table(rows):
+    """Formats the rows of a month as a table
+
+    Function to pad every cell to the width of the longest cell in its
+    column, each width worked out once, with the first row of headings
+    in blue.
+
+    Returns: a list of lines, one for each row.
+    """
+
+    num_of_cols = len(rows[0]) if rows else 0
+    widths = [get_length_of_longest_list_item([row[i] for row in rows])
+              for i in range(num_of_cols)]
+
+    lines = []
+
+    for idx, row in enumerate(rows):
+        # only colouring the first row of headings for greater readability
+        color = Colors.blue if idx == 0 else ""
+        lines.append("".join(f"{color}{value:<{width}} | "
+                             for value, width in zip(row, widths)))
+
+    return lines
+
+
+def get_list_of_all_sheet_titles(sheet, year=None):
+    """Creates a list of sheet titles/months
+
+    Returns a list of all sheet titles, i.e: available months, in the
+    given (or selected) year's partition in calendar order. Tabs that
+    aren't named after a month are skipped.
+    """
+
+    if year is None:
+        year = get_selected_year()
+
+    closed_titles = get_closed_year_titles(sheet, year)
+    if closed_titles is not None:
+        return list(closed_titles)
+
+    ledger = get_selected_worksheet(sheet, year)
+    validate_ledger_cache(ledger)
+
+    if ledger.id in SHEET_TITLES_CACHE:
+        return list(SHEET_TITLES_CACHE[ledger.id])
+
+    all_sheets = get_sheet_properties(ledger)
+    archive_marked_months(ledger, sheet, year, all_sheets)
+    months = []
+
+    for title in all_sheets:
+        if title in MONTHS:
+            months.append(title)
+
+    # tabs can be created in any order, e.g. by provisioning a year
+    months.sort(key=MONTHS.index)
+    SHEET_TITLES_CACHE[ledger.id] = months
+
+    return list(months)
+
+
+def display_all_transactions_for_a_selected_month(sheet):
+    """Display all transactions for a provided month
+
+    Function to request a user to select a month to view details of
+    in the terminal.
+    """
+
+    month, months = request_user_select_a_month(sheet)
+
+    if month in months:
+        try:
+            display_all_transactions_for_month(sheet, month)
+        except FileNotFoundError as e:
+            display_message(f"Worksheet not found for chosen month: {e}")
+
+    else:
+        print(f"\nAvailable months: {Colors.green}{months}")
+        display_message(
+            f"Worksheet not found for chosen month, returning to \
+                {sheet} menu!", 3
+        )
+        clear_screen()
+        sub_menu(sheet)
+
+
+def create_new_sheet(sheet, dont_provide_option=False):
+    """Creates a new purchases/sales sheet
+
+    Function to create a new sheet for the current month, a given
+    month, or every missing month of the selected year for both
+    purchases and sales.
+    """
+
+    month = get_month()
+    year = get_year()
+    available_months = get_list_of_all_sheet_titles(sheet, year)
+
+    if month in available_months:
+        display_message("A sheet exists for the current month", 3)
+        sub_menu(sheet)
+
+    if not dont_provide_option:
+        response = input(
+            "\n\tAdd a sheet for the current month? \n \
+                (n to create for another, a to create all months of " +
+            f"{get_selected_year()})" + f"{Colors.green} (y/n/a):  \n"
+        )
+        response = response.lower().strip()
+
+    else:
+        response = "y"
+
+    if response.startswith("a"):
+        year = get_selected_year()
+        display_wait_message("Creating sheets")
+        try:
+            created = provision_whole_year(year)
+        except ValueError as error:
+            display_message(str(error))
+            return
+        for ledger_name, months in created.items():
+            print(f"\t{ledger_name.capitalize()}: {Colors.green}" +
+                  f"{', '.join(months) or 'nothing to create'}")
+        display_message(f"Worksheets ready for {year}", 2, False)
+        return
+
+    if response.startswith("n"):
+        year = get_selected_year()
+        months = get_list_of_all_sheet_titles(sheet, year)
+        print(f"\n\t{Colors.green}Already created: \
+            " + f"\n\t{Colors.white}{months}\n")
+        month = input("\n\tWhich month would you like to add?  \n")
+        month = month.strip().lower().capitalize()
+
+        if month in months or month not in MONTHS:
+            display_message("Please check the value you entered!")
+            if sheet in ["sales", "purchases"]:
+                sub_menu(sheet)
+            else:
+                main_menu()
+            return
+
+    elif not response.startswith("y"):
+        display_message("Please check the value you selected!")
+        return
+
+    if provision_sheets(sheet, [month], year):
+        display_message(f"Worksheet created for {month}", 2, False)
+    else:
+        display_message(f"A worksheet already exists for {month}", 2)
+
+
+def tokenize(text):
+    """Splits text into search terms
+
+    Returns the lowercase words and numbers in a piece of text.
+    """
+
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def parse_sheet_date(value):
+    """Parses a date from a sheet
+
+    Returns the date in a (mm/dd/YYYY) sheet cell, or None if the cell
+    doesn't hold a valid date.
+    """
+
+    try:
+        return datetime.datetime.strptime(value, "%m/%d/%Y").date()
+    except ValueError:
+        return None
+
+
+def get_duplicate_key(sheet, row):
+    """Works out what a possible duplicate of a row would share with it
+
+    Details are compared ignoring case and spacing, the total in cents
+    and the rate by its VAT band, so a row entered at the standard
+    rate matches whichever standard rate was in effect.
+
+    Returns: a (sheet, date_ordinal, details, cents, band) tuple, or
+    None for a row that can't be a transaction, e.g. a voided one or
+    one without a date.
+    """
+
+    date = parse_sheet_date(row[Columns.date - 1])
+    cents = parse_money(row[Columns.total - 1])
+    band = get_row_vat_band(row)
+
+    if date is None or cents is None or band is None:
+        return None
+
+    return (sheet, date.toordinal(),
+            " ".join(str(row[Columns.details - 1]).casefold().split()),
+            cents, band)
+
+
+def add_to_search_lookups(sheet, year, month, row_number, row):
+    """Adds a transaction to the in-memory search lookups
+
+    Function to record a row against each of its Details terms and in
+    the date, amount, invoice number and duplicate lookups.
+    """
+
+    date = parse_sheet_date(row[Columns.date - 1])
+    date_ordinal = date.toordinal() if date else None
+
+    cents = parse_money(row[Columns.total - 1])
+
+    records = SEARCH_LOOKUPS["records"]
+    record_id = len(records)
+    records.append((sheet, year, month, row_number, date_ordinal, cents, row))
+
+    for term in set(tokenize(row[Columns.details - 1])):
+        if term not in SEARCH_LOOKUPS["terms"]:
+            SEARCH_LOOKUPS["terms"][term] = []
+            insort(SEARCH_LOOKUPS["vocabulary"], term)
+        SEARCH_LOOKUPS["terms"][term].append(record_id)
+
+    if date_ordinal is not None:
+        insort(SEARCH_LOOKUPS["dates"], (date_ordinal, record_id))
+
+    if cents is not None:
+        insort(SEARCH_LOOKUPS["amounts"], (cents, record_id))
+
+    invoice_number = row[Columns.invoice_number - 1]
+    if invoice_number:
+        SEARCH_LOOKUPS["invoices"][(sheet, invoice_number)] = record_id
+
+    duplicate_key = get_duplicate_key(sheet, row)
+    if duplicate_key is not None:
+        SEARCH_LOOKUPS["duplicates"].setdefault(duplicate_key, []).append(
+            record_id)
+
+
+def rebuild_search_lookups():
+    """Rebuilds the in-memory search lookups
+
+    Function to rebuild every lookup from the indexed months, used
+    after loading the index or re-reading a month in full.
+    """
+
+    for lookup in SEARCH_LOOKUPS.values():
+        lookup.clear()
+
+    for indexed_month in SEARCH_INDEX["months"].values():
+        # the header is row 1, transactions start at row 2
+        for row_number, row in enumerate(indexed_month["rows"][1:], 2):
+            add_to_search_lookups(indexed_month["sheet"],
+                                  indexed_month["year"],
+                                  indexed_month["month"], row_number, row)
+
+
+def load_search_index():
+    """Loads the search index saved by a previous session
+
+    Reads the index from SEARCH_INDEX_FILE, starting an empty one if
+    there is no file yet.
+    """
+
+    if SEARCH_INDEX:
+        return
+
+    try:
+        with open(get_cache_path(SEARCH_INDEX_FILE),
+                  encoding="utf-8") as index_file:
+            SEARCH_INDEX.update(json.load(index_file))
+    except (FileNotFoundError, json.JSONDecodeError):
+        SEARCH_INDEX.update({"revisions": {}, "months": {}})
+
+    rebuild_search_lookups()
+
+
+def save_search_index():
+    """Saves the search index for the next session
+
+    Writes the index to SEARCH_INDEX_FILE, replacing the file in one
+    step so an interrupted save can't leave half an index behind.
+    """
+
+    index_path = get_cache_path(SEARCH_INDEX_FILE)
+    temporary_file = f"{index_path}.tmp"
+
+    with open(temporary_file, "w", encoding="utf-8") as index_file:
+        json.dump(SEARCH_INDEX, index_file)
+
+    os.replace(temporary_file, index_path)
+
+
+def index_ledger_months(sheet, year, ledger):
+    """Indexes the rows added to a spreadsheet since the last update
+
+    Function to fetch only the rows appended to each month since they
+    were indexed, in one batch call, and add them to the search index.
+    Like the month mirrors, a month is re-read in full every
+    MIRROR_FULL_RESYNC_EVERY updates, catching edits to earlier rows.
+
+    Returns: True if indexed rows were replaced or removed, meaning the
+    in-memory lookups need rebuilding.
+    """
+
+    needs_rebuild = False
+    months = get_list_of_all_sheet_titles(sheet, year)
+
+    for key in list(SEARCH_INDEX["months"]):
+        if key.startswith(f"{ledger.id}|") and \
+                key.split("|", 1)[1] not in months:
+            del SEARCH_INDEX["months"][key]
+            needs_rebuild = True
+
+    positions = {}
+    for month in months:
+        indexed_month = SEARCH_INDEX["months"].get(f"{ledger.id}|{month}")
+        if indexed_month and indexed_month["rows"] and \
+                indexed_month.get("deltas", 0) < MIRROR_FULL_RESYNC_EVERY:
+            positions[month] = (len(indexed_month["rows"]),
+                                indexed_month["anchor"])
+
+    for month, (is_full_read, rows) in fetch_month_rows(
+            ledger, months, positions).items():
+        key = f"{ledger.id}|{month}"
+
+        if is_full_read:
+            needs_rebuild = needs_rebuild or key in SEARCH_INDEX["months"]
+            SEARCH_INDEX["months"][key] = {
+                "sheet": sheet, "year": year, "month": month, "rows": [],
+                "deltas": 0
+            }
+
+        indexed_month = SEARCH_INDEX["months"][key]
+        if not is_full_read:
+            indexed_month["deltas"] = indexed_month.get("deltas", 0) + 1
+        first_row_number = len(indexed_month["rows"]) + 1
+        indexed_month["rows"].extend(rows)
+        indexed_month["anchor"] = get_row_checksum(
+            indexed_month["rows"][-1]) if indexed_month["rows"] else None
+
+        # the header is row 1 so isn't added to the lookups
+        for row_number, row in enumerate(rows, first_row_number):
+            if row_number > 1 and not needs_rebuild:
+                add_to_search_lookups(sheet, year, month, row_number, row)
+
+    return needs_rebuild
+
+
+def update_search_index(sheets, year_range=None):
+    """Brings the search index up to date with the sheets
+
+    Function to index the given ledgers, optionally only the years in
+    a (first_year, last_year) range. A spreadsheet whose revision
+    hasn't changed since it was indexed is skipped without reading it.
+    """
+
+    load_search_index()
+    needs_rebuild = False
+    changed = False
+
+    for sheet in sheets:
+        for year in get_ledger_years(sheet):
+            if year_range is not None and \
+                    not year_range[0] <= int(year) <= year_range[1]:
+                continue
+
+            ledger = get_selected_worksheet(sheet, year)
+            validate_ledger_cache(ledger)
+            revision = list(LEDGER_REVISIONS[ledger.id]["revision"])
+
+            if SEARCH_INDEX["revisions"].get(ledger.id) == revision:
+                continue
+
+            if index_ledger_months(sheet, year, ledger):
+                needs_rebuild = True
+
+            SEARCH_INDEX["revisions"][ledger.id] = revision
+            changed = True
+
+    if needs_rebuild:
+        rebuild_search_lookups()
+
+    if changed:
+        save_search_index()
+
+
+def get_records_between(lookup, low, high):
+    """Finds records in a sorted lookup between two values
+
+    Returns the set of record ids in a sorted (value, record_id) lookup
+    whose value is between low and high inclusive.
+    """
+
+    return {record_id for _, record_id in lookup[
+        bisect_left(lookup, (low, -1)):
+        bisect_right(lookup, (high, float("inf")))]}
+
+
+def get_records_matching_text(text):
+    """Finds records whose Details contain every word in text
+
+    Words are matched as prefixes of indexed terms, so "sup" finds
+    "Supplies".
+
+    Returns: a set of record ids, or None if text has no words.
+    """
+
+    candidates = None
+    vocabulary = SEARCH_LOOKUPS["vocabulary"]
+
+    for word in tokenize(text):
+        matches = set()
+        for position in range(bisect_left(vocabulary, word),
+                              len(vocabulary)):
+            if not vocabulary[position].startswith(word):
+                break
+            matches.update(SEARCH_LOOKUPS["terms"][vocabulary[position]])
+        candidates = matches if candidates is None else candidates & matches
+
+    return candidates
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def search_transactions(text="", sheet=None, start_date=None, end_date=None,
+                        invoice_number=None, min_total=None, max_total=None):
+    """Searches the indexed transactions
+
+    Function to find transactions whose Details contain every word in
+    text and that fall in the optional date, total and invoice number
+    filters. Only the years the date range covers are brought up to
+    date before searching.
+
+    Returns: a list of (sheet, year, month, row_number, row) tuples in
+    date order.
+    """
+
+    sheets = [sheet] if sheet else list(LEDGER_NAMES)
+    year_range = None
+    if start_date or end_date:
+        year_range = (start_date.year if start_date else datetime.MINYEAR,
+                      end_date.year if end_date else datetime.MAXYEAR)
+
+    update_search_index(sheets, year_range)
+
+    filters = [get_records_matching_text(text)]
+
+    if start_date or end_date:
+        filters.append(get_records_between(
+            SEARCH_LOOKUPS["dates"],
+            start_date.toordinal() if start_date else 0,
+            end_date.toordinal() if end_date else float("inf")))
+
+    if min_total is not None or max_total is not None:
+        filters.append(get_records_between(
+            SEARCH_LOOKUPS["amounts"],
+            round(min_total * 100) if min_total is not None else 0,
+            round(max_total * 100) if max_total is not None
+            else float("inf")))
+
+    if invoice_number is not None:
+        filters.append({
+            SEARCH_LOOKUPS["invoices"][(ledger, invoice_number)]
+            for ledger in sheets
+            if (ledger, invoice_number) in SEARCH_LOOKUPS["invoices"]})
+
+    candidates = set(range(len(SEARCH_LOOKUPS["records"])))
+    for matches in filters:
+        if matches is not None:
+            candidates &= matches
+
+    records = [SEARCH_LOOKUPS["records"][record_id]
+               for record_id in candidates
+               if SEARCH_LOOKUPS["records"][record_id][0] in sheets]
+    records.sort(key=lambda record: (record[4] or 0, record[3]))
+
+    return [(ledger, year, month, row_number, row)
+            for ledger, year, month, row_number, _, _, row in records]
+
+
+def print_table(table):
+    """Outputs a table
+
+    Function to display a list of rows, the first being the headings,
+    in columns as wide as their longest value.
+    """
+
+    widths = [get_length_of_longest_list_item(column)
+              for column in zip(*table)]
+
+    for idx, row in enumerate(table):
+        color = Colors.blue if idx == 0 else ""
+        print(" | ".join(f"{color}{value:<{width}}"
+                         for value, width in zip(row, widths)))
+
+
+def print_search_results(results):
+    """Outputs search results
+
+    Function to display matching transactions as a table, with the
+    ledger and month each was found in.
+    """
+
+    if not results:
+        print(f"\n{Colors.red}No transactions found")
+        return
+
+    table = [["Ledger", "Month", "Date", "Details", "Inv", "Total", "VAT"]]
+    for sheet, year, month, _, row in results:
+        table.append([sheet.capitalize(), f"{month} {year}",
+                      row[Columns.date - 1], row[Columns.details - 1],
+                      row[Columns.invoice_number - 1],
+                      row[Columns.total - 1], row[Columns.vat - 1]])
+
+    print_table(table)
+
+
+def get_duplicate_results(record_ids):
+    """Looks up the records sharing a duplicate key
+
+    Returns: a list of (sheet, year, month, row_number, row) tuples in
+    the order the rows were indexed.
+    """
+
+    return [(ledger, year, month, row_number, row)
+            for ledger, year, month, row_number, _, _, row in
+            (SEARCH_LOOKUPS["records"][record_id] for record_id in record_ids)]
+
+
+def find_possible_duplicates(sheet, row):
+    """Finds transactions a new row may be a duplicate of
+
+    Function to bring the search index for the row's year up to date,
+    which reads nothing if the ledger hasn't changed, and look the row
+    up in the duplicates lookup. Rows still waiting in the append
+    queue, e.g. one whose write failed and will be retried with the
+    next transaction, are checked as well.
+
+    Returns: a list of (sheet, year, month, row_number, row) tuples,
+    the row number None for a queued row.
+    """
+
+    duplicate_key = get_duplicate_key(sheet, row)
+    if duplicate_key is None:
+        return []
+
+    year = datetime.date.fromordinal(duplicate_key[1]).year
+    update_search_index([sheet], (year, year))
+
+    results = get_duplicate_results(
+        SEARCH_LOOKUPS["duplicates"].get(duplicate_key, []))
+
+    for entry in read_append_queue(sheet):
+        if get_duplicate_key(sheet, entry["row"]) == duplicate_key:
+            results.append((sheet, entry["year"], entry["month"], None,
+                            entry["row"]))
+
+    return results
+
+
+def find_duplicate_transactions(sheets, year):
+    """Finds transactions entered more than once in a year
+
+    Function to bring the year's search index up to date, fetching
+    only rows appended since it was last updated in one batch call per
+    spreadsheet, and collect the rows sharing a duplicate key.
+
+    Returns: a list of groups of (sheet, year, month, row_number, row)
+    tuples, in date order.
+    """
+
+    update_search_index(sheets, (int(year), int(year)))
+
+    groups = []
+    for duplicate_key, record_ids in SEARCH_LOOKUPS["duplicates"].items():
+        if len(record_ids) < 2 or duplicate_key[0] not in sheets:
+            continue
+
+        results = [result for result in get_duplicate_results(record_ids)
+                   if str(result[1]) == str(year)]
+        if len(results) > 1:
+            groups.append((duplicate_key[1], duplicate_key[0], results))
+
+    groups.sort(key=lambda group: group[:2])
+
+    return [results for _, _, results in groups]
+
+
+def print_duplicate_transactions(groups):
+    """Outputs groups of duplicate transactions
+
+    Function to display each group of possible duplicates as a table.
+    """
+
+    if not groups:
+        print(f"\n{Colors.green}No duplicate transactions found")
+        return
+
+    for results in groups:
+        print(f"\n{Colors.yellow}Entered {len(results)} times:")
+        print_search_results(results)
+
+    print(f"\n{Colors.yellow}{len(groups)} possible duplicates found")
+
+
+def find_duplicates_menu(sheet):
+    """Display the duplicate transactions in the selected year
+
+    Function to list every transaction of the selected year with the
+    same date, details, total and VAT rate as another.
+    """
+
+    clear_screen()
+    print_banner("Duplicates")
+
+    display_wait_message("Checking for duplicates")
+    print_duplicate_transactions(
+        find_duplicate_transactions([sheet], get_selected_year()))
+    click_to_continue()
+
+
+def search_transactions_menu(sheet):
+    """Request search terms from a user and display matches
+
+    Function to search the purchases/sales ledger by Details and an
+    optional date range.
+    """
+
+    clear_screen()
+    print_banner(f"Search {sheet}")
+
+    text = input("Details contain (press Enter to match any): \n").strip()
+    start_date = request_date_from_user("From date (press Enter for any)",
+                                        allow_blank=True)
+    end_date = request_date_from_user("To date (press Enter for any)",
+                                      allow_blank=True)
+
+    display_wait_message("Searching")
+    started = monotonic()
+    results = search_transactions(text, sheet, start_date, end_date)
+    elapsed = (monotonic() - started) * 1000
+
+    print_search_results(results)
+    print(f"\n{Colors.green}{len(results)} transactions found " +
+          f"in {elapsed:.0f}ms")
+    click_to_continue()
+
+
+def load_analytics_database(year):
+    """Loads a year of both ledgers into an in-memory database
+
+    Function to bring the search index up to date for the year, which
+    fetches only rows appended since it was last updated, one batch
+    call per spreadsheet, and copy every indexed row into a SQLite
+    transactions table with a typed column for each of Columns and
+    amounts in cents. The database is kept until the ledgers change.
+
+    Returns: the database connection.
+    """
+
+    update_search_index(list(LEDGER_NAMES), (int(year), int(year)))
+
+    key = (current_tenant, year,
+           json.dumps(SEARCH_INDEX["revisions"], sort_keys=True))
+    if ANALYTICS_DATABASE.get("key") == key:
+        return ANALYTICS_DATABASE["connection"]
+
+    if "connection" in ANALYTICS_DATABASE:
+        ANALYTICS_DATABASE["connection"].close()
+
+    connection = importlib.import_module("sqlite3").connect(":memory:")
+    columns = ", ".join(f"{name} {column_type}"
+                        for name, column_type in ANALYTICS_COLUMNS.items())
+    connection.execute(
+        "CREATE TABLE transactions (ledger TEXT, month TEXT, " +
+        f"month_number INTEGER, row_number INTEGER, {columns})")
+
+    money_columns = {getattr(Columns, name)
+                     for name, column_type in ANALYTICS_COLUMNS.items()
+                     if column_type == "INTEGER"}
+    records = []
+
+    for indexed_month in SEARCH_INDEX["months"].values():
+        if indexed_month["year"] != year:
+            continue
+
+        for row_number, row in enumerate(indexed_month["rows"][1:], 2):
+            if not any(row):
+                continue
+            date = parse_sheet_date(row[Columns.date - 1])
+            record = [indexed_month["sheet"], indexed_month["month"],
+                      MONTHS.index(indexed_month["month"]) + 1, row_number,
+                      date.isoformat() if date else None]
+            for name in list(ANALYTICS_COLUMNS)[1:]:
+                column = getattr(Columns, name)
+                record.append(parse_money(row[column - 1])
+                              if column in money_columns
+                              else row[column - 1])
+            records.append(record)
+
+    placeholders = ", ".join("?" * (len(ANALYTICS_COLUMNS) + 4))
+    connection.executemany(
+        f"INSERT INTO transactions VALUES ({placeholders})", records)
+    # typed in queries can't change the loaded copy
+    connection.execute("PRAGMA query_only = ON")
+
+    ANALYTICS_DATABASE.update({"key": key, "connection": connection})
+
+    return connection
+
+
+def print_query_results(cursor):
+    """Outputs the results of an analytics query
+
+    Function to display the rows a query returned as a table under the
+    names of its columns, amounts to two decimal places.
+    """
+
+    if cursor.description is None:
+        print(f"\n{Colors.red}No results")
+        return
+
+    table = [[column[0] for column in cursor.description]]
+    for row in cursor.fetchall():
+        table.append(["" if value is None
+                      else f"{value:.2f}" if isinstance(value, float)
+                      else str(value) for value in row])
+
+    if len(table) == 1:
+        print(f"\n{Colors.red}No results")
+        return
+
+    print_table(table)
+
+
+def analytics_menu():
+    """Displays the saved analytics queries
+
+    Function to load the selected year of both ledgers into the
+    analytics database once, then run the saved query, or a query
+    typed in, that a user selects against it until they go back.
+    """
+
+    year = get_selected_year()
+    display_wait_message("Loading the ledgers")
+
+    try:
+        started = monotonic()
+        connection = load_analytics_database(year)
+        elapsed = (monotonic() - started) * 1000
+    except gspread.exceptions.APIError as e:
+        display_message(f"Couldn't load the ledgers: {e}", 3)
+        return
+
+    menu_options = {str(number): title for number, (title, _)
+                    in enumerate(ANALYTICS_QUERIES, 1)}
+    custom_option = str(len(ANALYTICS_QUERIES) + 1)
+    menu_options[custom_option] = "Custom query"
+    menu_options["x"] = "Back"
+
+    count = connection.execute("SELECT COUNT(*) FROM transactions")
+    loaded = f"{count.fetchone()[0]} transactions loaded in {elapsed:.0f}ms"
+    sqlite3 = importlib.import_module("sqlite3")
+
+    while True:
+        selection = print_selected_menu(f"Analytics {year}", menu_options)
+
+        if selection == "x":
+            return
+
+        if selection == custom_option:
+            columns = ", ".join(["ledger", "month", "month_number",
+                                 "row_number"] + list(ANALYTICS_COLUMNS))
+            print(f"Table transactions: {columns}, amounts in cents")
+            query = input("\nSQL query: \n").strip()
+        else:
+            query = ANALYTICS_QUERIES[int(selection) - 1][1]
+
+        clear_screen()
+        print_banner(menu_options[selection])
 
-    if month in months:
         try:
-            display_all_transactions_for_month(sheet, month)
-        except FileNotFoundError as e:
-            display_message(f"Worksheet not found for chosen month: {e}")
+            started = monotonic()
+            cursor = connection.execute(query)
+            print_query_results(cursor)
+            elapsed = (monotonic() - started) * 1000
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            display_message(f"The query failed: {e}", 3)
+            continue
+
+        print(f"\n{Colors.green}Query ran in {elapsed:.1f}ms ({loaded})")
+        click_to_continue()
 
-    else:
-        print(f"\nAvailable months: {Colors.green}{months}")
-        display_message(
-            f"Worksheet not found for chosen month, returning to \
-                {sheet} menu!", 3
-        )
-        clear_screen()
-        sub_menu(sheet)
 
+def find_archive_files(directory):
+    """Finds the archived month worksheets in a directory
 
-def create_new_sheet(sheet, dont_provide_option=False):
-    """Creates a new purchases/sales sheet
+    Function to walk the directory for CSV files named after one of
+    the business's ledgers and a month, see ARCHIVE_FILE_PATTERN.
 
-    Function to create a new sheet for the current month or a
-    given month.
+    Returns: a tuple of (archives, skipped), archives being a list of
+    (path, sheet, year, month) tuples, the year None if the file name
+    doesn't hold it, and skipped a list of other CSV files' paths.
     """
 
-    all_months = [
-        "January", "February", "March", "April", "May", "June",
-        "July", "August", "September", "October", "November", "December"
-    ]
+    ledgers = {name: sheet for sheet, name in LEDGER_NAMES.items()}
+    ledgers.update({sheet: sheet for sheet in LEDGER_NAMES})
 
-    month = get_month()
-    available_months = get_list_of_all_sheet_titles(sheet)
+    archives = []
+    skipped = []
 
-    if month in available_months:
-        display_message("A sheet exists for the current month", 3)
-        sub_menu(sheet)
+    for folder, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            match = ARCHIVE_FILE_PATTERN.match(name)
 
-    if sheet == "sales":
-        exempt_heading = "Exempt"
-    else:
-        exempt_heading = "Intra-EU"
+            if match is None or match["ledger"] not in ledgers or \
+                    match["month"].capitalize() not in MONTHS:
+                if name.lower().endswith(".csv"):
+                    skipped.append(path)
+                continue
 
-    headings = ["Date",	"Details", "Inv", "Total", "23%",
-                "13.5%", "9%", "VAT", f"{exempt_heading}"]
+            archives.append((path, ledgers[match["ledger"]], match["year"],
+                             match["month"].capitalize()))
 
-    if not dont_provide_option:
-        response = input(
-            "\n\tAdd a sheet for the current month? \n \
-                (n to create for another)" + f"{Colors.green} (y/n):  \n"
-        )
-        response = response.lower().strip()
+    return (archives, skipped)
 
-    else:
-        response = "y"
 
-    if response.startswith("y"):
-        month = get_month()
-        ledger = get_selected_worksheet(sheet)
+def analyze_archive_file(path):
+    """Totals an archived month worksheet
 
-        try:
-            ledger.add_worksheet(month, rows=150, cols=10)
-            ledger.worksheet(month).append_row(headings)
-            ledger.worksheet(month).format("A1:I1", {'backgroundColor': {
-                'blue': 0.65882355,
-                'green': 0.84313726,
-                'red': 0.7137255
-            }})
-            display_message(f"Worksheet created for {month}", 2, False)
-        except FileExistsError as e:
-            print(f"File already exists: \n{e}")
+    Function to run in a worker process, reading a month exported as
+    CSV and adding up each of Columns.summed a column at a time. A
+    header row is left out.
 
-    elif response.startswith("n"):
-        months = get_list_of_all_sheet_titles(sheet)
-        print(f"\n\t{Colors.green}Already created: \
-            " + f"\n\t{Colors.white}{months}\n")
-        new_month = input("\n\tWhich month would you like to add?  \n")
-        new_month = new_month.strip().lower().capitalize()
+    Returns: a dict of the file's "rows", "year" (that of its first
+    dated row, or None), "cents" (a total for each of Columns.summed),
+    "bad_cells" (how many cells weren't amounts) and "error" (why it
+    couldn't be read, or None).
+    """
 
-        if new_month not in months and new_month in all_months:
-            ledger = get_selected_worksheet(sheet)
+    csv = importlib.import_module("csv")
+    analysis = {"rows": 0, "year": None, "cents": [0] * len(Columns.summed),
+                "bad_cells": 0, "error": None}
 
-            try:
-                ledger.add_worksheet(new_month, rows=150, cols=10)
-                ledger.worksheet(new_month).append_row(headings)
-                ledger.worksheet(new_month).format("A1:I1", {
-                    'backgroundColor': {
-                        'blue': 0.65882355,
-                        'green': 0.84313726,
-                        'red': 0.7137255
-                    }})
-                display_message(f"Worksheet created for {new_month}", 2, False)
-
-            except FileNotFoundError as e:
-                print(f"Can't find file:\n{e}")
-        else:
-            display_message("Please check the value you entered!")
-            if sheet in ["sales", "purchases"]:
-                sub_menu(sheet)
-            else:
-                main_menu()
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as archive_file:
+            rows = [row for row in csv.reader(archive_file) if any(row)]
+    except (OSError, UnicodeDecodeError, csv.Error) as error:
+        analysis["error"] = str(error)
+        return analysis
+
+    if rows and len(rows[0]) >= Columns.total and \
+            parse_money(rows[0][Columns.total - 1]) is None:
+        rows = rows[1:]
+
+    analysis["rows"] = len(rows)
+
+    for row in rows:
+        date = parse_sheet_date(row[Columns.date - 1])
+        if date is not None:
+            analysis["year"] = date.year
+            break
+
+    # short rows, e.g. with the trailing empty cells left off, are
+    # padded out as the columns are split
+    columns = list(zip_longest(*rows, fillvalue=""))
+
+    for index, column in enumerate(Columns.summed):
+        if column > len(columns):
+            continue
+        cents, bad_cells = sum_money_column(columns[column - 1])
+        analysis["cents"][index] = cents
+        analysis["bad_cells"] += len(bad_cells)
+
+    return analysis
+
+
+def analyze_archives(directory, workers=None):
+    """Totals archived ledgers by year
+
+    Function to fan the archived month worksheets in a directory out
+    across a pool of worker processes, one per CPU by default, which
+    each read and total whole files, and merge their totals for each
+    ledger and year. A single worker totals them in this process.
+
+    Returns: a dict of "years" ({sheet: {year: {"months", "rows",
+    "cents"}}}), "files", "rows", "bad_cells", "errors" (a list of
+    (path, reason) tuples) and "skipped" (CSV files that aren't
+    archived months).
+    """
+
+    archives, skipped = find_archive_files(directory)
+    paths = [path for path, _, _, _ in archives]
+    analysis = {"years": {}, "files": 0, "rows": 0, "bad_cells": 0,
+                "errors": [], "skipped": skipped}
 
+    if workers == 1:
+        results = map(analyze_archive_file, paths)
     else:
-        display_message("Please check the value you selected!")
+        futures = importlib.import_module("concurrent.futures")
+        chunk_size = max(1, len(paths) // (
+            (workers or os.cpu_count() or 1) * ARCHIVE_BATCHES_PER_WORKER))
+        with futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(analyze_archive_file, paths,
+                                        chunksize=chunk_size))
+
+    for (path, sheet, year, month), result in zip(archives, results):
+        year = year or result["year"]
+
+        if result["error"] is None and year is None:
+            result["error"] = "no dated rows to take the year from"
+        if result["error"] is not None:
+            analysis["errors"].append((path, result["error"]))
+            continue
+
+        totals = analysis["years"].setdefault(sheet, {}).setdefault(
+            str(year), {"months": set(), "rows": 0,
+                        "cents": [0] * len(Columns.summed)})
+        totals["months"].add(month)
+        totals["rows"] += result["rows"]
+        totals["cents"] = [total + cents for total, cents
+                           in zip(totals["cents"], result["cents"])]
+
+        analysis["files"] += 1
+        analysis["rows"] += result["rows"]
+        analysis["bad_cells"] += result["bad_cells"]
+
+    return analysis
+
+
+def print_archive_analysis(analysis):
+    """Outputs archived ledger totals year by year
+
+    Function to display each ledger's totals for every archived year,
+    with the change in its total from the year before, and the VAT
+    payable for each year both ledgers were archived for.
+    """
+
+    years = analysis["years"]
+
+    for sheet in [sheet for sheet in LEDGER_NAMES if sheet in years]:
+        table = [["Year", "Months", "Transactions", "Total", "VAT 23%",
+                  "VAT 13.5%", "VAT 9%", "VAT", get_exempt_heading(sheet),
+                  "Change"]]
+        previous_total = None
+
+        for year, totals in sorted(years[sheet].items()):
+            change = ""
+            if previous_total:
+                percent = (totals["cents"][0] - previous_total) * 100 / \
+                    abs(previous_total)
+                change = f"{percent:+.1f}%"
+            table.append([year, str(len(totals["months"])),
+                          str(totals["rows"])] +
+                         [f"{cents / 100:.2f}" for cents in totals["cents"]] +
+                         [change])
+            previous_total = totals["cents"][0]
+
+        print(f"\n{Colors.yellow}{sheet.capitalize()}")
+        print_table(table)
+
+    if "sales" in years and "purchases" in years:
+        vat_index = Columns.summed.index(Columns.vat)
+        table = [["Year", "Sales VAT", "Purchases VAT", "VAT payable"]]
+
+        for year in sorted(set(years["sales"]) & set(years["purchases"])):
+            sales_vat = years["sales"][year]["cents"][vat_index]
+            purchases_vat = years["purchases"][year]["cents"][vat_index]
+            table.append([year, f"{sales_vat / 100:.2f}",
+                          f"{purchases_vat / 100:.2f}",
+                          f"{(sales_vat - purchases_vat) / 100:.2f}"])
+
+        print(f"\n{Colors.yellow}VAT")
+        print_table(table)
+
+    print(f"\n{analysis['files']} files, {analysis['rows']} transactions")
+    if analysis["bad_cells"]:
+        print(f"{Colors.red}{analysis['bad_cells']} cells weren't amounts " +
+              "and were left out")
+    for path, reason in analysis["errors"]:
+        print(f"{Colors.red}Couldn't analyze {path}: {reason}")
+    if analysis["skipped"]:
+        print(f"{len(analysis['skipped'])} CSV files skipped as they aren't " +
+              "named after a ledger and month, e.g. " +
+              f"{analysis['skipped'][0]}")
 
 
 def main_menu():
@@ -719,9 +4035,19 @@ def main_menu():
     menu_options = {
         "1": "Sales",
         "2": "Purchases",
+        "3": "Dashboard",
+        "4": "Analytics",
         "x": "Exit"
     }
 
+    if len(load_tenants()) > 1:
+        heading = f"VAT Calculator - {current_tenant}"
+        menu_options = {"1": "Sales", "2": "Purchases", "3": "Dashboard",
+                        "4": "Analytics", "5": "Switch business",
+                        "x": "Exit"}
+
+    save_snapshot_if_due()
+
     date, time = get_current_date_and_time()
     print(f"\n{date} - {time}")
 
@@ -733,13 +4059,53 @@ def main_menu():
     if selection == "2":
         sub_menu("purchases")
 
+    if selection == "3":
+        totals_dashboard()
+        main_menu()
+
+    if selection == "4":
+        analytics_menu()
+        main_menu()
+
+    if selection == "5":
+        switch_tenant_menu()
+
     if selection == "x":
         clear_screen()
         print_banner("Goodbye...")
-        sleep(2)
+        pause(2)
         sys.exit(0)
 
 
+def switch_tenant_menu():
+    """Displays the businesses to switch between
+
+    Function to list every business, with the API requests made for
+    it so far, and switch to the one a user selects.
+    """
+
+    tenants = list(load_tenants())
+    menu_options = {}
+
+    for number, tenant in enumerate(tenants, 1):
+        quota = TENANT_QUOTAS.get(tenant, {"requests": 0, "throttled": 0})
+        usage = f"{quota['requests']} requests"
+        if quota["throttled"]:
+            usage += f", {quota['throttled']} delayed by its quota"
+        current = " - current" if tenant == current_tenant else ""
+        menu_options[str(number)] = f"{tenant} ({usage}){current}"
+
+    menu_options["x"] = "Back"
+
+    selection = print_selected_menu("Businesses", menu_options)
+
+    if selection != "x":
+        save_snapshot()
+        use_tenant(tenants[int(selection) - 1])
+
+    main_menu()
+
+
 def user_selected_month_from_available_months(sheet):
     """Displays available months and request a user select one
 
@@ -768,66 +4134,242 @@ def user_selected_month_from_available_months(sheet):
         totals_menu(sheet)
 
 
-def calculate_total_of_totals_year_to_date(sheet, run_directly=False):
-    """Calculate year-to-date totals for all figures
+def get_report_version(year):
+    """Works out which version of a year's report is current
+
+    Function to check the revision of each ledger's spreadsheet for the
+    year, which a closed year doesn't need.
 
-    Function to calculate sales/puchases, each vat rate, total vat
-    and vat exempt totals so a user can get a year to date summary.
+    Returns: the version, a CRC32 of the revisions in hex.
     """
 
-    all_months = get_list_of_all_sheet_titles(sheet)
+    revisions = {}
 
-    totals = []
-    vat_23 = []
-    vat_13_5 = []
-    vat_9 = []
-    vat_total = []
-    exempt_total = []
+    for sheet in LEDGER_NAMES:
+        if load_partition_catalog()[sheet].get(year) is None:
+            continue
+        if get_closed_year_titles(sheet, year) is not None:
+            revisions[sheet] = "closed"
+            continue
+        ledger = get_selected_worksheet(sheet, year)
+        validate_ledger_cache(ledger)
+        revisions[sheet] = LEDGER_REVISIONS[ledger.id]["revision"]
 
-    choices_dict = {
-        "total": totals,
-        "vat_23": vat_23,
-        "vat_13.5": vat_13_5,
-        "vat_9": vat_9,
-        "vat_total": vat_total,
-        "exempt_total": exempt_total
-    }
+    return f"{zlib.crc32(json.dumps(revisions, sort_keys=True).encode()):08x}"
 
-    if sheet == "sales":
-        total_heading = "Sales"
-        exempt_heading = "Exempt"
 
-    else:
-        total_heading = "Purchases"
-        exempt_heading = "Intra-EU"
-
-    headings_dict = {
-        "total": total_heading,
-        "vat_23": "23%",
-        "vat_13.5": "13.5%",
-        "vat_9": "9%",
-        "vat_total": "VAT",
-        "exempt_total": exempt_heading,
-    }
+def load_report(year, version):
+    """Loads a saved version of a year's report
 
-    for k, v in choices_dict.items():
-        sleep(10)
-        for month in all_months:
-            sleep(3)
-            _, month, rounded_total = get_monthly_total_for(sheet, k, month)
-            choices_dict[k].append(rounded_total)
+    Returns: the report, or None if that version hasn't been built.
+    """
+
+    report_path = get_cache_path(
+        os.path.join(REPORTS_DIR, str(year), version, "report.json"))
+
+    try:
+        with open(report_path, encoding="utf-8") as report_file:
+            return json.load(report_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def get_report_headings(sheet):
+    """Retrieves the headings of a ledger's report columns
+
+    Returns: a heading for each of Columns.summed.
+    """
+
+    return [sheet.capitalize(), "23%", "13.5%", "9%", "VAT",
+            get_exempt_heading(sheet)]
+
+
+def write_report_html(report, report_file):
+    """Writes a report as an HTML page
+
+    Function to write a table of each ledger's monthly totals with the
+    year-to-date totals under them.
+    """
 
-    print(f"\n{Colors.magenta}{sheet.capitalize()} year-to-date totals")
+    escape = importlib.import_module("html").escape
+    report_file.write(
+        "<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\">" +
+        f"<title>VAT report {report['year']}</title></head>\n<body>\n" +
+        f"<h1>VAT report {report['year']}</h1>\n" +
+        f"<p>Built {escape(report['built_at'])}, version " +
+        f"{report['version']}</p>\n")
+
+    for sheet, totals in report["ledgers"].items():
+        report_file.write(f"<h2>{escape(sheet.capitalize())}</h2>\n<table>\n")
+        report_file.write("<tr><th>Month</th>" + "".join(
+            f"<th>{escape(heading)}</th>"
+            for heading in get_report_headings(sheet)) + "</tr>\n")
+        rows = list(totals["months"].items()) + [
+            ("Year to date", totals["year_to_date"])]
+        for month, cents in rows:
+            report_file.write(f"<tr><td>{month}</td>" + "".join(
+                f"<td>{amount / 100:.2f}</td>" for amount in cents) +
+                "</tr>\n")
+        report_file.write("</table>\n")
+
+    report_file.write("</body>\n</html>\n")
+
+
+def save_report(report):
+    """Saves a report as JSON, CSV and HTML files
+
+    Function to write the report into a folder named after its version,
+    moved into place in one step so a report is never read half
+    written, and remove all but the newest REPORT_VERSIONS_KEPT older
+    versions of the year's report.
+    """
+
+    csv = importlib.import_module("csv")
+    year_folder = get_cache_path(os.path.join(REPORTS_DIR,
+                                              str(report["year"])))
+    version_folder = os.path.join(year_folder, report["version"])
+    temporary_folder = f"{version_folder}.{os.getpid()}.tmp"
+    os.makedirs(temporary_folder, exist_ok=True)
+
+    with open(os.path.join(temporary_folder, "report.csv"), "w",
+              newline="", encoding="utf-8") as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(["ledger", "month", "total", "vat_23", "vat_13_5",
+                         "vat_9", "vat", "exempt"])
+        for sheet, totals in report["ledgers"].items():
+            for month, cents in list(totals["months"].items()) + [
+                    ("year_to_date", totals["year_to_date"])]:
+                writer.writerow([sheet, month] +
+                                [f"{amount / 100:.2f}" for amount in cents])
+
+    with open(os.path.join(temporary_folder, "report.html"), "w",
+              encoding="utf-8") as report_file:
+        write_report_html(report, report_file)
+
+    # written last, as its presence means the version is complete
+    with open(os.path.join(temporary_folder, "report.json"), "w",
+              encoding="utf-8") as report_file:
+        json.dump(report, report_file)
+
+    try:
+        os.rename(temporary_folder, version_folder)
+    except OSError:
+        # another terminal saved this version first
+        importlib.import_module("shutil").rmtree(temporary_folder)
+
+    versions = sorted(
+        [entry for entry in os.scandir(year_folder)
+         if entry.is_dir() and not entry.name.endswith(".tmp")],
+        key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[REPORT_VERSIONS_KEPT + 1:]:
+        importlib.import_module("shutil").rmtree(entry.path,
+                                                 ignore_errors=True)
+
+
+def build_report(year):
+    """Builds the monthly and year-to-date totals report for a year
+
+    Function to serve the saved report if the year's ledgers haven't
+    changed since it was built, otherwise read the Summary worksheet of
+    each ledger, one call each, and save the totals in cents as a new
+    version of the report.
+
+    Returns: the report, a dict of "year", "version", "built_at" and
+    "ledgers" ({sheet: {"months": {month: cents}, "year_to_date":
+    cents}}, cents being a total for each of Columns.summed).
+    """
+
+    version = get_report_version(year)
+    report = load_report(year, version)
+    if report is not None:
+        return report
+
+    ledgers = {}
+    for sheet in LEDGER_NAMES:
+        if load_partition_catalog()[sheet].get(year) is None:
+            continue
+
+        months = {
+            month: [round(totals[column] * 100) for column in Columns.summed]
+            for month, totals in sorted(
+                get_summary_totals(sheet, year).items(),
+                key=lambda item: MONTHS.index(item[0]))}
+        ledgers[sheet] = {
+            "months": months,
+            "year_to_date": [sum(cents) for cents in zip(*months.values())]
+            or [0] * len(Columns.summed)
+        }
+
+    report = {"year": str(year), "version": version,
+              "built_at": datetime.datetime.now().isoformat(
+                  sep=" ", timespec="seconds"),
+              "ledgers": ledgers}
+    save_report(report)
+
+    return report
+
+
+def refresh_report():
+    """Builds this year's report ahead of time
+
+    Function to run in a background thread at start up, bringing the
+    report up to date if the newest one saved is over REPORT_REFRESH
+    seconds old, so year-to-date totals show straight away.
+    """
+
+    year_folder = get_cache_path(os.path.join(REPORTS_DIR, get_year()))
+
+    try:
+        built = max((entry.stat().st_mtime for entry in os.scandir(
+            year_folder) if entry.is_dir()), default=0)
+    except FileNotFoundError:
+        built = 0
+
+    if datetime.datetime.now().timestamp() - built < REPORT_REFRESH:
+        return
+
+    try:
+        build_report(get_year())
+    except Exception:  # pylint: disable=broad-exception-caught
+        # the report is built when it's asked for anyway
+        pass
+
+
+def print_report_totals(heading, headings, cents, color):
+    """Outputs a line of report totals
+
+    Function to display a heading and, under the column headings, a
+    total for each of Columns.summed.
+    """
+
+    print(f"\n{Colors.magenta}{heading}")
     print(f"{Colors.blue}-" * 80)
 
-    for k, v in choices_dict.items():
-        print(f"{Colors.green}{headings_dict[k]:<13}", end="")
+    for column_heading in headings:
+        print(f"{Colors.green}{column_heading:<13}", end="")
     print()
 
-    for k, v in choices_dict.items():
-        print(f"{Colors.blue}€{sum(v):<12.2f}", end="")
+    for amount in cents:
+        print(f"{color}€{amount / 100:<12.2f}", end="")
+    print()
 
-    print("\n")
+
+def calculate_total_of_totals_year_to_date(sheet, run_directly=False):
+    """Calculate year-to-date totals for all figures
+
+    Function to display sales/puchases, each vat rate, total vat
+    and vat exempt totals so a user can get a year to date summary,
+    from the selected year's report.
+    """
+
+    report = build_report(get_selected_year())
+    totals = report["ledgers"].get(sheet, {
+        "year_to_date": [0] * len(Columns.summed)})
+
+    print_report_totals(f"{sheet.capitalize()} year-to-date totals",
+                        get_report_headings(sheet), totals["year_to_date"],
+                        Colors.blue)
+    print(f"\n{Colors.yellow}From the report built {report['built_at']}\n")
 
     # avoid needing to click to continue twice when this is
     # run as part of totals menu option 7
@@ -840,18 +4382,15 @@ def print_all_monthly_totals_on_individual_lines(sheet):
 
     Function to display all monthly totals on their own
     seperate line, and after this output display
-    the year to date totals.
+    the year to date totals, from the selected year's report.
     """
 
-    all_months = get_list_of_all_sheet_titles(sheet)
+    report = build_report(get_selected_year())
 
-    for month in all_months:
-        print_monthly_totals_on_one_line(sheet, month, print_all_months=True)
-        # sleep added here to slow down api usage as the program
-        # was experiencing
-        # -APIError: [429]: Quota exceeded for quota metric 'Read requests'
-        #   and limit 'Read requests per minute per user
-        sleep(10)
+    for month, cents in report["ledgers"].get(sheet, {"months": {}})[
+            "months"].items():
+        print_report_totals(f"{month} totals", get_report_headings(sheet),
+                            cents, Colors.white)
 
     calculate_total_of_totals_year_to_date(sheet)
     click_to_continue()
@@ -902,8 +4441,8 @@ def print_monthly_totals_on_one_line(sheet, month=None,
 def get_monthly_total_for(sheet, option, month=None):
     """Calculates a monthly total for a provided column
 
-    Helper function to calculate a monthly total for
-    a selected column.
+    Helper function to look up a monthly total for
+    a selected column in the Summary worksheet.
     """
 
     if option == "total":
@@ -936,16 +4475,109 @@ def get_monthly_total_for(sheet, option, month=None):
     if month is None:
         month = user_selected_month_from_available_months(sheet)
 
-    ledger = get_selected_worksheet(sheet)
-
-    totals_without_header = ledger.worksheet(month).col_values(column)[1:]
-
-    combined_total = sum([float(total) for total in totals_without_header])
+    combined_total = get_summary_totals(sheet).get(month, {}).get(column, 0)
     rounded_total = round(float(combined_total), 2)
 
     return (message, month, rounded_total)
 
 
+def print_totals_for_date_range(sheet):
+    """Outputs all totals between two dates
+
+    Function to request a start and end date and display every total
+    for transactions between them, only reading the yearly partitions
+    and month worksheets that overlap the range.
+    """
+
+    start_date = request_date_from_user("Please enter the start date")
+    end_date = request_date_from_user("Please enter the end date")
+
+    if end_date < start_date:
+        display_message("The end date must be after the start date", 3)
+        return
+
+    display_wait_message("This might take a few seconds")
+
+    columns = Columns.summed
+    totals_in_cents = [0] * len(columns)
+    headings = [sheet.capitalize(), "23%", "13.5%", "9%", "VAT",
+                get_exempt_heading(sheet)]
+    bad_cells = []
+
+    for year, month in get_partitions_for_range(sheet, start_date, end_date):
+        row_numbers = []
+        rows_in_range = []
+
+        # the header is row 1, transactions start at row 2
+        for row_number, row in enumerate(
+                get_month_values(sheet, month, year)[1:], 2):
+            try:
+                date = datetime.datetime.strptime(
+                    row[Columns.date - 1], "%m/%d/%Y").date()
+            except ValueError:
+                # rows without a valid date can't be placed in the range
+                continue
+
+            if start_date <= date <= end_date:
+                row_numbers.append(row_number)
+                rows_in_range.append(row)
+
+        for idx, column in enumerate(columns):
+            cents, bad_column_cells = sum_money_column(
+                [row[column - 1] for row in rows_in_range], row_numbers)
+            totals_in_cents[idx] += cents
+            bad_cells += [(month, row_number, headings[idx], value)
+                          for row_number, value in bad_column_cells]
+
+    totals = [cents / 100 for cents in totals_in_cents]
+
+    print(f"\n{Colors.magenta}{sheet.capitalize()} totals from " +
+          f"{start_date:%d/%m/%Y} to {end_date:%d/%m/%Y}")
+    print(f"{Colors.blue}-" * 80)
+
+    for heading in headings:
+        print(f"{Colors.green}{heading:<13}", end="")
+    print()
+
+    for total in totals:
+        print(f"{Colors.blue}€{total:<12.2f}", end="")
+
+    print("\n")
+
+    if bad_cells:
+        print(f"{Colors.red}Left out {len(bad_cells)} cells that aren't " +
+              "amounts, please correct them in the sheet:")
+        for month, row_number, heading, value in bad_cells[:10]:
+            print(f"{Colors.yellow}\t{month} row {row_number} " +
+                  f"({heading}): {value!r}")
+        print()
+
+    click_to_continue()
+
+
+def select_ledger_year(sheet):
+    """Request a user select a year to review
+
+    Function to list the yearly partitions of the purchases/sales
+    ledger and switch the menus over to the chosen year.
+    """
+
+    # pylint: disable-next=global-statement
+    global selected_year
+
+    years = get_ledger_years(sheet)
+
+    print(f"\nAvailable years: {Colors.green}{years}")
+    year = input("\nPlease enter a year from the available options: \n")
+    year = year.strip()
+
+    if year in years:
+        selected_year = year
+        display_message(f"Now reviewing {sheet} for {year}", 2, False)
+    else:
+        display_message("Please check the value you entered!", 2)
+
+
 def get_total_for_all_months(column, sheet):
     """Calculates a year-to-date total for a chosen column
 
@@ -968,6 +4600,173 @@ def get_total_for_all_months(column, sheet):
     return (messages[0], all_months, sum(rounded_totals))
 
 
+def get_running_totals(sheet, month, running):
+    """Brings the running totals of a month up to date
+
+    Function to add only the rows appended to the month's mirror since
+    the totals were last brought up to date, starting again from the
+    header if the mirror was re-read in full. A month without a
+    worksheet yet totals nothing.
+
+    Returns: the running totals, a dict of the mirrored rows, the
+    number of them summed, the total cents for each column and the
+    number of cells that weren't amounts.
+    """
+
+    year = get_year()
+    ledger = get_selected_worksheet(sheet, year)
+
+    if (ledger.id, month) not in MONTH_MIRRORS and \
+            month not in get_list_of_all_sheet_titles(sheet, year):
+        rows = []
+    else:
+        rows = get_month_values(sheet, month, year)
+
+    if running is None or running["rows"] is not rows or \
+            running["summed"] > len(rows):
+        running = {"rows": rows, "summed": 1, "bad_cells": 0,
+                   "cents": dict.fromkeys(Columns.summed, 0)}
+
+        # a month restored from a snapshot has its amounts in cents
+        snapshot_totals = MONTH_MIRRORS.get((ledger.id, month), {}).get(
+            "snapshot_totals")
+        if snapshot_totals and rows:
+            for column in Columns.summed:
+                running["cents"][column] = sum(
+                    snapshot_totals["cents"][column])
+                running["bad_cells"] += snapshot_totals["bad_cells"][column]
+            running["summed"] = max(snapshot_totals["rows"], 1)
+
+    new_rows = rows[running["summed"]:]
+    row_numbers = range(running["summed"] + 1, len(rows) + 1)
+
+    for column in Columns.summed:
+        cents, bad_cells = sum_money_column(
+            [row[column - 1] for row in new_rows], row_numbers)
+        running["cents"][column] += cents
+        running["bad_cells"] += len(bad_cells)
+
+    running["summed"] = max(len(rows), 1)
+
+    return running
+
+
+def get_earlier_month_totals(sheet, month):
+    """Adds up this year's totals before a month
+
+    Returns: a dict of {column: total cents} from the Summary
+    worksheet of the current year.
+    """
+
+    earlier = dict.fromkeys(Columns.summed, 0)
+
+    for summary_month, totals in get_summary_totals(sheet,
+                                                    get_year()).items():
+        if MONTHS.index(summary_month) < MONTHS.index(month):
+            for column in Columns.summed:
+                earlier[column] += round(totals[column] * 100)
+
+    return earlier
+
+
+def print_dashboard_totals(sheet, heading, cents):
+    """Outputs a line of dashboard totals
+
+    Function to display a ledger's totals for a period on one line
+    under the column headings.
+    """
+
+    print(f"{Colors.magenta}{sheet.capitalize():<10}{heading:<14}", end="")
+    for column in Columns.summed:
+        print(f"{Colors.white}€{cents[column] / 100:<12.2f}", end="")
+    print()
+
+
+def wait_for_enter(seconds):
+    """Waits a number of seconds for a user to press Enter
+
+    Returns: True if they did, False if the time ran out.
+    """
+
+    sys.stdout.flush()
+    readable, _, _ = select.select([sys.stdin], [], [], seconds)
+
+    if readable:
+        sys.stdin.readline()
+        return True
+
+    return False
+
+
+def totals_dashboard():
+    """Displays a dashboard of this month's and year-to-date totals
+
+    Function to show the current month's and year-to-date totals of
+    both ledgers at once, refreshing every DASHBOARD_REFRESH seconds
+    until the user presses Enter. Each refresh only fetches rows
+    appended to the current month since the last one, and only if a
+    ledger has changed, adding them to running totals. Earlier months
+    come from the Summary worksheets, re-read every
+    DASHBOARD_SUMMARY_EVERY refreshes if they've changed.
+    """
+
+    running = {}
+    earlier = {}
+    refreshes = 0
+    refreshed_at = None
+    error = None
+
+    while True:
+        month = get_month()
+
+        try:
+            for sheet in ["sales", "purchases"]:
+                if refreshes % DASHBOARD_SUMMARY_EVERY == 0 or \
+                        earlier.get(sheet, (None,))[0] != month:
+                    earlier[sheet] = (month,
+                                      get_earlier_month_totals(sheet, month))
+                running[sheet] = get_running_totals(sheet, month,
+                                                    running.get(sheet))
+            refreshed_at = get_current_date_and_time()[1]
+            error = None
+        except gspread.exceptions.APIError as e:
+            error = e
+            if refreshed_at is None:
+                display_message(f"Couldn't load the totals: {e}", 3)
+                return
+
+        refreshes += 1
+
+        clear_screen()
+        print_banner("Dashboard")
+        print(f"{Colors.green}{'':<24}", end="")
+        for heading in ["Total", "23%", "13.5%", "9%", "VAT", "Exempt/EU"]:
+            print(f"{Colors.green}{heading:<13}", end="")
+        print()
+        print(f"{Colors.blue}-" * 102)
+
+        for sheet, totals in running.items():
+            year_to_date = {
+                column: earlier[sheet][1][column] + totals["cents"][column]
+                for column in Columns.summed
+            }
+            print_dashboard_totals(sheet, month, totals["cents"])
+            print_dashboard_totals(sheet, "Year to date", year_to_date)
+            if totals["bad_cells"]:
+                print(f"{Colors.red}{'':<10}{totals['bad_cells']} cells " +
+                      f"in {month} aren't amounts and are left out")
+
+        print(f"{Colors.blue}-" * 102)
+        print(f"\nUpdated at {refreshed_at}, refreshing every " +
+              f"{DASHBOARD_REFRESH} seconds")
+        if error is not None:
+            print(f"{Colors.red}Couldn't refresh: {error}")
+
+        print(f"\n\t{Colors.yellow}Press Enter to go back: ")
+        if wait_for_enter(DASHBOARD_REFRESH):
+            return
+
+
 def totals_menu(sheet):
     """Displays a menu for all totals available purchases/sales
 
@@ -993,6 +4792,7 @@ def totals_menu(sheet):
         "13": "Year-to-date: VAT (9%)",
         "14": "Year-to-date: Total VAT (combined)",
         "15": f"Year-to-date: Tax exempt {sheet}",
+        "16": "Date range: Display all totals",
         "x": f"Back to {sheet} menu"
     }
 
@@ -1055,12 +4855,10 @@ def totals_menu(sheet):
         totals_menu(sheet)
 
     if selection == "8":
-        display_wait_message("This will take a few minutes")
         print_all_monthly_totals_on_individual_lines(sheet)
         totals_menu(sheet)
 
     if selection == "9":
-        display_wait_message("This will take a few minutes")
         calculate_total_of_totals_year_to_date(sheet, run_directly=True)
         totals_menu(sheet)
 
@@ -1124,6 +4922,10 @@ def totals_menu(sheet):
         )
         totals_menu(sheet)
 
+    if selection == "16":
+        print_totals_for_date_range(sheet)
+        totals_menu(sheet)
+
     if selection == "x":
         sub_menu(sheet)
 
@@ -1143,6 +4945,12 @@ def sub_menu(sheet):
         "4": f"Create a {sheet} sheet for current month (if none yet exists)",
         "5": "Show details on local VAT rates",
         "6": "Display 'Totals' menu",
+        "7": f"Change year (currently {get_selected_year()})",
+        "8": f"Search {sheet}",
+        "9": "Edit a transaction",
+        "10": "Void a transaction",
+        "11": "Find duplicate transactions",
+        "12": "Close a month",
         "x": "Return to main menu"
     }
 
@@ -1166,22 +4974,395 @@ def sub_menu(sheet):
         sub_menu(sheet)
     if selection == "6":
         totals_menu(sheet)
+    if selection == "7":
+        select_ledger_year(sheet)
+        sub_menu(sheet)
+    if selection == "8":
+        search_transactions_menu(sheet)
+        sub_menu(sheet)
+    if selection == "9":
+        edit_transaction(sheet)
+    if selection == "10":
+        void_transaction(sheet)
+    if selection == "11":
+        find_duplicates_menu(sheet)
+        sub_menu(sheet)
+    if selection == "12":
+        close_month_menu(sheet)
+        sub_menu(sheet)
 
     if selection == "x":
         main_menu()
 
 
+def get_profile_stack(frame):
+    """Works out what the app is doing from a stack frame
+
+    Function to list the run.py functions on the stack, naming the
+    ledger for functions that take one, and put the time in one of
+    PROFILE_CATEGORIES: waiting for the user to type (input), a
+    deliberate sleep (delay), waiting on the API or working (cpu).
+
+    Returns: the stack in the collapsed format flame graphs use.
+    """
+
+    functions = []
+    category = "cpu"
+
+    # sleep, input and select are C functions, so the topmost Python
+    # frame is the line calling them
+    line = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+    if "sleep(" in line:
+        category = "delay"
+    if "input(" in line or "select(" in line:
+        category = "input"
+
+    while frame is not None:
+        code = frame.f_code
+        if API_FILE_PATTERN.search(code.co_filename):
+            category = "api"
+        elif frame.f_globals is globals() and code.co_name != "<module>":
+            if code.co_argcount and code.co_varnames[0] == "sheet":
+                functions.append(f"{code.co_name}({frame.f_locals['sheet']})")
+            else:
+                functions.append(code.co_name)
+        frame = frame.f_back
+
+    return ";".join(reversed(functions)) + f";[{category}]"
+
+
+def save_profile():
+    """Saves the session profile
+
+    Writes every stack sampled so far with the milliseconds spent in
+    it, one per line, which flamegraph.pl and speedscope can read.
+    """
+
+    profile_path = PROFILE_FILE.format(pid=os.getpid())
+    temporary_file = f"{profile_path}.tmp"
+    stacks = dict(PROFILE_STACKS)
+
+    with open(temporary_file, "w", encoding="utf-8") as profile_file:
+        for stack, seconds in sorted(stacks.items()):
+            profile_file.write(f"{stack} {round(seconds * 1000)}\n")
+
+    os.replace(temporary_file, profile_path)
+
+
+def sample_session(thread_id):
+    """Samples what the app is doing
+
+    Function to run in a background thread, looking at the main
+    thread's stack every PROFILE_INTERVAL seconds and adding the time
+    since the last look to its stack, so every second of the session
+    is accounted for.
+    """
+
+    last_sample = last_save = monotonic()
+
+    while True:
+        sleep(PROFILE_INTERVAL)
+        # pylint: disable-next=protected-access
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            return
+
+        stack = get_profile_stack(frame)
+        now = monotonic()
+        PROFILE_STACKS[stack] = PROFILE_STACKS.get(stack, 0) + \
+            now - last_sample
+        last_sample = now
+
+        if now - last_save >= PROFILE_SAVE_INTERVAL:
+            save_profile()
+            last_save = now
+
+
+def get_profile_action(functions):
+    """Names the menu action a profiled stack belongs to
+
+    Returns the innermost menu on the stack and the function it
+    called, e.g. "sub_menu(sales) > add_new_transaction", or just the
+    menu if it was waiting for a choice.
+    """
+
+    menus = [index for index, function in enumerate(functions)
+             if function.split("(")[0].endswith("menu")
+             and function != "print_selected_menu"]
+    menu_index = menus[-1] if menus else 0
+
+    if menu_index + 1 < len(functions) and \
+            functions[menu_index + 1] != "print_selected_menu":
+        return f"{functions[menu_index]} > {functions[menu_index + 1]}"
+
+    return functions[menu_index]
+
+
+def print_profile_report(profile_paths):
+    """Prints where the time in profiled sessions went
+
+    Function to add up saved profiles by menu action and category,
+    printing the seconds spent on each, most time consuming first.
+    """
+
+    actions = {}
+
+    for profile_path in profile_paths:
+        with open(profile_path, encoding="utf-8") as profile_file:
+            for line in profile_file:
+                stack, milliseconds = line.rsplit(" ", 1)
+                *functions, category = stack.split(";")
+                action = actions.setdefault(
+                    get_profile_action(functions),
+                    dict.fromkeys(PROFILE_CATEGORIES, 0))
+                action[category.strip("[]")] += int(milliseconds) / 1000
+
+    totals = {category: sum(action[category] for action in actions.values())
+              for category in PROFILE_CATEGORIES}
+    width = max([len(name) for name in actions] + [5])
+
+    print(f"{'action':<{width}} " +
+          " ".join(f"{category:>8}" for category in PROFILE_CATEGORIES) +
+          f" {'total':>8}")
+    for name, action in sorted(actions.items(),
+                               key=lambda item: -sum(item[1].values())):
+        print(f"{name:<{width}} " +
+              " ".join(f"{action[category]:>8.1f}"
+                       for category in PROFILE_CATEGORIES) +
+              f" {sum(action.values()):>8.1f}")
+
+    overall = sum(totals.values()) or 1
+    print(f"{'total':<{width}} " +
+          " ".join(f"{totals[category]:>8.1f}"
+                   for category in PROFILE_CATEGORIES) +
+          f" {sum(totals.values()):>8.1f}")
+    print(f"{'':<{width}} " +
+          " ".join(f"{totals[category] / overall:>8.0%}"
+                   for category in PROFILE_CATEGORIES))
+
+
+def run_command(args):
+    """Runs a command given on the command line
+
+    Function to run the app non-interactively, e.g.
+    `python3 run.py search "supplier x" --from 01/05/2024 --to 31/05/2024`
+    """
+
+    def date_argument(value):
+        return datetime.datetime.strptime(value, "%d/%m/%Y").date()
+
+    def year_argument(value):
+        if not re.fullmatch(r"\d{4}", value):
+            raise argparse.ArgumentTypeError(f"{value} isn't a yyyy year")
+        return value
+
+    def positive_argument(value):
+        if not value.isdigit() or int(value) < 1:
+            raise argparse.ArgumentTypeError(
+                f"{value} isn't a whole number above 0")
+        return int(value)
+
+    parser = argparse.ArgumentParser(prog="run.py")
+    parser.add_argument("--tenant", choices=list(load_tenants()),
+                        default=current_tenant,
+                        help="the business to use, see tenants.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser(
+        "search", help="search transactions by details, date and amount")
+    search_parser.add_argument("text", nargs="?", default="",
+                               help="words the details must contain")
+    search_parser.add_argument("--ledger", choices=list(LEDGER_NAMES),
+                               help="only search purchases or sales")
+    search_parser.add_argument("--from", dest="start_date",
+                               type=date_argument, help="dd/mm/yyyy")
+    search_parser.add_argument("--to", dest="end_date",
+                               type=date_argument, help="dd/mm/yyyy")
+    search_parser.add_argument("--invoice", help="invoice number")
+    search_parser.add_argument("--min-total", type=float)
+    search_parser.add_argument("--max-total", type=float)
+
+    provision_parser = commands.add_parser(
+        "provision", help="create every missing month of a year")
+    provision_parser.add_argument("--year", default=get_year(),
+                                  type=year_argument,
+                                  help="defaults to the current year")
+
+    recalculate_parser = commands.add_parser(
+        "recalculate-vat",
+        help="correct VAT to the rates in effect, see vat_rates.json")
+    recalculate_parser.add_argument("--year", default=get_year(),
+                                    type=year_argument,
+                                    help="defaults to the current year")
+    recalculate_parser.add_argument("--ledger", choices=list(LEDGER_NAMES),
+                                    help="only recalculate purchases or sales")
+    recalculate_parser.add_argument("--since", type=date_argument,
+                                    help="dd/mm/yyyy, only months from then")
+    recalculate_parser.add_argument("--dry-run", action="store_true",
+                                    help="count the corrections only")
+
+    duplicates_parser = commands.add_parser(
+        "find-duplicates",
+        help="list transactions with the same date, details, total and rate")
+    duplicates_parser.add_argument("--year", default=get_year(),
+                                   type=year_argument,
+                                   help="defaults to the current year")
+    duplicates_parser.add_argument("--ledger", choices=list(LEDGER_NAMES),
+                                   help="only check purchases or sales")
+
+    analyze_parser = commands.add_parser(
+        "analyze", help="compare years of ledgers archived as CSV files")
+    analyze_parser.add_argument("directory",
+                                help="holding '<ledger>_<year> - <month>.csv'"
+                                " files")
+    analyze_parser.add_argument("--workers", type=positive_argument,
+                                help="processes to use, one per CPU by "
+                                "default")
+
+    close_parser = commands.add_parser(
+        "close-month", help="archive a month once its VAT has been filed")
+    close_parser.add_argument("month", type=str.capitalize, choices=MONTHS)
+    close_parser.add_argument("--year", default=get_year(),
+                              type=year_argument,
+                              help="defaults to the current year")
+    close_parser.add_argument("--ledger", choices=list(LEDGER_NAMES),
+                              help="only close purchases or sales")
+
+    reports_parser = commands.add_parser(
+        "build-reports",
+        help="save the year's monthly and year-to-date totals reports")
+    reports_parser.add_argument("--year", default=get_year(),
+                                type=year_argument,
+                                help="defaults to the current year")
+    reports_parser.add_argument("--every", type=float,
+                                help="keep running, rebuilding the reports " +
+                                "every so many minutes if the ledgers change")
+
+    commands.add_parser(
+        "render-banners", help="re-render the welcome page's ASCII art")
+
+    profile_parser = commands.add_parser(
+        "profile-report", help="sum up profiles saved with VCA_PROFILE")
+    profile_parser.add_argument("profiles", nargs="+")
+
+    options = parser.parse_args(args)
+    use_tenant(options.tenant)
+
+    if options.command == "search":
+        started = monotonic()
+        results = search_transactions(
+            options.text, options.ledger, options.start_date,
+            options.end_date, options.invoice, options.min_total,
+            options.max_total)
+        elapsed = (monotonic() - started) * 1000
+
+        print_search_results(results)
+        print(f"\n{len(results)} transactions found in {elapsed:.0f}ms")
+
+    if options.command == "profile-report":
+        print_profile_report(options.profiles)
+
+    if options.command == "render-banners":
+        for text in WELCOME_BANNERS:
+            render_banner_art(text)
+        print(f"Banners saved to {BANNER_DIR}")
+
+    if options.command == "recalculate-vat":
+        print(f"VAT rates version {load_vat_rates()['version']}")
+        for sheet in [options.ledger] if options.ledger else LEDGER_NAMES:
+            try:
+                corrections = recalculate_vat(sheet, options.year,
+                                              options.since, options.dry_run)
+            except gspread.SpreadsheetNotFound as error:
+                sys.exit(str(error))
+            summary = ", ".join(f"{month} {count} rows"
+                                for month, count in corrections.items())
+            action = "to correct" if options.dry_run else "corrected"
+            print(f"{sheet.capitalize()} {options.year} {action}: " +
+                  f"{summary or 'nothing'}")
+
+    if options.command == "find-duplicates":
+        print_duplicate_transactions(find_duplicate_transactions(
+            [options.ledger] if options.ledger else list(LEDGER_NAMES),
+            options.year))
+
+    if options.command == "analyze":
+        started = monotonic()
+        analysis = analyze_archives(options.directory, options.workers)
+        elapsed = monotonic() - started
+
+        print_archive_analysis(analysis)
+        print(f"Analyzed in {elapsed:.1f}s")
+
+    if options.command == "close-month":
+        for sheet in [options.ledger] if options.ledger else LEDGER_NAMES:
+            try:
+                archive = close_month(sheet, options.year, options.month)
+            except (ValueError, gspread.SpreadsheetNotFound) as error:
+                sys.exit(str(error))
+            print(f"{sheet.capitalize()} {options.month} {options.year} " +
+                  f"closed, {len(archive['rows']) - 1} transactions archived")
+
+    if options.command == "build-reports":
+        while True:
+            report = build_report(options.year)
+            folder = get_cache_path(os.path.join(
+                REPORTS_DIR, report["year"], report["version"]))
+            print(f"{report['year']} report version {report['version']} " +
+                  f"built {report['built_at']}: " +
+                  ", ".join(os.path.join(folder, f"report.{extension}")
+                            for extension in REPORT_FORMATS))
+            if options.every is None:
+                break
+            sleep(options.every * 60)
+
+    if options.command == "provision":
+        try:
+            created = provision_whole_year(options.year)
+        except ValueError as error:
+            sys.exit(str(error))
+        for sheet, months in created.items():
+            print(f"{sheet.capitalize()} {options.year}: " +
+                  f"{', '.join(months) or 'nothing to create'}")
+
+
 def main():
     """main
 
     main function.
     """
 
+    try:
+        use_tenant(os.environ.get("VCA_TENANT", DEFAULT_TENANT))
+    except ValueError as error:
+        sys.exit(str(error))
+
+    if len(sys.argv) > 1:
+        run_command(sys.argv[1:])
+        return
+
+    if os.environ.get("VCA_BUFFERED_OUTPUT") == "1":
+        use_buffered_output()
+
+    threading.Thread(target=preload_libraries, daemon=True).start()
+    threading.Thread(target=refresh_report, daemon=True).start()
+    restored = SNAPSHOTS.get(current_tenant, {}).get("restored")
+    if restored:
+        threading.Thread(target=validate_snapshot, args=(restored,),
+                         daemon=True).start()
+    if PROFILE_FILE:
+        threading.Thread(target=sample_session,
+                         args=(threading.get_ident(),), daemon=True).start()
+
     try:
         display_welcome_page()
         main_menu()
     except RuntimeError:
         print("Something went wrong, try rebooting")
+    finally:
+        save_snapshot()
+        if PROFILE_FILE:
+            save_profile()
 
 
 if __name__ == "__main__":
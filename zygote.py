@@ -0,0 +1,283 @@
+"""
+Pre-forked workers for terminal sessions.
+
+Starting run.py for every browser session means importing gspread and
+google-auth and loading the credentials each time. In
+"serve" mode this module does that once, then keeps a small pool of
+forked workers waiting on a Unix socket. Each terminal session runs
+this module in "connect" mode, which only imports the standard library:
+it passes its terminal to a waiting worker and relays signals and the
+exit code, so a session's run.py is ready as soon as it connects.
+
+    python3 zygote.py serve /tmp/vca.sock --workers 2
+    python3 -S zygote.py connect /tmp/vca.sock
+
+If no worker pool is listening, connect mode falls back to running
+run.py directly.
+"""
+
+import os
+import sys
+import json
+import select
+import signal
+import socket
+
+# environment variables a session passes on to its worker
+SESSION_ENV = ["TERM", "COLUMNS", "LINES", "LANG", "VCA_TENANT",
+               "VCA_BUFFERED_OUTPUT"]
+# signals a session relays to its worker, the terminal sends them to the
+# session as it's the process in the foreground
+RELAYED_SIGNALS = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP,
+                   signal.SIGQUIT, signal.SIGWINCH]
+
+
+def get_exit_code(error):
+    """Converts a SystemExit into a process exit code
+
+    Returns: the exit code.
+    """
+
+    if error.code is None:
+        return 0
+    if isinstance(error.code, int):
+        return error.code
+
+    print(error.code, file=sys.stderr)
+    return 1
+
+
+def watch_session(conn):
+    """Exits a worker when its session goes away
+
+    Function to run in a thread, blocking until the session closes its
+    end of the connection, e.g. when the browser tab is closed and the
+    session is killed.
+    """
+
+    try:
+        while conn.recv(1024):
+            pass
+    except OSError:
+        pass
+
+    os._exit(1)
+
+
+def attach_terminal(fds):
+    """Makes a session's terminal the standard streams of a worker
+
+    Function to move the received file descriptors to stdin, stdout
+    and stderr and reopen the sys streams on them, line buffered as
+    they're a terminal, so colorama re-detects the terminal too.
+    """
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+    sys.stdout = open(1, "w", encoding="utf-8", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", encoding="utf-8", buffering=1, closefd=False)
+
+
+def run_worker(run, listener, taken_w):
+    """Waits for a session and runs the app for it
+
+    Function to run in a forked worker. Once a session connects the
+    zygote is told to fork a replacement, the session's terminal,
+    working directory and environment are taken on and run.py's main
+    function runs. The session is sent the worker's pid first and the
+    exit code last.
+    """
+
+    # pylint: disable-next=import-outside-toplevel
+    import threading
+
+    conn, _ = listener.accept()
+    listener.close()
+    os.write(taken_w, f"{os.getpid()}\n".encode())
+    os.close(taken_w)
+
+    message, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+    session = json.loads(message)
+
+    attach_terminal(fds)
+    os.chdir(session["cwd"])
+    os.environ.update(session["env"])
+    run.init(autoreset=True)
+
+    conn.sendall(json.dumps({"pid": os.getpid()}).encode() + b"\n")
+    threading.Thread(target=watch_session, args=(conn,), daemon=True).start()
+
+    exit_code = 0
+    sys.argv = ["run.py"] + session["args"]
+
+    try:
+        run.main()
+    except SystemExit as e:
+        exit_code = get_exit_code(e)
+    except BaseException:  # pylint: disable=broad-exception-caught
+        sys.excepthook(*sys.exc_info())
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    try:
+        conn.sendall(json.dumps({"exit": exit_code}).encode() + b"\n")
+    finally:
+        os._exit(exit_code)
+
+
+def serve(socket_path, workers):
+    """Runs the zygote
+
+    Function to import run.py, the libraries it loads on first use and
+    the credentials once, then keep the given number of forked workers
+    waiting for sessions on a Unix socket, forking a replacement as
+    each one is taken or dies. The zygote exits when its stdin is
+    closed, i.e. when the Node server that started it goes away.
+    """
+
+    # pylint: disable-next=import-outside-toplevel
+    import gc
+    # pylint: disable-next=import-outside-toplevel
+    import run
+    # connects without making any requests, so no connection is shared
+    run.get_gspread_client()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    taken_r, taken_w = os.pipe()
+
+    # keep everything imported so far out of the collector so forked
+    # workers don't touch, and so copy, the pages holding it
+    gc.collect()
+    gc.freeze()
+
+    idle_workers = set()
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            # never return into the zygote's loop, even on an error
+            try:
+                os.close(taken_r)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                run_worker(run, listener, taken_w)
+            finally:
+                os._exit(1)
+        idle_workers.add(pid)
+
+    def stop(signum, frame):
+        # pylint: disable=unused-argument
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        fork_worker()
+
+    print(f"zygote: {workers} workers waiting on {socket_path}",
+          file=sys.stderr)
+
+    try:
+        while True:
+            readable, _, _ = select.select([taken_r, sys.stdin], [], [], 1)
+
+            if sys.stdin in readable and not os.read(sys.stdin.fileno(),
+                                                     1024):
+                break
+
+            if taken_r in readable:
+                for pid in os.read(taken_r, 4096).decode().split():
+                    idle_workers.discard(int(pid))
+                    fork_worker()
+
+            # reap finished sessions and replace workers that died idle
+            while True:
+                try:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                if pid in idle_workers:
+                    idle_workers.discard(pid)
+                    fork_worker()
+    finally:
+        for pid in idle_workers:
+            os.kill(pid, signal.SIGTERM)
+        listener.close()
+        os.unlink(socket_path)
+
+
+def run_directly(args):
+    """Runs run.py in this process instead of a worker"""
+
+    os.execv(sys.executable, [sys.executable, "run.py"] + args)
+
+
+def connect(socket_path, args):
+    """Hands this session's terminal to a waiting worker
+
+    Function to pass stdin, stdout and stderr to a worker along with
+    the working directory, terminal settings and arguments, relay
+    signals to the worker and exit with its exit code.
+    """
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        run_directly(args)
+
+    session = {
+        "cwd": os.getcwd(),
+        "env": {name: os.environ[name] for name in SESSION_ENV
+                if name in os.environ},
+        "args": args
+    }
+    socket.send_fds(conn, [json.dumps(session).encode()], [0, 1, 2])
+
+    replies = conn.makefile("r", encoding="utf-8")
+    line = replies.readline()
+    if not line:
+        run_directly(args)
+    worker_pid = json.loads(line)["pid"]
+
+    for signum in RELAYED_SIGNALS:
+        signal.signal(signum,
+                      lambda signum, frame: os.kill(worker_pid, signum))
+
+    line = replies.readline()
+    sys.exit(json.loads(line)["exit"] if line else 1)
+
+
+def main():
+    """main
+
+    Runs the zygote or connects a session to it depending on the mode
+    given on the command line.
+    """
+
+    if len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        workers = 2
+        if "--workers" in sys.argv:
+            workers = int(sys.argv[sys.argv.index("--workers") + 1])
+        serve(sys.argv[2], workers)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "connect":
+        connect(sys.argv[2], sys.argv[3:])
+    else:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()